@@ -1,7 +1,5 @@
 import streamlit as st
 import streamlit.components.v1 as components
-from google.generativeai.generative_models import GenerativeModel
-from google.generativeai.client import configure
 import os
 import PyPDF2
 import io
@@ -20,56 +18,182 @@ import re  # Add regex support for parsing options
 import time  # Import for timer functionality
 import random  # Add random module for generating focus tips
 import shutil
-import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from Crypto.Cipher import AES  # Import PyCryptodome for PDF decryption
+from disk_cache import DiskCache
+from document import Document
+from pdf_extraction import (
+    EXTRACTOR_VERSION, WRONG_PASSWORD_MESSAGE, extract_all_pages, extract_pdf, iter_page_texts, open_spooled_pdf,
+    prestart_process_pool, read_pdf_structure
+)
+from ocr import is_ocr_available
+from upload_jobs import UploadJob
+from question_papers import PaperCorpus, PaperManifest, apply_renames, plan_renames
+from question_store import QuestionStore
+from paper_search import PaperSearchIndex
+from exam_coverage import CoverageMatrix, split_sections
+from exam_trends import ExamTrends
+from exemplars import EXEMPLAR_TOKEN_BUDGET, format_exemplars, select_exemplars, split_exemplar_text
+from response_cache import CachedModel, ResponseCache
+from llm_gateway import LLMGateway
+from chunked_generation import (
+    GenerationError, NearDuplicateFilter, allocate, generate_all, remove_near_duplicates, split_chunks, stream_all
+)
 
 # Load environment variables
 load_dotenv()
+# Gemini model answering every generator
+GEMINI_MODEL_NAME = "gemini-2.5-pro-preview-03-25"
+
+@st.cache_resource
+def get_llm_gateway(api_key):
+    """Return the process-wide gateway that makes every Gemini call."""
+    return LLMGateway(api_key, GEMINI_MODEL_NAME)
+
 # Gemini API Call
-def setup_google_api():
+def get_gemini_model():
+    """Return the shared Gemini model behind the response cache, or None without an API key."""
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     if not GEMINI_API_KEY:
         st.error("Google API key not found. Please set it as an environment variable.")
         return None
-    configure(api_key=GEMINI_API_KEY)
-    return GenerativeModel("gemini-2.5-pro-preview-03-25")
-# Extract text from PDF
-def check_pdf_encryption(reader):
-    """Check if PDF is encrypted and handle encryption-related errors.
+    # Repeated requests on unchanged input are answered from the shared response cache
+    return CachedModel(
+        get_llm_gateway(GEMINI_API_KEY),
+        get_response_cache(),
+        bypass=st.session_state.get("regenerate_responses", False)
+    )
+# Extracted PDF text cache
+PDF_TEXT_CACHE_MAX_BYTES = int(os.getenv("PDF_TEXT_CACHE_MAX_MB", "512")) * 1024 * 1024
+# How much of a document to preview while the rest is still extracting
+PREVIEW_PAGES = 3
+PREVIEW_CHARS = 3000
+# Uploads extracted at the same time in the background, and how often their progress refreshes
+UPLOAD_WORKERS = int(os.getenv("PDF_UPLOAD_WORKERS", "4"))
+UPLOAD_POLL_SECONDS = 0.5
+# Past-paper questions shown per search
+PAPER_SEARCH_RESULTS = 10
+# Rooms of a Mind Palace built from a document too long for one prompt
+MIND_PALACE_ROOMS = 5
+# Exam-trend topics listed in the trends table, and passed to the generator when focusing on them
+TREND_TOPICS_SHOWN = 20
+FOCUS_TOPICS = 8
+
+@st.cache_resource
+def get_response_cache():
+    """Return the process-wide on-disk cache of Gemini responses."""
+    return ResponseCache()
+
+@st.cache_resource
+def get_pdf_text_cache():
+    """Return the process-wide on-disk cache of extracted PDF text."""
+    return DiskCache("pdf_text", PDF_TEXT_CACHE_MAX_BYTES)
+
+def get_pdf_cache_key(pdf_file, password=None):
+    """Build a content-addressed cache key for an uploaded PDF.
     
     Args:
-        reader: PyPDF2 PdfReader object
+        pdf_file: The uploaded PDF file object
+        password: Optional password used to decrypt the PDF
         
     Returns:
-        str: Error message if encrypted, None if not encrypted
+        str: SHA-256 of the PDF bytes combined with the extractor version
     """
-    if reader.is_encrypted:
-        return "The PDF file is encrypted and cannot be processed. Please upload an unencrypted PDF."
+    position = pdf_file.tell()
+    pdf_file.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: pdf_file.read(1024 * 1024), b""):
+        digest.update(chunk)
+    pdf_file.seek(position)
     
-    # Check first page for potential encryption issues
-    try:
-        if len(reader.pages) > 0:
-            first_page_text = reader.pages[0].extract_text()
-            if first_page_text is None:
-                return "The PDF file appears to be encrypted or has restricted permissions. Please upload an unencrypted PDF."
-    except Exception as e:
-        if any(keyword in str(e).lower() for keyword in ["decrypt", "password", "encrypt"]):
-            return "The PDF file is encrypted and cannot be processed. Please upload an unencrypted PDF."
+    cache_key = f"{digest.hexdigest()}:{EXTRACTOR_VERSION}"
+    # Text unlocked with a password must never be served to uploads without it
+    if password:
+        cache_key += ":" + hashlib.sha256(password.encode("utf-8")).hexdigest()
+    return cache_key
+
+def get_cached_document(cache_key, name=None):
+    """Return the cached pages of a PDF as a Document, or None on a cache miss."""
+    cached = get_pdf_text_cache().get(cache_key)
+    if cached and cached.get("pages"):
+        return Document(name, cached["pages"], cached.get("image_pages", []))
     return None
 
-def extract_page_text(page):
-    """Extract text from a single PDF page with error handling.
+def cache_document_pages(cache_key, pages, image_pages=()):
+    """Store the (page_number, text) pairs extracted from a PDF and its image-only pages in the cache."""
+    get_pdf_text_cache().set(cache_key, {
+        "pages": [[page_number, page_text] for page_number, page_text in pages],
+        "image_pages": list(image_pages)
+    })
+
+def format_page_numbers(page_numbers):
+    """Format page numbers compactly, e.g. [1, 2, 3, 7] -> "1-3, 7"."""
+    ranges = []
+    for page_number in sorted(page_numbers):
+        if ranges and page_number == ranges[-1][1] + 1:
+            ranges[-1][1] = page_number
+        else:
+            ranges.append([page_number, page_number])
+    return ", ".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+def parse_page_numbers(text, page_count):
+    """
+    Parse page ranges typed by the user, e.g. "1-5, 9".
     
     Args:
-        page: PyPDF2 page object
+        text: Comma-separated page numbers and ranges
+        page_count: Number of pages in the document; pages beyond it are dropped
         
     Returns:
-        str: Extracted text or empty string if extraction fails
+        set: Page numbers, or None if the text could not be parsed
     """
-    try:
-        return page.extract_text() or ""
-    except Exception:
-        return ""
+    page_numbers = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r"(\d+)\s*(?:-\s*(\d+))?", part)
+        if not match:
+            return None
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        page_numbers.update(range(max(first, 1), min(last, page_count) + 1))
+    return page_numbers
+
+def load_document(file_name, pdf_file, content, password=None):
+    """
+    Build the page-aware Document for an uploaded file after extraction.
+    
+    Every extractor caches the pages it extracted, so they are read back from
+    the cache; text without page information becomes a single-page document.
+    
+    Args:
+        file_name: Name of the uploaded file
+        pdf_file: The uploaded PDF file object
+        content: Text returned by the extractor
+        password: Password the extractor was given, if any
+        
+    Returns:
+        Document: The extracted document
+    """
+    document = get_cached_document(get_pdf_cache_key(pdf_file, password), file_name)
+    if document is None or document.text.strip() != content.strip():
+        document = Document.from_text(file_name, content)
+    return document
+# Extract text from PDF
+def check_pdf_encryption(reader):
+    """Check if PDF is encrypted and handle encryption-related errors.
+    
+    Args:
+        reader: PyPDF2 PdfReader object
+        
+    Returns:
+        str: Error message if encrypted, None if not encrypted
+    """
+    if reader.is_encrypted:
+        return "The PDF file is encrypted and cannot be processed. Please upload an unencrypted PDF."
+    return None
 
 def show_extraction_progress(current, total):
     """Display progress bar and status text for PDF extraction.
@@ -93,46 +217,132 @@ def extract_text_from_pdf(pdf_file):
         str: Extracted text from the PDF or error message
     """
     try:
+        # Return cached text if this exact PDF was extracted before
+        cache_key = get_pdf_cache_key(pdf_file)
+        cached_document = get_cached_document(cache_key)
+        if cached_document:
+            return cached_document.text
+        
         # Initialize progress indicators in session state
         if "pdf_progress_bar" not in st.session_state:
             st.session_state.pdf_progress_bar = st.progress(0)
             st.session_state.pdf_status_text = st.empty()
         
-        pdf_bytes = io.BytesIO(pdf_file.getvalue())
-        reader = PyPDF2.PdfReader(pdf_bytes)
-        
-        # Check for encryption
-        encryption_error = check_pdf_encryption(reader)
-        if encryption_error:
-            return encryption_error
-        
-        # Extract text from each page
-        text_parts = []
-        for i, page in enumerate(reader.pages, 1):
-            page_text = extract_page_text(page)
-            if page_text:
-                text_parts.append(page_text)
-            show_extraction_progress(i, len(reader.pages))
+        # Spool the upload to disk once and parse it through a memory map
+        with open_spooled_pdf(pdf_file) as (pdf_stream, pdf_path):
+            reader = PyPDF2.PdfReader(pdf_stream)
+            
+            # Check for encryption
+            encryption_error = check_pdf_encryption(reader)
+            if encryption_error:
+                return encryption_error
+            
+            # Extract text from each page
+            page_texts = extract_all_pages(
+                reader, pdf_stream, show_extraction_progress,
+                parallel=st.session_state.get("parallel_extraction", True),
+                pdf_path=pdf_path
+            )
+        pages = [(page_number, page_text) for page_number, page_text in enumerate(page_texts, 1) if page_text]
         
         # Clean up progress indicators
         st.session_state.pdf_progress_bar.empty()
         st.session_state.pdf_status_text.empty()
         
         # Combine and clean extracted text
-        text = "\n\n".join(text_parts).strip()
+        text = Document(pdf_file.name, pages).text.strip()
         if not text:
             st.error(f"No text could be extracted from {pdf_file.name}. The PDF might be scanned or contain only images.")
             return ""
         
+        cache_document_pages(cache_key, pages)
         return text
     except Exception as e:
         st.error(f"Error processing PDF: {str(e)}")
         return ""
 
+def get_engine_cached_document(cache_key, name=None):
+    """Return the engine's cached Document, unless OCR could now read pages it skipped."""
+    cached_document = get_cached_document(cache_key, name)
+    if cached_document and cached_document.image_pages:
+        if st.session_state.get("ocr_scanned_pages", True) and is_ocr_available():
+            return None
+    return cached_document
+
+def run_extraction_engine(pdf_file, password=None):
+    """
+    Extract text with the single-parse engine, serving repeat uploads from the cache.
+    
+    Args:
+        pdf_file: The uploaded PDF file object
+        password: Optional password to try unlocking the PDF
+        
+    Returns:
+        dict: Engine result with "text", "pages", "strategy", "page_count",
+        "ocr_pages", "image_pages" and "error"
+    """
+    cache_key = get_pdf_cache_key(pdf_file, password)
+    cached_document = get_engine_cached_document(cache_key)
+    if cached_document:
+        return {
+            "text": cached_document.text,
+            "pages": [(page.number, page.text) for page in cached_document.pages()],
+            "strategy": "cache",
+            "page_count": None,
+            "ocr_pages": [],
+            "image_pages": list(cached_document.image_pages),
+            "blank_pages": [],
+            "error": None
+        }
+    
+    # Create progress indicators
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    
+    preview = st.empty()
+    preview_pages = {}
+    
+    def update_progress(current, total):
+        progress_bar.progress(current / total)
+        status_text.text(f"Extracting page {current}/{total}")
+    
+    def update_ocr_progress(current, total):
+        progress_bar.progress(current / total)
+        status_text.text(f"Running OCR on scanned page {current}/{total}")
+    
+    def show_page_preview(page_number, page_text):
+        # Show the opening pages as soon as they stream in
+        if page_number > PREVIEW_PAGES or not page_text.strip():
+            return
+        preview_pages[page_number] = page_text
+        preview_text = "\n\n".join(preview_pages[n] for n in sorted(preview_pages))
+        with preview.container():
+            st.caption(f"Preview of {getattr(pdf_file, 'name', 'document')} while the remaining pages extract:")
+            st.text(preview_text[:PREVIEW_CHARS])
+    
+    result = extract_pdf(
+        pdf_file,
+        password=password,
+        progress_callback=update_progress,
+        parallel=st.session_state.get("parallel_extraction", True),
+        page_callback=show_page_preview,
+        ocr=st.session_state.get("ocr_scanned_pages", True),
+        ocr_progress_callback=update_ocr_progress
+    )
+    
+    # Clear progress indicators
+    progress_bar.empty()
+    status_text.empty()
+    preview.empty()
+    
+    if not result["error"]:
+        cache_document_pages(cache_key, result["pages"], result["image_pages"])
+    return result
+
 def extract_text_from_pdf_robust(pdf_file):
     """
-    A more robust version of extract_text_from_pdf that tries multiple methods.
-    This is especially useful for cloud environments where different methods might work.
+    A more robust version of extract_text_from_pdf that falls back between extraction strategies.
+    The PDF is parsed only once; see pdf_extraction.extract_pdf.
     
     Args:
         pdf_file: The uploaded PDF file object
@@ -140,92 +350,15 @@ def extract_text_from_pdf_robust(pdf_file):
     Returns:
         str: Extracted text from the PDF or error message
     """
-    # Store original file position
-    original_position = pdf_file.tell()
-    
-    # Initialize progress indicators in session state
-    if "pdf_progress_bar" not in st.session_state:
-        st.session_state.pdf_progress_bar = st.progress(0)
-        st.session_state.pdf_status_text = st.empty()
-    
-    # Method 1: Direct BytesIO approach
-    method1_result = try_bytesio_method(pdf_file)
-    if method1_result and len(method1_result.strip()) > 100:
-        return method1_result
-    
-    # Method 2: Temporary file approach
-    method2_result = try_tempfile_method(pdf_file)
-    if method2_result and len(method2_result.strip()) > 100:
-        return method2_result
-    
-    # If both methods failed, try the original method
-    pdf_file.seek(original_position)
-    result = extract_text_from_pdf(pdf_file)
-    
-    if result and len(result.strip()) > 100:
-        return result
+    result = run_extraction_engine(pdf_file)
+    if result["error"] and "encrypt" in result["error"].lower():
+        return result["error"]
+    
+    if result["text"] and len(result["text"].strip()) > 100:
+        return result["text"]
     else:
         return "Could not extract sufficient text from this PDF. It may be encrypted, scanned, or contain only images."
 
-def try_bytesio_method(pdf_file):
-    """Try extracting text using BytesIO method."""
-    try:
-        st.session_state.pdf_status_text.text("Extracting text (Method 1)...")
-        pdf_file.seek(0)
-        pdf_bytes = io.BytesIO(pdf_file.read())
-        
-        reader = PyPDF2.PdfReader(pdf_bytes)
-        encryption_error = check_pdf_encryption(reader)
-        if encryption_error:
-            return encryption_error
-        
-        text_parts = []
-        for i, page in enumerate(reader.pages, 1):
-            page_text = extract_page_text(page)
-            if page_text and page_text.strip():
-                text_parts.append(page_text)
-            show_extraction_progress(i, len(reader.pages))
-        
-        return "\n\n".join(text_parts).strip()
-    except Exception as e:
-        print(f"BytesIO method failed: {str(e)}")
-        return None
-
-def try_tempfile_method(pdf_file):
-    """Try extracting text using temporary file method."""
-    temp_file_path = None
-    try:
-        st.session_state.pdf_status_text.text("Extracting text (Method 2)...")
-        pdf_file.seek(0)
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(pdf_file.read())
-            temp_file_path = temp_file.name
-        
-        text_parts = []
-        with open(temp_file_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            encryption_error = check_pdf_encryption(reader)
-            if encryption_error:
-                return encryption_error
-            
-            for i, page in enumerate(reader.pages, 1):
-                page_text = extract_page_text(page)
-                if page_text and page_text.strip():
-                    text_parts.append(page_text)
-                show_extraction_progress(i, len(reader.pages))
-        
-        return "\n\n".join(text_parts).strip()
-    except Exception as e:
-        print(f"Tempfile method failed: {str(e)}")
-        return None
-    finally:
-        if temp_file_path:
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
-
 def extract_text_from_pdf_with_crypto(pdf_file, password=None):
     """
     Extract text from a PDF file with PyCryptodome support for encrypted PDFs.
@@ -237,111 +370,324 @@ def extract_text_from_pdf_with_crypto(pdf_file, password=None):
     Returns:
         str: Extracted text from the PDF or error message
     """
-    # Create progress indicators
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    result = run_extraction_engine(pdf_file, password)
+    return result["error"] or result["text"]
+def show_engine_notices(file_name, result):
+    """Show how the engine extracted a file and which scanned pages it could not read."""
+    st.caption(f"Extraction strategy for {file_name}: {result['strategy']}")
+    if result["ocr_pages"]:
+        st.info(f"Read {len(result['ocr_pages'])} scanned page(s) of {file_name} with OCR: pages {format_page_numbers(result['ocr_pages'])}")
+    if result["image_pages"]:
+        st.warning(
+            f"{len(result['image_pages'])} page(s) of {file_name} are scanned images with no text layer "
+            f"and were skipped: pages {format_page_numbers(result['image_pages'])}. "
+            "Install Tesseract and pytesseract to read these pages with OCR."
+        )
+
+def report_extraction_error(file_name, content):
+    """
+    Show an error if an extractor returned an error message instead of text.
     
-    try:
-        # Reset file pointer
-        pdf_file.seek(0)
+    Args:
+        file_name: Name of the uploaded file
+        content: Text or error message returned by the extractor
         
-        # Create BytesIO object
-        pdf_bytes = io.BytesIO(pdf_file.getvalue())
+    Returns:
+        bool: True if content was an error message
+    """
+    if content and "encrypted" in content.lower():
+        st.error(f"""
+        📔 **Encrypted PDF Detected:** {file_name}
         
-        # Create PDF reader
-        reader = PyPDF2.PdfReader(pdf_bytes)
+        This PDF is password-protected or encrypted and cannot be processed.
         
-        # Check if PDF is encrypted
-        if reader.is_encrypted:
-            if not password:
-                # Try with empty password
-                try:
-                    reader.decrypt('')
-                except:
-                    # If decryption fails, return error
-                    progress_bar.empty()
-                    status_text.empty()
-                    return "The PDF file is encrypted and requires a password. Please upload an unencrypted version."
-            else:
-                # Try with provided password
-                try:
-                    reader.decrypt(password)
-                except:
-                    progress_bar.empty()
-                    status_text.empty()
-                    return "The provided password could not decrypt the PDF. Please try with the correct password."
+        **To fix this issue:**
+        1. Open the PDF in a PDF reader (like Adobe Acrobat)
+        2. Enter the password if prompted
+        3. Save a new copy without password protection
+           - In Adobe Acrobat: File → Save As → Reduce Size PDF
+           - In other PDF readers: Look for "Save without encryption" or similar option
+        4. Upload the new unencrypted version
+        """)
+        return True
+    if content and (content == WRONG_PASSWORD_MESSAGE or content.startswith("Error")
+                    or content.startswith("Failed") or content.startswith("Could not")):
+        st.error(f"Error processing {file_name}: {content}")
+        return True
+    return False
+
+def add_uploaded_document(document):
+    """Add an extracted document to the uploaded files, replacing a partial copy if there is one."""
+    file_name = document.name
+    st.session_state.file_contents[file_name] = document
+    if file_name not in st.session_state.uploaded_files:
+        st.session_state.uploaded_files.append(file_name)
+    st.success(f"Successfully processed {file_name}")
+    
+    # Check if content is very short (likely extraction problem)
+    content = document.text
+    if len(content.strip()) < 100:
+        st.warning(f"""
+        ⚠️ **Limited Content Detected**
         
-        # Extract text from each page
-        text_parts = []
-        total_pages = len(reader.pages)
+        Only {len(content.strip())} characters were extracted from {file_name}, which is unusually small.
         
-        for i, page in enumerate(reader.pages):
-            try:
-                page_text = page.extract_text()
-                if page_text and page_text.strip():
-                    text_parts.append(page_text)
-            except Exception as e:
-                # Skip problematic pages
-                print(f"Error extracting page {i+1}: {str(e)}")
-                continue
-            
-            # Update progress
-            progress = (i + 1) / total_pages
-            progress_bar.progress(progress)
-            status_text.text(f"Extracting page {i+1}/{total_pages}")
+        This may indicate:
+        - The PDF contains mostly images or scanned content
+        - The PDF has restricted permissions
+        - The text extraction was incomplete
         
-        # Clear progress indicators
-        progress_bar.empty()
-        status_text.empty()
+        Consider using a different PDF with more extractable text.
+        """)
+
+@st.cache_resource
+def get_upload_executor():
+    """Return the process-wide thread pool that extracts uploads in the background."""
+    return ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="pdf-upload")
+
+@st.cache_resource
+def start_extraction_workers():
+    """Start the worker processes for parallel extraction once per server process, before any upload needs them."""
+    prestart_process_pool()
+    return True
+
+def submit_upload(pdf_file, password=None):
+    """
+    Start extracting an uploaded PDF in the background, or add it straight away if it is cached.
+    
+    Args:
+        pdf_file: The uploaded PDF file object
+        password: Optional password to try unlocking the PDF
+    """
+    cache_key = get_pdf_cache_key(pdf_file, password)
+    cached_document = get_engine_cached_document(cache_key, pdf_file.name)
+    if cached_document:
+        st.caption(f"Extraction strategy for {pdf_file.name}: cache")
+        add_uploaded_document(cached_document)
+        return
+    
+    job = UploadJob(
+        pdf_file.name,
+        pdf_file,
+        cache_key,
+        password=password,
+        parallel=st.session_state.get("parallel_extraction", True),
+        ocr=st.session_state.get("ocr_scanned_pages", True)
+    )
+    st.session_state.upload_jobs[pdf_file.name] = job.start(get_upload_executor())
+
+def show_upload_jobs():
+    """Show the progress of background uploads and add the finished ones to the uploaded files.
+    
+    The panel refreshes itself as a fragment while any job is still
+    running, and stops refreshing once none is, or once it is no longer drawn.
+    """
+    jobs = st.session_state.upload_jobs
+    if not jobs:
+        return
+    pending = any(not job.done for job in jobs.values())
+    st.fragment(run_every=UPLOAD_POLL_SECONDS if pending else None)(draw_upload_jobs)(pending)
+
+def draw_upload_jobs(polling):
+    """
+    Draw the background uploads panel, rerunning the app once a job has finished.
+    
+    Args:
+        polling: Whether the panel was drawn to refresh itself while jobs run
+    """
+    jobs = st.session_state.upload_jobs
+    st.markdown("### Processing Files")
+    finished = False
+    for file_name, job in list(jobs.items()):
+        if job.done and not job.result["error"]:
+            result = job.result
+            if job.cache_key:
+                cache_document_pages(job.cache_key, result["pages"], result["image_pages"])
+            show_engine_notices(file_name, result)
+            document = Document(file_name, result["pages"], result["image_pages"], result["unextracted_pages"])
+            # Pages extracted on demand are added to the pages the document already has
+            if job.page_numbers is not None and file_name in st.session_state.file_contents:
+                document = st.session_state.file_contents[file_name].merge(document)
+            add_uploaded_document(document)
+            del jobs[file_name]
+            finished = True
+            continue
         
-        # Check if we got any text
-        if text_parts:
-            combined_text = "\n\n".join(text_parts)
-            return combined_text
-        else:
-            return "Could not extract text from the PDF. The document might be scanned or contain only images."
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            if job.done:
+                # Every failed job shows its error, whatever the wording
+                if not report_extraction_error(file_name, job.result["error"]):
+                    st.error(f"Error processing {file_name}: {job.result['error']}")
+            else:
+                st.progress(job.progress, text=f"{file_name}: {job.status}")
+        with col2:
+            if job.done:
+                # Failed uploads are kept so they are not retried on every rerun
+                if st.button("Dismiss", key=f"dismiss_{file_name}"):
+                    del jobs[file_name]
+                    st.session_state.dismissed_uploads.add(file_name)
+                    st.rerun()
+            elif job.pages_extracted and file_name not in st.session_state.uploaded_files:
+                # Let the student start on the pages that are already extracted
+                if st.button("Study pages so far", key=f"partial_{file_name}"):
+                    document = job.partial_document()
+                    st.session_state.file_contents[file_name] = document
+                    st.session_state.uploaded_files.append(file_name)
+                    st.session_state.active_file = file_name
+                    st.session_state.summary = document.text
+                    st.rerun()
     
-    except Exception as e:
-        # Clear progress indicators
-        progress_bar.empty()
-        status_text.empty()
+    # The uploaded files list and the polling interval are drawn by the full app
+    if finished or (polling and all(job.done for job in jobs.values())):
+        st.rerun()
+
+def prepare_page_selection(pdf_file, password=None):
+    """
+    Read the outline and page labels of an upload so the student can pick pages before extraction.
+    
+    Args:
+        pdf_file: The uploaded PDF file object
+        password: Optional password to try unlocking the PDF
+    """
+    structure = read_pdf_structure(pdf_file, password)
+    if structure["error"]:
+        if not report_extraction_error(pdf_file.name, structure["error"]):
+            st.error(f"Error processing {pdf_file.name}: {structure['error']}")
+        return
+    # The upload itself is kept, not a copy of its bytes
+    structure["source"] = pdf_file
+    structure["password"] = password
+    st.session_state.page_selections[pdf_file.name] = structure
+
+def format_chapter(chapter, page_labels=None):
+    """Format an outline chapter for the page selector."""
+    title, first_page, last_page = chapter
+    pages = f"pages {first_page}-{last_page}"
+    if page_labels:
+        pages += f", printed {page_labels[first_page - 1]}-{page_labels[last_page - 1]}"
+    return f"{title} ({pages})"
+
+def submit_page_selection(file_name, page_numbers=None):
+    """
+    Start extracting the chosen pages of a document, keeping its source for later requests.
+    
+    Args:
+        file_name: Name of the uploaded file
+        page_numbers: Page numbers to extract, or None for the whole document
+    """
+    selection = st.session_state.page_selections.pop(file_name)
+    # The whole document goes through the cache like any other upload
+    cache_key = None
+    if page_numbers is None:
+        cache_key = get_pdf_cache_key(selection["source"], selection["password"])
+    job = UploadJob(
+        file_name,
+        selection["source"],
+        cache_key,
+        password=selection["password"],
+        parallel=st.session_state.get("parallel_extraction", True),
+        ocr=st.session_state.get("ocr_scanned_pages", True),
+        page_numbers=sorted(page_numbers) if page_numbers is not None else None
+    )
+    st.session_state.upload_jobs[file_name] = job.start(get_upload_executor())
+    if page_numbers is not None:
+        st.session_state.pdf_sources[file_name] = selection
+
+def show_page_selections():
+    """Let the student pick the chapters or pages to extract from documents awaiting selection."""
+    for file_name, selection in list(st.session_state.page_selections.items()):
+        with st.expander(f"Choose pages to extract from {file_name}", expanded=True):
+            document = st.session_state.file_contents.get(file_name)
+            if document:
+                st.caption(f"Pages not extracted yet: {format_page_numbers(document.unextracted_pages)}")
+            else:
+                st.caption(f"{selection['page_count']} pages")
+            
+            chapters = selection["chapters"]
+            chosen_chapters = []
+            if chapters:
+                chosen_chapters = st.multiselect(
+                    "Chapters:",
+                    options=range(len(chapters)),
+                    format_func=lambda i: format_chapter(chapters[i], selection["page_labels"]),
+                    key=f"chapters_{file_name}"
+                )
+            page_text = st.text_input(
+                "Pages (e.g. 1-5, 12):",
+                key=f"pages_{file_name}",
+                help="Page numbers count from the first page of the file, whatever is printed on the page"
+            )
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                if st.button("Extract selected pages", key=f"extract_selected_{file_name}"):
+                    page_numbers = parse_page_numbers(page_text, selection["page_count"])
+                    if page_numbers is None:
+                        st.error("Enter pages as numbers and ranges separated by commas, e.g. 1-5, 12")
+                    else:
+                        for i in chosen_chapters:
+                            _, first_page, last_page = chapters[i]
+                            page_numbers.update(range(first_page, last_page + 1))
+                        if page_numbers:
+                            submit_page_selection(file_name, page_numbers)
+                            st.rerun()
+                        else:
+                            st.warning("Select at least one chapter or page.")
+            with col2:
+                if not document and st.button("Extract all pages", key=f"extract_all_{file_name}"):
+                    submit_page_selection(file_name)
+                    st.rerun()
+            with col3:
+                if st.button("Cancel", key=f"cancel_selection_{file_name}"):
+                    del st.session_state.page_selections[file_name]
+                    if document:
+                        st.session_state.pdf_sources[file_name] = selection
+                    st.rerun()
+
+def get_study_text(file_name):
+    """
+    Return the text of the pages selected for study in an uploaded document.
+    
+    Args:
+        file_name: Name of the uploaded file
         
-        # Check for common errors
-        error_msg = str(e).lower()
-        if "not decrypt" in error_msg or "password" in error_msg or "encrypt" in error_msg:
-            return "The PDF file is encrypted and cannot be processed. Please upload an unencrypted PDF."
-        else:
-            return f"Error processing PDF: {str(e)}. Please try a different file."
+    Returns:
+        str: Text of the selected page range, or the whole document if none is selected
+    """
+    document = st.session_state.file_contents[file_name]
+    page_range = st.session_state.get("page_ranges", {}).get(file_name)
+    if page_range:
+        document = document.slice_pages(*page_range)
+    return document.text
 # Extract model questions from PDF
 def extract_model_questions(pdf_file):
     """Extract model questions from a PDF file to use as examples for AI."""
     try:
-        # Create a BytesIO object to handle the file buffer
-        pdf_bytes = io.BytesIO(pdf_file.read())
-        
-        reader = PyPDF2.PdfReader(pdf_bytes)
-        total_pages = len(reader.pages)
-        
-        # Add progress bar for large documents
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        text_parts = []
-        for i, page in enumerate(reader.pages):
-            page_text = page.extract_text()
-            if page_text:
-                text_parts.append(page_text)
+        # Map the file instead of copying it into a BytesIO buffer
+        with open_spooled_pdf(pdf_file) as (pdf_stream, pdf_path):
+            reader = PyPDF2.PdfReader(pdf_stream)
+            total_pages = len(reader.pages)
             
-            # Update progress
-            progress = (i + 1) / total_pages
-            progress_bar.progress(progress)
-            status_text.text(f"Extracting page {i+1}/{total_pages}")
+            # Add progress bar for large documents
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+            
+            page_texts = [""] * total_pages
+            page_stream = iter_page_texts(reader, pdf_stream, pdf_path=pdf_path)
+            for pages_done, (page_number, page_text) in enumerate(page_stream, 1):
+                page_texts[page_number - 1] = page_text
+                
+                # Update progress
+                progress = pages_done / total_pages
+                progress_bar.progress(progress)
+                status_text.text(f"Extracting page {pages_done}/{total_pages}")
         
         # Clear progress indicators
         progress_bar.empty()
         status_text.empty()
         
-        model_questions = "\n".join(text_parts)
+        model_questions = "\n".join(page_text for page_text in page_texts if page_text)
         
         # Handle empty PDFs
         if not model_questions.strip():
@@ -353,15 +699,153 @@ def extract_model_questions(pdf_file):
         else:
             st.error(f"Error extracting model questions from PDF: {str(e)}")
         return ""
+def iter_generated_questions(chunks, question_type):
+    """Yield each generated question as soon as it is complete.
+    
+    A question is complete when the next [question_type] tag line arrives,
+    or when the text ends.
+    
+    Args:
+        chunks: Iterable of text chunks, such as a streamed response
+        question_type: Question type whose tag starts each question
+    """
+    current_q = ""
+    pending = ""
+    
+    def add_line(line):
+        nonlocal current_q
+        # Check if this is the start of a new question
+        if line.strip().startswith(f"[{question_type}]"):
+            finished = current_q.strip()
+            current_q = line  # Start new question
+            return finished
+        # Add to current question
+        current_q += "\n" + line if current_q else line
+        return ""
+    
+    for chunk in chunks:
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            finished = add_line(line)
+            if finished:
+                yield finished
+    finished = add_line(pending)
+    if finished:
+        yield finished
+    
+    # Don't forget the last question
+    if current_q.strip():
+        yield current_q.strip()
+
+def split_generated_questions(questions_text, question_type):
+    """Split generated text into individual questions, each starting at its [question_type] tag."""
+    return list(iter_generated_questions([questions_text.strip()], question_type))
+
+def stream_generated_questions(model, prompts):
+    """Yield questions from several prompts as each one completes, keeping the prompts' order.
+    
+    All prompts are streamed at the same time; questions of a later prompt
+    are held back until every earlier prompt has finished. Questions that
+    repeat an earlier one are skipped.
+    
+    Args:
+        model: Model returned by get_gemini_model
+        prompts: (question type, prompt) pairs, in the order to yield them
+    
+    Raises:
+        GenerationError: After the other prompts' questions, if any prompt failed
+    """
+    seen = NearDuplicateFilter()
+    errors = []
+    for (qtype, _), chunks in zip(prompts, stream_all(model, [prompt for _, prompt in prompts])):
+        try:
+            for question in iter_generated_questions(chunks, qtype):
+                if seen.is_new(question):
+                    yield question
+        except Exception as e:
+            errors.append(str(e))
+    if errors:
+        raise GenerationError(f"Error generating questions: {errors[0]}")
+
+def stream_text(model, prompts, error_prefix):
+    """Yield the text of streamed responses in prompt order.
+    
+    Args:
+        model: Model returned by get_gemini_model
+        prompts: (label, prompt) pairs; the labels become headings when there is more than one
+        error_prefix: Start of the error message when a part fails
+    
+    Raises:
+        GenerationError: When a part fails, so that no partial text is kept
+    """
+    for (label, _), chunks in zip(prompts, stream_all(model, [prompt for _, prompt in prompts])):
+        if len(prompts) > 1:
+            yield f"\n\n### {label}\n\n"
+        try:
+            yield from chunks
+        except Exception as e:
+            raise GenerationError(f"{error_prefix}: {str(e)}") from e
+
 # Generate questions
-def generate_questions(summary, question_type, num_questions=10, include_answers=False, model_questions=None):
-    model = setup_google_api()
+def generate_questions(summary, question_type, num_questions=10, include_answers=False, model_questions=None,
+                       exemplar_budget=EXEMPLAR_TOKEN_BUDGET, focus_topics=None, stream=False):
+    """Generate exam questions from study text.
+    
+    Args:
+        summary: Study text, or a Document whose page boundaries the chunks follow
+        question_type: "Mixed" or one of the question types
+        num_questions: Number of questions to generate
+        include_answers: Whether to include model answers
+        model_questions: Past questions to use as a style guide, either as raw
+            text or as question dicts with text and question_type
+        exemplar_budget: Maximum estimated prompt tokens spent on example questions
+        focus_topics: Frequently examined topics to weight the questions toward
+        stream: Stream the response and return an iterator that yields each
+            question as soon as it is complete; errors are then raised as
+            GenerationError instead of returned as messages
+    
+    Long material is split into chunks on page boundaries, and the questions
+    are shared between the chunks and generated from all of them at once.
+    
+    Returns:
+        list: Formatted questions, or a single error message
+    """
+    model = get_gemini_model()
     if not model:
+        if stream:
+            raise GenerationError("API configuration failed.")
         return ["API configuration failed."]
     
-    # Truncate summary if too long for API limits
-    max_chars = 30000  # Adjust based on Gemini's token limits
-    truncated_summary = summary[:max_chars] if len(summary) > max_chars else summary
+    # Long material is split into chunks; each chunk gets its share of the questions
+    chunks = split_chunks(summary)
+    # Only a budgeted selection of the past questions goes into each prompt
+    if isinstance(model_questions, str):
+        model_questions = split_exemplar_text(model_questions)
+    exemplar_candidates = model_questions or []
+    # Examples are picked once per question type, against the whole material, and shared by its chunks
+    study_text = summary.text if isinstance(summary, Document) else summary
+    exemplars_by_type = {}
+    
+    def examples_for(qtype):
+        """Return the style guide section of the prompt for a question type, or "" without examples."""
+        if qtype not in exemplars_by_type:
+            examples = format_exemplars(
+                select_exemplars(exemplar_candidates, study_text, qtype, exemplar_budget)
+            )
+            exemplars_by_type[qtype] = (
+                "Please also reference the following example questions as a style guide:\n" + examples if examples else ""
+            )
+        return exemplars_by_type[qtype]
+    
+    # Kept out of the prompt f-strings, whose expressions cannot hold a backslash before Python 3.12
+    mcq_example_answer = (
+        "Answer: The primary function of X is Function 2. This is because... [detailed explanation]\nCorrect Answer: B"
+        if include_answers else ""
+    )
+    focus = ""
+    if focus_topics:
+        focus = "Past exams most often test these topics from this material, so weight the questions toward them: " + ", ".join(focus_topics)
     try:
         if question_type == "Mixed":
             # For mixed type, distribute questions evenly among types
@@ -374,20 +858,40 @@ def generate_questions(summary, question_type, num_questions=10, include_answers
             for i in range(remainder):
                 type_counts[types[i]] += 1
             
-            # Generate questions for each type
-            all_questions = []
-            for qtype, count in type_counts.items():
+            # Every chunk gets its share of the questions, and the types take turns across the chunks
+            remaining = dict(type_counts)
+            type_turns = []
+            while any(remaining.values()):
+                for qtype in types:
+                    if remaining[qtype] > 0:
+                        type_turns.append(qtype)
+                        remaining[qtype] -= 1
+            slots = [i for i, count in enumerate(allocate(num_questions, chunks)) for _ in range(count)]
+            job_counts = {}
+            for qtype, chunk_index in zip(type_turns, slots):
+                job_counts[(qtype, chunk_index)] = job_counts.get((qtype, chunk_index), 0) + 1
+            
+            # Build the prompt for each type and chunk, in the fixed type order
+            prompts = []
+            jobs = [
+                (qtype, chunks[chunk_index][1], job_counts.get((qtype, chunk_index), 0))
+                for qtype in types
+                for chunk_index in range(len(chunks))
+            ]
+            for qtype, chunk_text, count in jobs:
                 if count > 0:
+                    examples = examples_for(qtype)
                     prompt = f"""Generate {count} professionally formatted {qtype} questions based on the following text.
                     
                     Text to analyze:
-                    {truncated_summary}
+                    {chunk_text}
                     
                     Instructions for question creation:
                     1. Create challenging but fair questions that test understanding of key concepts.
                     2. Use clear, concise language and proper formatting.
                     3. Each question should be self-contained and complete.
                     4. Questions should directly relate to the content in the provided text.
+                    {focus}
                     {"5. For Numerical Calculation questions: ONLY generate these if the content contains numerical data, formulas, or calculations that can be used to create meaningful problems. If the content doesn't support numerical questions, return a message stating 'Cannot generate numerical calculation questions from this content' instead of creating artificial questions." if qtype == "Numerical Calculation" else ""}
                     
                     Format requirements:
@@ -416,6 +920,8 @@ def generate_questions(summary, question_type, num_questions=10, include_answers
                     
                     {"• Include answers for all questions by adding an 'Answer:' section with detailed explanations." if include_answers else "• Do NOT include answers for any questions."}
                     
+                    {examples}
+                    
                     Example format for MCQ:
                     [MCQ]
                     Question: What is the primary function of X?
@@ -424,7 +930,7 @@ def generate_questions(summary, question_type, num_questions=10, include_answers
                     B) Function 2
                     C) Function 3
                     D) Function 4
-                    {"Answer: The primary function of X is Function 2. This is because... [detailed explanation]\nCorrect Answer: B" if include_answers else ""}
+                    {mcq_example_answer}
                     
                     Example format for Short Answer:
                     [Short Answer]
@@ -434,112 +940,87 @@ def generate_questions(summary, question_type, num_questions=10, include_answers
                     Do NOT include any introductory text, explanations, or commentary - return ONLY the formatted questions {"with answers" if include_answers else "without answers"}.
                     """
                     
-                    response = model.generate_content(prompt)
-                    if response:
-                        questions_text = response.text.strip()
-                        
-                        # Split into individual questions - more robust parsing
-                        questions = []
-                        current_q = ""
-                        
-                        for line in questions_text.split('\n'):
-                            line_stripped = line.strip()
-                            # Check if this is the start of a new question
-                            if line_stripped.startswith(f"[{qtype}]"):
-                                if current_q:  # Save previous question if exists
-                                    questions.append(current_q.strip())
-                                current_q = line  # Start new question
-                            else:
-                                # Add to current question
-                                current_q += "\n" + line if current_q else line
-                        
-                        # Don't forget the last question
-                        if current_q:
-                            questions.append(current_q.strip())
-                        
-                        all_questions.extend(questions)
-            
-            return all_questions if all_questions else ["No questions were generated. Please try again."]
+                    prompts.append((qtype, prompt))
             
         else:
-            # Original handling for specific question types with improved formatting
-            prompt_template = f"""Generate {num_questions} professionally formatted {question_type} questions based on the following text.
-            
-            Text to analyze:
-            {truncated_summary}
-            
-            Instructions for question creation:
-            1. Create challenging but fair questions that test understanding of key concepts.
-            2. Use clear, concise language and proper formatting.
-            3. Each question should be self-contained and complete.
-            4. Questions should directly relate to the content in the provided text.
-            {"5. For Numerical Calculation questions: ONLY generate these if the content contains numerical data, formulas, or calculations that can be used to create meaningful problems. If the content doesn't support numerical questions, return a message stating 'Cannot generate numerical calculation questions from this content' instead of creating artificial questions." if question_type == "Numerical Calculation" else ""}
-            
-            Format requirements:
-            • Start each question with [{question_type}] on its own line
-            • For MCQ questions:
-              - Begin with "Question: [question text]"
-              - Then "Options:" on a new line
-              - List 4 options as "A) [option text]", "B) [option text]", etc.
-              - Each option on a new line
-              - If answers are included, add "Answer:" section with the correct answer and explanation
-              - Include "Correct Answer: [A/B/C/D]" at the end of the answer section
-            
-            • For Short Answer questions:
-              - Begin with "Question: [question text]"
-              - If answers are included, add "Answer:" section with a detailed model answer
-            
-            • For Case Based Application:
-              - Begin with "Case Scenario: [detailed scenario description]"
-              - Then "Question: [specific questions about the scenario]"
-              - If answers are included, add "Answer:" section with detailed analysis
-            
-            • For Numerical Calculation:
-              - Begin with "Question: [problem statement]"
-              - Include all necessary information for calculation
-              - If answers are included, add "Answer:" section with step-by-step solution
-            
-            {"• Include answers for all questions by adding an 'Answer:' section with detailed explanations." if include_answers else "• Do NOT include answers for any questions."}
-            
-            {"Please also reference the following example questions as a style guide:\n" + model_questions if model_questions else ""}
-            
-            Do NOT include any introductory text, explanations, or commentary - return ONLY the formatted questions {"with answers" if include_answers else "without answers"}.
-            """
+            prompts = []
+            for (_, chunk_text), count in zip(chunks, allocate(num_questions, chunks)):
+                if count == 0:
+                    continue
+                examples = examples_for(question_type)
+                # Original handling for specific question types with improved formatting
+                prompt_template = f"""Generate {count} professionally formatted {question_type} questions based on the following text.
             
-            response = model.generate_content(prompt_template)
+                Text to analyze:
+                {chunk_text}
             
-            # Process the response to ensure clean formatting
-            if response:
-                questions_text = response.text.strip()
-                
-                # Split into individual questions - more robust parsing
-                questions = []
-                current_q = ""
-                
-                for line in questions_text.split('\n'):
-                    line_stripped = line.strip()
-                    # Check if this is the start of a new question
-                    if line_stripped.startswith(f"[{question_type}]"):
-                        if current_q:  # Save previous question if exists
-                            questions.append(current_q.strip())
-                        current_q = line  # Start new question
-                    else:
-                        # Add to current question
-                        current_q += "\n" + line if current_q else line
-                
-                # Don't forget the last question
-                if current_q:
-                    questions.append(current_q.strip())
-                
-                return questions if questions else ["No questions were generated. Please try again."]
-            else:
-                return ["No response from API."]
+                Instructions for question creation:
+                1. Create challenging but fair questions that test understanding of key concepts.
+                2. Use clear, concise language and proper formatting.
+                3. Each question should be self-contained and complete.
+                4. Questions should directly relate to the content in the provided text.
+                {focus}
+                {"5. For Numerical Calculation questions: ONLY generate these if the content contains numerical data, formulas, or calculations that can be used to create meaningful problems. If the content doesn't support numerical questions, return a message stating 'Cannot generate numerical calculation questions from this content' instead of creating artificial questions." if question_type == "Numerical Calculation" else ""}
+            
+                Format requirements:
+                • Start each question with [{question_type}] on its own line
+                • For MCQ questions:
+                  - Begin with "Question: [question text]"
+                  - Then "Options:" on a new line
+                  - List 4 options as "A) [option text]", "B) [option text]", etc.
+                  - Each option on a new line
+                  - If answers are included, add "Answer:" section with the correct answer and explanation
+                  - Include "Correct Answer: [A/B/C/D]" at the end of the answer section
+            
+                • For Short Answer questions:
+                  - Begin with "Question: [question text]"
+                  - If answers are included, add "Answer:" section with a detailed model answer
+            
+                • For Case Based Application:
+                  - Begin with "Case Scenario: [detailed scenario description]"
+                  - Then "Question: [specific questions about the scenario]"
+                  - If answers are included, add "Answer:" section with detailed analysis
+            
+                • For Numerical Calculation:
+                  - Begin with "Question: [problem statement]"
+                  - Include all necessary information for calculation
+                  - If answers are included, add "Answer:" section with step-by-step solution
+            
+                {"• Include answers for all questions by adding an 'Answer:' section with detailed explanations." if include_answers else "• Do NOT include answers for any questions."}
+            
+                {examples}
+            
+                Do NOT include any introductory text, explanations, or commentary - return ONLY the formatted questions {"with answers" if include_answers else "without answers"}.
+                """
+                prompts.append((question_type, prompt_template))
+        
+        # Every prompt is sent at the same time; the gateway caps how many reach the API
+        if stream:
+            return stream_generated_questions(model, prompts)
+        texts, errors = generate_all(model, [prompt for _, prompt in prompts])
+        questions = []
+        for (qtype, _), text in zip(prompts, texts):
+            if text:
+                questions.extend(split_generated_questions(text, qtype))
+        # Neighbouring chunks can yield the same question
+        questions = remove_near_duplicates(questions)
+        if errors and not questions:
+            return [f"Error generating questions: {errors[0]}"]
+        return questions if questions else ["No questions were generated. Please try again."]
     except Exception as e:
+        if stream:
+            raise GenerationError(f"Error generating questions: {str(e)}") from e
         return [f"Error generating questions: {str(e)}"]
 # Evaluate answer
-def evaluate_answer(question, user_answer):
-    model = setup_google_api()
+def evaluate_answer(question, user_answer, stream=False):
+    """Evaluate a typed answer; with stream set, return an iterator of Markdown chunks instead.
+    
+    Streamed evaluations raise GenerationError instead of returning an error message.
+    """
+    model = get_gemini_model()
     if not model:
+        if stream:
+            raise GenerationError("API configuration failed.")
         return "API configuration failed."
     try:
         prompt = f"""Evaluate the following answer and provide feedback *strictly* in the specified Markdown-like format. Do NOT include any introductory or concluding sentences, conversational elements, or formatting beyond what is specified.
@@ -560,84 +1041,109 @@ def evaluate_answer(question, user_answer):
         ---
         """
 
+        if stream:
+            return stream_text(model, [("Evaluation", prompt)], "Error evaluating answer")
         response = model.generate_content(prompt)
         return response.text if response else "No response from API."
     except Exception as e:
+        if stream:
+            raise GenerationError(f"Error evaluating answer: {str(e)}") from e
         return f"Error evaluating answer: {str(e)}"
 # Generate notes
-def generate_notes(summary, note_type="cornell"):
-    model = setup_google_api()
+def generate_notes(summary, note_type="cornell", stream=False):
+    """Generate notes from study text; with stream set, return an iterator of Markdown chunks instead.
+    
+    Streamed notes raise GenerationError instead of returning an error message.
+    """
+    model = get_gemini_model()
     if not model:
+        if stream:
+            raise GenerationError("API configuration failed.")
         return "API configuration failed."
     
-    # Truncate summary if too long for API limits
-    max_chars = 30000  # Adjust based on Gemini's token limits
-    truncated_summary = summary[:max_chars] if len(summary) > max_chars else summary
+    # Long material is split into chunks on page boundaries, each noted separately
+    chunks = split_chunks(summary)
     
     try:
-        if note_type == "cornell":
-            prompt = f"""Generate Cornell Notes from the following summary, strictly adhering to the Markdown-like format below. Do NOT include any introductory or concluding sentences, conversational elements, or formatting beyond what is specified. Ignore the learning outcome section of the notes included.
-            Summary Text:
-            {truncated_summary}
-            
-            ---
-            ## Cornell Notes
-            **Key Questions:** (Generate questions that a reader should be able to answer after reviewing these notes. Ensure these are clear, concise, and directly related to the content and all concepts are covered.)
-            [Insert Key Questions Here - One question per line, serially number the questions]
-
-            ---
-            | Main Ideas/Key Points | Notes and Details |
-            | :-------------------- | :---------------- |
-            | [Insert Key Point 1]  | [Insert Detailed Notes for Key Point 1] |
-            | [Insert Key Point 2]  | [Insert Detailed Notes for Key Point 2] |
-            | ...                   | ...                   |
-
-            ---
-            **Summary:** (Provide a summary of the most crucial information from the notes above.)
-            [Insert Concise Summary Here in the next line]
-
-            ---
-            """
+        prompts = []
+        for label, chunk_text in chunks:
+            if note_type == "cornell":
+                prompt = f"""Generate Cornell Notes from the following summary, strictly adhering to the Markdown-like format below. Do NOT include any introductory or concluding sentences, conversational elements, or formatting beyond what is specified. Ignore the learning outcome section of the notes included.
+                Summary Text:
+                {chunk_text}
+            
+                ---
+                ## Cornell Notes
+                **Key Questions:** (Generate questions that a reader should be able to answer after reviewing these notes. Ensure these are clear, concise, and directly related to the content and all concepts are covered.)
+                [Insert Key Questions Here - One question per line, serially number the questions]
 
-        elif note_type == "concept_map":
-            prompt = f"""Create a concept map in text format from the following summary, strictly adhering to the Markdown-like format below. Do NOT include any introductory or concluding sentences, conversational elements, or formatting beyond what is specified.
-            Summary Text:
-            {truncated_summary}
+                ---
+                | Main Ideas/Key Points | Notes and Details |
+                | :-------------------- | :---------------- |
+                | [Insert Key Point 1]  | [Insert Detailed Notes for Key Point 1] |
+                | [Insert Key Point 2]  | [Insert Detailed Notes for Key Point 2] |
+                | ...                   | ...                   |
+
+                ---
+                **Summary:** (Provide a summary of the most crucial information from the notes above.)
+                [Insert Concise Summary Here in the next line]
+
+                ---
+                """
+
+            elif note_type == "concept_map":
+                prompt = f"""Create a concept map in text format from the following summary, strictly adhering to the Markdown-like format below. Do NOT include any introductory or concluding sentences, conversational elements, or formatting beyond what is specified.
+                Summary Text:
+                {chunk_text}
             
-            ---
-            # Concept Map Notes
+                ---
+                # Concept Map Notes
             
-            ## Central Concept: [Main Topic]
+                ## Central Concept: [Main Topic]
             
-            ### Related Concept 1: [Topic 1]
-            - **Connection to Central Concept**: [Explain relationship]
-            - **Key Attributes**:
-              - [Attribute 1.1]
-              - [Attribute 1.2]
-            - **Examples**:
-              - [Example 1.1]
-              - [Example 1.2]
+                ### Related Concept 1: [Topic 1]
+                - **Connection to Central Concept**: [Explain relationship]
+                - **Key Attributes**:
+                  - [Attribute 1.1]
+                  - [Attribute 1.2]
+                - **Examples**:
+                  - [Example 1.1]
+                  - [Example 1.2]
             
-            ### Related Concept 2: [Topic 2]
-            - **Connection to Central Concept**: [Explain relationship]
-            - **Key Attributes**:
-              - [Attribute 2.1]
-              - [Attribute 2.2]
-            - **Examples**:
-              - [Example 2.1]
-              - [Example 2.2]
+                ### Related Concept 2: [Topic 2]
+                - **Connection to Central Concept**: [Explain relationship]
+                - **Key Attributes**:
+                  - [Attribute 2.1]
+                  - [Attribute 2.2]
+                - **Examples**:
+                  - [Example 2.1]
+                  - [Example 2.2]
             
-            ### Connection between [Topic 1] and [Topic 2]:
-            - [Explain how these concepts relate to each other]
+                ### Connection between [Topic 1] and [Topic 2]:
+                - [Explain how these concepts relate to each other]
             
-            [Continue with additional related concepts and connections as needed]
+                [Continue with additional related concepts and connections as needed]
             
-            ---
-            """
+                ---
+                """
+            prompts.append((label, prompt))
         
-        response = model.generate_content(prompt)
-        return response.text if response else "No response from API."
+        # The parts are generated at the same time and joined in reading order
+        if stream:
+            return stream_text(model, prompts, "Error generating notes")
+        texts, errors = generate_all(model, [prompt for _, prompt in prompts])
+        if not any(texts):
+            return f"Error generating notes: {errors[0]}" if errors else "No response from API."
+        if len(texts) == 1:
+            return texts[0]
+        errors = iter(errors)
+        return "\n\n".join(
+            f"### {label}\n\n{text if text is not None else 'Error generating notes: ' + next(errors)}"
+            for (label, _), text in zip(prompts, texts)
+        )
     except Exception as e:
+        if stream:
+            raise GenerationError(f"Error generating notes: {str(e)}") from e
         return f"Error generating notes: {str(e)}"
 # Copy to clipboard
 def copy_to_clipboard(text):
@@ -916,7 +1422,7 @@ def format_exam_paper(questions):
 # Evaluate handwritten answer
 def evaluate_handwritten_answer(question, image_file):
     """Evaluate a handwritten answer from an uploaded image."""
-    model = setup_google_api()
+    model = get_gemini_model()
     if not model:
         return "API configuration failed."
     
@@ -952,19 +1458,18 @@ def evaluate_handwritten_answer(question, image_file):
 # Generate flashcards
 def generate_flashcards(summary):
     """Generate flashcards from the summary text."""
-    model = setup_google_api()
+    model = get_gemini_model()
     if not model:
         return []
     
-    # Truncate summary if too long for API limits
-    max_chars = 30000  # Adjust based on Gemini's token limits
-    truncated_summary = summary[:max_chars] if len(summary) > max_chars else summary
+    # Long material is split into chunks on page boundaries, each with its own cards
+    chunks = split_chunks(summary)
     
     try:
-        prompt = f"""Generate 10-15 flashcards based on the following summary. Each flashcard should have a front (question/term) and back (answer/definition).
+        prompts = [f"""Generate 10-15 flashcards based on the following summary. Each flashcard should have a front (question/term) and back (answer/definition).
         
         Summary Text:
-        {truncated_summary}
+        {chunk_text}
         
         Format each flashcard as follows:
         
@@ -977,50 +1482,125 @@ def generate_flashcards(summary):
         Back: [Answer or definition]
         
         And so on. Make sure the flashcards cover key concepts, definitions, and important facts from the summary.
-        """
+        """ for _, chunk_text in chunks]
         
-        response = model.generate_content(prompt)
+        texts, errors = generate_all(model, prompts)
+        if errors and not any(texts):
+            raise RuntimeError(errors[0])
         
-        # Parse the response into flashcards
+        # Parse the responses into flashcards
         flashcards = []
-        current_card = {"front": "", "back": ""}
-        in_card = False
-        
-        for line in response.text.split("\n"):
-            line = line.strip()
-            
-            if line.startswith("CARD"):
-                # Start a new card
-                if current_card["front"] and current_card["back"]:
-                    flashcards.append(current_card.copy())
-                current_card = {"front": "", "back": ""}
-                in_card = True
-            elif in_card and line.startswith("Front:"):
-                current_card["front"] = line[6:].strip()
-            elif in_card and line.startswith("Back:"):
-                current_card["back"] = line[5:].strip()
-        
-        # Add the last card if it exists
-        if current_card["front"] and current_card["back"]:
-            flashcards.append(current_card.copy())
-            
-        return flashcards
+        for text in texts:
+            current_card = {"front": "", "back": ""}
+            in_card = False
+            
+            for line in (text or "").split("\n"):
+                line = line.strip()
+                
+                if line.startswith("CARD"):
+                    # Start a new card
+                    if current_card["front"] and current_card["back"]:
+                        flashcards.append(current_card.copy())
+                    current_card = {"front": "", "back": ""}
+                    in_card = True
+                elif in_card and line.startswith("Front:"):
+                    current_card["front"] = line[6:].strip()
+                elif in_card and line.startswith("Back:"):
+                    current_card["back"] = line[5:].strip()
+            
+            # Add the last card if it exists
+            if current_card["front"] and current_card["back"]:
+                flashcards.append(current_card.copy())
+        
+        # Neighbouring chunks can yield the same card
+        return remove_near_duplicates(flashcards, key=lambda card: f"{card['front']} {card['back']}")
     except Exception as e:
         st.error(f"Error generating flashcards: {str(e)}")
         return []
+def parse_json_response(text):
+    """Parse the JSON in a model response, removing any Markdown code fence around it."""
+    json_text = text
+    if "```json" in json_text:
+        json_text = json_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in json_text:
+        json_text = json_text.split("```")[1].split("```")[0].strip()
+    return json.loads(json_text)
+
+def parse_json_responses(texts):
+    """Parse the JSON in each response of a chunked generation, skipping responses that fail.
+    
+    Returns:
+        tuple: (parsed values in chunk order, the last parse error and its raw
+        text, or None if every response parsed)
+    """
+    parsed = []
+    failure = None
+    for text in texts:
+        if text is None:
+            continue
+        try:
+            parsed.append(parse_json_response(text))
+        except json.JSONDecodeError as e:
+            failure = (e, text)
+    return parsed, failure
+
+def merge_mind_maps(mind_maps):
+    """Merge the mind maps of consecutive chunks; branches with the same topic are joined.
+    
+    Maps and branches without the expected keys are skipped, so one malformed
+    response does not lose the others.
+    """
+    central_topic = None
+    branches = {}
+    for mind_map in mind_maps:
+        if not isinstance(mind_map, dict):
+            continue
+        central_topic = central_topic or mind_map.get("central_topic")
+        for branch in mind_map.get("branches") or []:
+            topic = branch.get("topic") if isinstance(branch, dict) else None
+            if not isinstance(topic, str) or not topic.strip():
+                continue
+            merged = branches.setdefault(topic.strip().lower(), {"topic": topic, "subtopics": []})
+            for subtopic in branch.get("subtopics") or []:
+                if subtopic not in merged["subtopics"]:
+                    merged["subtopics"].append(subtopic)
+    return {"central_topic": central_topic or "Study Material", "branches": list(branches.values())}
+
+def merge_mind_palaces(mind_palaces):
+    """Merge the Mind Palaces of consecutive chunks into one palace; rooms with the same name are joined.
+    
+    Palaces and rooms without the expected keys are skipped, so one malformed
+    response does not lose the others.
+    """
+    palace_name = None
+    rooms = {}
+    for mind_palace in mind_palaces:
+        if not isinstance(mind_palace, dict):
+            continue
+        palace_name = palace_name or mind_palace.get("palace_name")
+        for room in mind_palace.get("rooms") or []:
+            name = room.get("name") if isinstance(room, dict) else None
+            if not isinstance(name, str) or not name.strip():
+                continue
+            merged = rooms.setdefault(name.strip().lower(), dict(room, memory_anchors=[]))
+            merged["memory_anchors"].extend(room.get("memory_anchors") or [])
+    return {"palace_name": palace_name or "Mind Palace", "rooms": list(rooms.values())}
+
 # Generate mind map
 def generate_mind_map_data(summary):
     """Generate mind map data structure from the summary."""
-    model = setup_google_api()
+    model = get_gemini_model()
     if not model:
         return None
     
-    # Truncate summary if too long for API limits
-    max_chars = 30000
-    truncated_summary = summary[:max_chars] if len(summary) > max_chars else summary
+    # Long material is split into chunks on page boundaries; their mind maps are merged
+    chunks = split_chunks(summary)
+    if not chunks:
+        st.warning("There is no study text to create a mind map from.")
+        return None
     
     try:
-        prompt = f"""Create a hierarchical mind map structure based on the following text. 
+        prompts = [f"""Create a hierarchical mind map structure based on the following text. 
         The mind map should have a central topic and multiple branches with subtopics.
         
         Format the mind map as a JSON structure with the following format:
@@ -1039,29 +1619,22 @@ def generate_mind_map_data(summary):
         }}
         
         Text to analyze:
-        {truncated_summary}
+        {chunk_text}
         
         Only return the JSON structure, nothing else.
-        """
+        """ for _, chunk_text in chunks]
         
-        response = model.generate_content(prompt)
+        texts, errors = generate_all(model, prompts)
+        if errors and not any(texts):
+            raise RuntimeError(errors[0])
         
-        # Parse the JSON response
-        try:
-            # Find JSON in the response
-            json_text = response.text
-            # Clean up any markdown formatting
-            if "```json" in json_text:
-                json_text = json_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in json_text:
-                json_text = json_text.split("```")[1].split("```")[0].strip()
-                
-            mind_map_data = json.loads(json_text)
-            return mind_map_data
-        except json.JSONDecodeError as e:
-            st.error(f"Error parsing mind map JSON: {str(e)}")
-            st.code(response.text)  # Show the raw response for debugging
+        # Parse the JSON responses
+        mind_maps, failure = parse_json_responses(texts)
+        if not mind_maps:
+            st.error(f"Error parsing mind map JSON: {str(failure[0])}")
+            st.code(failure[1])  # Show the raw response for debugging
             return None
+        return mind_maps[0] if len(mind_maps) == 1 else merge_mind_maps(mind_maps)
             
     except Exception as e:
         st.error(f"Error generating mind map: {str(e)}")
@@ -1069,16 +1642,20 @@ def generate_mind_map_data(summary):
 # Generate mind palace
 def generate_mind_palace(summary):
     """Generate a Mind Palace structure from study material using Gemini API."""
-    model = setup_google_api()
+    model = get_gemini_model()
     if not model:
         return None
     
-    # Truncate summary if too long for API limits
-    max_chars = 30000
-    truncated_summary = summary[:max_chars] if len(summary) > max_chars else summary
+    # Long material is split into chunks on page boundaries; each adds its own rooms
+    chunks = split_chunks(summary)
+    if not chunks:
+        st.warning("There is no study text to create a Mind Palace from.")
+        return None
+    # One chunk gets the whole palace; with several, the rooms are shared between them
+    room_counts = ["3-5"] if len(chunks) == 1 else [max(1, count) for count in allocate(MIND_PALACE_ROOMS, chunks)]
     
     try:
-        prompt = f"""Create a detailed Mind Palace structure based on the following study material. 
+        prompts = [f"""Create a detailed Mind Palace structure based on the following study material. 
         The Mind Palace should be designed to help memorize and recall the information effectively.
         
         Format the Mind Palace as a JSON structure with the following format:
@@ -1101,36 +1678,29 @@ def generate_mind_palace(summary):
         }}
         
         Guidelines for creating the Mind Palace:
-        1. Create 3-5 distinct rooms with unique themes
+        1. Create {room_count} distinct rooms with unique themes
         2. Each room should have 3-5 memory anchors
         3. Use vivid, memorable descriptions
         4. Connect related concepts across rooms
         5. Make locations and associations easy to visualize
         
         Study Material:
-        {truncated_summary}
+        {chunk_text}
         
         Only return the JSON structure, and a mind palace image if it can be generated.
-        """
+        """ for (_, chunk_text), room_count in zip(chunks, room_counts)]
         
-        response = model.generate_content(prompt)
+        texts, errors = generate_all(model, prompts)
+        if errors and not any(texts):
+            raise RuntimeError(errors[0])
         
-        # Parse the JSON response
-        try:
-            # Find JSON in the response
-            json_text = response.text
-            # Clean up any markdown formatting
-            if "```json" in json_text:
-                json_text = json_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in json_text:
-                json_text = json_text.split("```")[1].split("```")[0].strip()
-                
-            mind_palace_data = json.loads(json_text)
-            return mind_palace_data
-        except json.JSONDecodeError as e:
-            st.error(f"Error parsing Mind Palace JSON: {str(e)}")
-            st.code(response.text)  # Show the raw response for debugging
+        # Parse the JSON responses
+        mind_palaces, failure = parse_json_responses(texts)
+        if not mind_palaces:
+            st.error(f"Error parsing Mind Palace JSON: {str(failure[0])}")
+            st.code(failure[1])  # Show the raw response for debugging
             return None
+        return mind_palaces[0] if len(mind_palaces) == 1 else merge_mind_palaces(mind_palaces)
             
     except Exception as e:
         st.error(f"Error generating Mind Palace: {str(e)}")
@@ -1138,18 +1708,20 @@ def generate_mind_palace(summary):
 # Generate interactive quiz
 def generate_interactive_quiz(summary, num_questions=5, difficulty="medium"):
     """Generate an interactive quiz with various question types."""
-    model = setup_google_api()
+    model = get_gemini_model()
     if not model:
         return None
     
-    # Truncate summary if too long for API limits
-    max_chars = 30000
-    truncated_summary = summary[:max_chars] if len(summary) > max_chars else summary
+    # Long material is split into chunks on page boundaries, sharing the questions between them
+    chunks = split_chunks(summary)
+    if not chunks:
+        st.warning("There is no study text to create a quiz from.")
+        return None
     
     try:
-        prompt = f"""Create an interactive quiz with {num_questions} questions at {difficulty} difficulty level based on this content:
+        prompts = [f"""Create an interactive quiz with {count} questions at {difficulty} difficulty level based on this content:
         
-        {truncated_summary}
+        {chunk_text}
         
         Generate a mix of question types:
         - Multiple choice (4 options)
@@ -1182,25 +1754,26 @@ def generate_interactive_quiz(summary, num_questions=5, difficulty="medium"):
         
         Ensure all questions are directly related to the content and are factually accurate.
         Only return the JSON array, nothing else.
-        """
+        """ for (_, chunk_text), count in zip(chunks, allocate(num_questions, chunks)) if count > 0]
         
-        response = model.generate_content(prompt)
+        texts, errors = generate_all(model, prompts)
+        if errors and not any(texts):
+            raise RuntimeError(errors[0])
         
-        # Parse the JSON response
-        try:
-            # Clean up any markdown formatting
-            json_text = response.text
-            if "```json" in json_text:
-                json_text = json_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in json_text:
-                json_text = json_text.split("```")[1].split("```")[0].strip()
-                
-            quiz_data = json.loads(json_text)
-            return quiz_data
-        except json.JSONDecodeError as e:
-            st.error(f"Error parsing quiz JSON: {str(e)}")
-            st.code(response.text)  # Show the raw response for debugging
+        # Parse the JSON responses
+        quizzes, failure = parse_json_responses(texts)
+        if not quizzes:
+            st.error(f"Error parsing quiz JSON: {str(failure[0])}")
+            st.code(failure[1])  # Show the raw response for debugging
             return None
+        if len(quizzes) == 1:
+            return quizzes[0]
+        # Neighbouring chunks can yield the same question
+        return remove_near_duplicates(
+            [question for quiz in quizzes if isinstance(quiz, list) for question in quiz
+             if isinstance(question, dict) and question.get("question")],
+            key=lambda question: question["question"]
+        )
             
     except Exception as e:
         st.error(f"Error generating interactive quiz: {str(e)}")
@@ -1230,7 +1803,7 @@ def evaluate_quiz_answer_with_gemini(question_data, user_answer):
     
     # Initialize Gemini API
     try:
-        model = setup_google_api()
+        model = get_gemini_model()
         if not model:
             # Fall back to basic evaluation if API is not available
             st.warning("Gemini API is not available. Using basic evaluation instead.")
@@ -1391,110 +1964,313 @@ def check_quiz_answer(question_data, user_answer):
         }
 
 # Load question papers from directory
+@st.cache_resource
+def get_paper_manifest():
+    """Return the process-wide manifest of the Question Papers directory."""
+    return PaperManifest()
+
 def load_question_papers_from_directory():
-    """Load all question papers from the Question Papers directory."""
-    question_papers_dir = "Question Papers"
-    papers_data = {}
+    """Load all question papers from the Question Papers directory.
     
+    The listing comes from the persistent manifest, which only rescans
+    directories that changed since it was last checked. Until the background
+    warm-up has finished its first scan, the listing saved by the last run
+    is served as it is.
+    
+    Returns:
+        dict: Paper display name mapped to its file path
+    """
     try:
-        # Walk through the Question Papers directory
-        for root, dirs, files in os.walk(question_papers_dir):
-            for file in files:
-                if file.endswith('.pdf'):
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, question_papers_dir)
-                    
-                    # Create a readable name from the path
-                    paper_name = os.path.splitext(relative_path)[0].replace('\\', '/').replace('_', ' ')
-                    
-                    # Store the file path
-                    papers_data[paper_name] = file_path
-        
-        return papers_data
+        manifest = get_paper_manifest()
+        manifest.refresh_if_stale()
+        # Extract any new or changed papers before they are selected, and split them into questions
+        get_paper_corpus().warm_in_background()
+        get_question_store().sync_in_background(manifest, get_paper_corpus())
+        return manifest.paper_paths()
     except Exception as e:
         st.error(f"Error loading question papers: {str(e)}")
         return {}
+@st.cache_resource
+def get_paper_corpus():
+    """Return the process-wide memo of extracted question paper text."""
+    return PaperCorpus(get_paper_manifest(), DiskCache("paper_text", PDF_TEXT_CACHE_MAX_BYTES))
+
+@st.cache_resource
+def get_question_store():
+    """Return the process-wide store of individual past-paper questions."""
+    return QuestionStore()
+
+@st.cache_resource
+def start_corpus_warmup():
+    """Index the question paper corpus once per server process, without blocking any request.
+    
+    Runs when the first session starts: the manifest is refreshed on a
+    background thread, which then starts extracting every paper into the
+    shared cache and segmenting it into the question store.
+    """
+    manifest = get_paper_manifest()
+    corpus = get_paper_corpus()
+    store = get_question_store()
+    
+    def warm_up():
+        try:
+            manifest.refresh()
+            corpus.warm_in_background()
+            store.sync_in_background(manifest, corpus)
+        except Exception as e:
+            print(f"Error warming up question paper corpus: {str(e)}")
+    
+    thread = threading.Thread(target=warm_up, name="corpus-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def show_corpus_status():
+    """Show how far the background indexing of the question paper corpus has got."""
+    corpus = get_paper_corpus()
+    store = get_question_store()
+    if store.syncing or corpus.warming:
+        total = store.sync_total or corpus.warm_total
+        st.caption(f"Corpus indexing {store.sync_done}/{total} papers...")
+    else:
+        st.caption(f"Corpus ready: {store.count()} questions indexed")
+
+@st.cache_resource
+def get_paper_search_index():
+    """Return the process-wide full-text index of the stored past-paper questions."""
+    return PaperSearchIndex(get_question_store())
+
+@st.cache_resource
+def get_coverage_matrix():
+    """Return the process-wide TF-IDF matrix of the stored past-paper questions."""
+    return CoverageMatrix(get_question_store())
+
+def get_active_study_document():
+    """Return the active study material as a Document, limited to the selected page range.
+    
+    Page boundaries are kept whenever the study text is the active file's;
+    other study text, such as combined documents, is wrapped as one page.
+    """
+    file_name = st.session_state.active_file
+    document = st.session_state.file_contents.get(file_name)
+    if document is not None:
+        page_range = st.session_state.page_ranges.get(file_name)
+        if page_range:
+            document = document.slice_pages(*page_range)
+        if document.text == st.session_state.summary:
+            return document
+    return Document.from_text(file_name or "Study material", st.session_state.summary)
+
+def show_coverage_heat_map():
+    """Render how many past questions tested each section of the active document, per exam term."""
+    document = get_active_study_document()
+    # Chapters are known when the outline was read before extraction
+    chapters = st.session_state.pdf_sources.get(st.session_state.active_file, {}).get("chapters")
+    sections = split_sections(document, chapters)
+    if not sections:
+        st.info("The active document has no text to compare.")
+        return
+    
+    store = get_question_store()
+    subject = st.selectbox("Subject:", options=["All"] + store.distinct("subject"), key="coverage_subject")
+    labels, terms, counts = get_coverage_matrix().coverage(sections, subject=None if subject == "All" else subject)
+    if not counts.any():
+        st.info("No past questions closely match this material.")
+        return
+    
+    import matplotlib.pyplot as plt
+    
+    fig, ax = plt.subplots(figsize=(10, max(3, 0.4 * len(labels) + 1)))
+    ax.imshow(counts, cmap="Blues", aspect="auto")
+    ax.set_xticks(range(len(terms)))
+    ax.set_xticklabels(terms, rotation=45, ha="right")
+    ax.set_yticks(range(len(labels)))
+    ax.set_yticklabels([label[:40] for label in labels])
+    for row in range(counts.shape[0]):
+        for column in range(counts.shape[1]):
+            if counts[row, column]:
+                ax.text(column, row, counts[row, column], ha="center", va="center",
+                        color="white" if counts[row, column] > counts.max() / 2 else "black")
+    ax.set_title("Past questions per section and exam term")
+    fig.tight_layout()
+    st.pyplot(fig)
+    
+    untested = [label for label, total in zip(labels, counts.sum(axis=1)) if not total]
+    if untested:
+        st.caption(f"Not tested in the indexed papers: {', '.join(untested)}")
+
+@st.cache_resource
+def get_exam_trends():
+    """Return the process-wide topic statistics of the past-paper questions."""
+    return ExamTrends(get_question_store())
+
+def get_papers_subject(paper_paths):
+    """Return the most common subject folder among the given papers, or None."""
+    manifest = get_paper_manifest()
+    subjects = [entry["subject"] for entry in map(manifest.get_by_path, paper_paths) if entry and entry["subject"]]
+    return max(set(subjects), key=subjects.count) if subjects else None
+
+def show_exam_trends():
+    """Render the most frequently examined topics of a subject."""
+    subjects = get_question_store().distinct("subject")
+    if not subjects:
+        st.info("No past questions have been indexed yet.")
+        return
+    subject = st.selectbox("Subject:", options=subjects, key="trends_subject")
+    table = get_exam_trends().topic_table(subject).head(TREND_TOPICS_SHOWN)
+    if table.empty:
+        st.info("No recurring topics found for this subject yet.")
+        return
+    st.dataframe(
+        table.assign(
+            last_asked=table["last_asked"].dt.strftime("%b %Y"),
+            marks=table["marks"].round(1),
+            mean_interval_months=table["mean_interval_months"].round(1),
+        ).rename(columns={
+            "topic": "Topic",
+            "questions": "Questions",
+            "terms": "Terms asked",
+            "marks": "Marks",
+            "last_asked": "Last asked",
+            "mean_interval_months": "Months between repeats",
+        })[["Topic", "Questions", "Terms asked", "Marks", "Last asked", "Months between repeats"]],
+        hide_index=True
+    )
+
+def show_paper_search():
+    """Render the ranked full-text search over past-paper questions."""
+    search_index = get_paper_search_index()
+    search_index.refresh()
+    store = get_question_store()
+    
+    query = st.text_input("Search past questions:", key="paper_search_query",
+                          placeholder="e.g. GST input tax credit")
+    col1, col2 = st.columns(2)
+    with col1:
+        subject = st.selectbox("Subject:", options=["All"] + store.distinct("subject"), key="paper_search_subject")
+    with col2:
+        term = st.selectbox("Exam term:", options=["All"] + store.distinct("term"), key="paper_search_term")
+    
+    if not query.strip():
+        if store.syncing:
+            st.caption(f"Indexing papers ({store.sync_done}/{store.sync_total})...")
+        return
+    
+    results = search_index.search(
+        query,
+        subject=None if subject == "All" else subject,
+        term=None if term == "All" else term,
+        limit=PAPER_SEARCH_RESULTS
+    )
+    if not results:
+        st.info("No matching questions found.")
+        return
+    for result in results:
+        part = f"({result['part']})" if result["part"] else ""
+        page = f" · page {result['page']}" if result["page"] else ""
+        st.markdown(f"**{result['paper']}** · Q{result['question_number']}{part}{page}")
+        st.caption(" · ".join(value for value in (result["subject"], result["term"], result["question_type"]) if value))
+        st.markdown(result["snippet"])
+        if result["duplicates"]:
+            st.caption(f"Also asked in: {', '.join(result['duplicates'])}")
+
 # Get model questions from papers
 def get_model_questions_from_papers(selected_papers):
-    """Extract questions from selected past papers to use as examples."""
+    """Extract questions from selected past papers to use as examples.
+    
+    Papers in the manifest are served from the shared corpus memo, so each
+    one is only extracted once per content hash. Papers the background
+    warm-up has not reached yet are left out rather than extracted here.
+    """
     model_questions = []
+    pending = 0
+    manifest = get_paper_manifest()
+    corpus = get_paper_corpus()
     
     try:
         for paper_path in selected_papers:
-            with open(paper_path, 'rb') as file:
-                paper_text = extract_model_questions(file)
-                if paper_text:
-                    model_questions.append(paper_text)
+            entry = manifest.get_by_path(paper_path)
+            if entry and not corpus.is_ready(entry):
+                # Extraction belongs to the background warm-up, never to a request
+                pending += 1
+                continue
+            if entry:
+                paper_text = corpus.get_text(entry)
+            else:
+                with open(paper_path, 'rb') as file:
+                    paper_text = extract_model_questions(file)
+            if paper_text:
+                model_questions.append(paper_text)
         
+        if pending:
+            st.info(f"{pending} of the selected papers are still being indexed and will be used once ready.")
         return "\n\n".join(model_questions)
     except Exception as e:
         st.error(f"Error extracting questions from papers: {str(e)}")
         return ""
+def get_exemplar_candidates_from_papers(selected_papers):
+    """Return the individual past questions of the selected papers as example candidates.
+    
+    Papers already segmented into the question store are served from it;
+    any others are split from their extracted text.
+    """
+    manifest = get_paper_manifest()
+    store = get_question_store()
+    candidates = []
+    
+    try:
+        for paper_path in selected_papers:
+            entry = manifest.get_by_path(paper_path)
+            rows = store.query(relative_paths=[entry["relative_path"]]) if entry else []
+            if rows:
+                candidates.extend(rows)
+            elif entry:
+                if get_paper_corpus().is_ready(entry):
+                    candidates.extend(split_exemplar_text(get_paper_corpus().get_text(entry)))
+            else:
+                with open(paper_path, 'rb') as file:
+                    candidates.extend(split_exemplar_text(extract_model_questions(file)))
+        return candidates
+    except Exception as e:
+        st.error(f"Error reading questions from papers: {str(e)}")
+        return []
 # Rename question papers
-def rename_question_papers(rename_pattern):
-    """Rename files in the Question Papers directory according to a specified pattern."""
-    question_papers_dir = "Question Papers"
-    renamed_files = []
-    errors = []
+def rename_question_papers(rename_pattern, dry_run=False):
+    """Rename files in the Question Papers directory according to a specified pattern.
+    
+    The whole plan is worked out from the manifest first and refused if any
+    two papers would collide. It is then applied as one batch that is rolled
+    back on failure, and the manifest, corpus memo and question store are
+    moved to the new paths in place, so no paper is extracted again.
+    
+    Args:
+        rename_pattern: "subject_term_year", "term_year_subject" or "clean_spaces"
+        dry_run: Only return the planned renames without renaming anything
+    
+    Returns:
+        tuple: (renamed or planned files, errors)
+    """
+    manifest = get_paper_manifest()
     
     try:
-        for root, dirs, files in os.walk(question_papers_dir):
-            for file in files:
-                if file.endswith('.pdf'):
-                    old_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(old_path, question_papers_dir)
-                    
-                    # Get directory structure relative to Question Papers
-                    dir_structure = os.path.dirname(relative_path)
-                    
-                    # Apply rename pattern
-                    try:
-                        # Extract subject and date information if available
-                        parts = file.replace('.pdf', '').split('_')
-                        
-                        if rename_pattern == "subject_term_year":
-                            # Expected format: Subject_May/Nov_YYYY.pdf
-                            if len(parts) >= 3:
-                                subject = parts[0]
-                                term = parts[1]
-                                year = parts[2]
-                                new_name = f"{subject}_{term}_{year}.pdf"
-                            else:
-                                new_name = file  # Keep original if pattern doesn't match
-                                
-                        elif rename_pattern == "term_year_subject":
-                            # Expected format: May/Nov_YYYY_Subject.pdf
-                            if len(parts) >= 3:
-                                term = parts[0]
-                                year = parts[1]
-                                subject = parts[2]
-                                new_name = f"{term}_{year}_{subject}.pdf"
-                            else:
-                                new_name = file
-                                
-                        elif rename_pattern == "clean_spaces":
-                            # Replace spaces with underscores
-                            new_name = file.replace(' ', '_')
-                            
-                        else:
-                            new_name = file
-                        
-                        # Create new path maintaining directory structure
-                        new_path = os.path.join(root, new_name)
-                        
-                        # Rename file if new name is different
-                        if new_path != old_path:
-                            os.rename(old_path, new_path)
-                            renamed_files.append({
-                                'old_name': file,
-                                'new_name': new_name,
-                                'directory': dir_structure
-                            })
-                            
-                    except Exception as e:
-                        errors.append(f"Error renaming {file}: {str(e)}")
-                        
-        return renamed_files, errors
+        renames, errors = plan_renames(manifest, rename_pattern)
+        renamed_files = [
+            {
+                'old_name': os.path.basename(old),
+                'new_name': os.path.basename(new),
+                'directory': os.path.dirname(old)
+            }
+            for old, new in renames
+        ]
+        if errors or dry_run or not renames:
+            return renamed_files, errors
+        
+        errors = apply_renames(manifest.root, renames)
+        if errors:
+            return [], errors
+        manifest.rename_papers(renames)
+        get_paper_corpus().rename_papers(renames)
+        get_question_store().rename_papers(renames)
+        return renamed_files, []
     except Exception as e:
         return [], [f"Error accessing directory: {str(e)}"]
 # Generate focus tips
@@ -1584,7 +2360,7 @@ def generate_journal_prompts(prompt_type="reflection", content_context=None):
     if content_context:
         try:
             # Initialize the Gemini model
-            model = setup_google_api()
+            model = get_gemini_model()
             if model:
                 # Create prompt for Gemini
                 prompt = f"""
@@ -1757,7 +2533,7 @@ def save_study_session(session_name=None):
     for file_name in st.session_state.get("uploaded_files", []):
         if file_name in st.session_state.file_contents:
             with open(os.path.join(file_contents_dir, file_name + ".txt"), "w", encoding="utf-8") as f:
-                f.write(st.session_state.file_contents[file_name])
+                f.write(st.session_state.file_contents[file_name].text)
     
     return session_name
 # Load study session
@@ -1788,7 +2564,7 @@ def load_study_session(session_name):
             file_path = os.path.join(file_contents_dir, file_name + ".txt")
             if os.path.exists(file_path):
                 with open(file_path, "r", encoding="utf-8") as f:
-                    st.session_state.file_contents[file_name] = f.read()
+                    st.session_state.file_contents[file_name] = Document.from_text(file_name, f.read())
     
     return True
 # List study sessions
@@ -1866,6 +2642,10 @@ def main():
         initial_sidebar_state="collapsed"  # Sidebar starts collapsed
     )
     
+    # Start indexing the question papers in the background; only the first session of the process does any work
+    start_corpus_warmup()
+    start_extraction_workers()
+    
     # Initialize session state variables
     def initialize_session_state():
         """Initialize all session state variables in one place for better organization."""
@@ -1873,6 +2653,17 @@ def main():
             st.session_state.uploaded_files = []
         if "file_contents" not in st.session_state:
             st.session_state.file_contents = {}
+        if "page_ranges" not in st.session_state:
+            st.session_state.page_ranges = {}
+        if "upload_jobs" not in st.session_state:
+            st.session_state.upload_jobs = {}
+        # Failed uploads the student dismissed, skipped until they leave the uploader
+        if "dismissed_uploads" not in st.session_state:
+            st.session_state.dismissed_uploads = set()
+        if "page_selections" not in st.session_state:
+            st.session_state.page_selections = {}
+        if "pdf_sources" not in st.session_state:
+            st.session_state.pdf_sources = {}
         if "active_file" not in st.session_state:
             st.session_state.active_file = None
         if "summary" not in st.session_state:
@@ -2229,6 +3020,13 @@ def main():
     with st.sidebar:
         st.header("Options")
 
+        st.checkbox(
+            "🔄 Regenerate AI responses",
+            key="regenerate_responses",
+            help="Identical requests are normally answered from a cache of earlier responses. "
+                 "Tick this to ask Gemini again and replace the cached answers."
+        )
+
         # Add session management to sidebar
         st.subheader("💾 Session Management")
         
@@ -2384,63 +3182,63 @@ def main():
             index=0,
             help="Select which extraction method to use for PDFs"
         )
+        st.checkbox(
+            "Use all CPU cores for large PDFs",
+            value=True,
+            key="parallel_extraction",
+            help="Extract pages of long documents in parallel worker processes"
+        )
+        st.checkbox(
+            "Read scanned pages with OCR",
+            value=True,
+            key="ocr_scanned_pages",
+            help="Run Tesseract OCR over pages that are images without a text layer",
+            disabled=not is_ocr_available()
+        )
+        st.checkbox(
+            "Choose chapters or pages before extracting",
+            value=False,
+            key="select_pages_first",
+            help="Read the outline of large PDFs first and extract only the chapters or pages you pick; "
+                 "the rest can be extracted later"
+        )
     
     # Handle new file uploads
+    # A dismissed upload is extracted again only once it has been removed from the uploader and added back
+    st.session_state.dismissed_uploads &= {file.name for file in uploaded_files or []}
     if uploaded_files:
         for file in uploaded_files:
             file_name = file.name
-            if file_name not in [f for f in st.session_state.uploaded_files]:
-                with st.spinner(f"Processing {file_name}..."):
-                    # Select extraction method based on user choice
-                    if extraction_method == "Standard PyPDF2":
-                        content = extract_text_from_pdf(file)
-                    elif extraction_method == "Robust Multi-method":
-                        content = extract_text_from_pdf_robust(file)
-                    elif extraction_method == "With Decryption":
-                        content = extract_text_from_pdf_with_crypto(file, pdf_password if pdf_password else None)
-                    else:
-                        # Auto method - try with crypto first, then fallback to robust
-                        content = extract_text_from_pdf_with_crypto(file, pdf_password if pdf_password else None)
-                        if content and (content.startswith("The PDF file is encrypted") or content.startswith("Could not extract")):
-                            content = extract_text_from_pdf_robust(file)
-                    
-                    # Check if content is an error message
-                    if content and "encrypted" in content.lower():
-                        st.error(f"""
-                        📔 **Encrypted PDF Detected:** {file_name}
-                        
-                        This PDF is password-protected or encrypted and cannot be processed.
-                        
-                        **To fix this issue:**
-                        1. Open the PDF in a PDF reader (like Adobe Acrobat)
-                        2. Enter the password if prompted
-                        3. Save a new copy without password protection
-                           - In Adobe Acrobat: File → Save As → Reduce Size PDF
-                           - In other PDF readers: Look for "Save without encryption" or similar option
-                        4. Upload the new unencrypted version
-                        """)
-                    elif content and (content.startswith("Error") or content.startswith("Failed") or content.startswith("Could not")):
-                        st.error(f"Error processing {file_name}: {content}")
-                        # Don't add the file to session state if extraction failed
-                    else:
-                        st.session_state.file_contents[file_name] = content
-                        st.session_state.uploaded_files.append(file_name)
-                        st.success(f"Successfully processed {file_name}")
-                        
-                        # Check if content is very short (likely extraction problem)
-                        if len(content.strip()) < 100:
-                            st.warning(f"""
-                            ⚠️ **Limited Content Detected**
-                            
-                            Only {len(content.strip())} characters were extracted from {file_name}, which is unusually small.
-                            
-                            This may indicate:
-                            - The PDF contains mostly images or scanned content
-                            - The PDF has restricted permissions
-                            - The text extraction was incomplete
-                            
-                            Consider using a different PDF with more extractable text.
-                            """)
+            if (file_name in st.session_state.uploaded_files or file_name in st.session_state.upload_jobs
+                    or file_name in st.session_state.page_selections or file_name in st.session_state.dismissed_uploads):
+                continue
+            
+            if extraction_method == "Auto (Recommended)":
+                # Auto method - extracted in the background so several files are processed at once
+                if st.session_state.get("select_pages_first", False):
+                    prepare_page_selection(file, pdf_password if pdf_password else None)
+                else:
+                    submit_upload(file, pdf_password if pdf_password else None)
+                continue
+            
+            with st.spinner(f"Processing {file_name}..."):
+                # Select extraction method based on user choice
+                if extraction_method == "Standard PyPDF2":
+                    content = extract_text_from_pdf(file)
+                elif extraction_method == "Robust Multi-method":
+                    content = extract_text_from_pdf_robust(file)
+                else:
+                    content = extract_text_from_pdf_with_crypto(file, pdf_password if pdf_password else None)
+                
+                # Don't add the file to session state if extraction failed
+                if not report_extraction_error(file_name, content):
+                    # Keep the pages the extractor found so page ranges can be studied later
+                    extraction_password = pdf_password if extraction_method == "With Decryption" and pdf_password else None
+                    add_uploaded_document(load_document(file_name, file, content, extraction_password))
+        
+        # Show files waiting for a page selection, then files still extracting in the background
+        show_page_selections()
+        show_upload_jobs()
         
         # Display uploaded files
         if st.session_state.uploaded_files:
@@ -2449,10 +3247,20 @@ def main():
                 col1, col2, col3 = st.columns([3, 1, 1])
                 with col1:
                     st.write(f"📄 {file_name}")
+                    document = st.session_state.file_contents[file_name]
+                    if document.page_count > 1:
+                        st.caption(f"{document.page_count} pages with text (pages {document.first_page}-{document.last_page})")
+                    if document.image_pages:
+                        st.caption(f"Scanned pages without text: {format_page_numbers(document.image_pages)}")
+                    if document.unextracted_pages and file_name in st.session_state.pdf_sources:
+                        st.caption(f"Pages not extracted yet: {format_page_numbers(document.unextracted_pages)}")
+                        if st.button("Extract more pages", key=f"more_pages_{idx}_{file_name}"):
+                            st.session_state.page_selections[file_name] = st.session_state.pdf_sources.pop(file_name)
+                            st.rerun()
                 with col2:
                     if st.button("Set Active", key=f"active_{idx}_{file_name}"):
                         st.session_state.active_file = file_name
-                        st.session_state.summary = st.session_state.file_contents[file_name]
+                        st.session_state.summary = get_study_text(file_name)
                         # Reset other state when a new file is selected
                         st.session_state.notes = ""
                         st.session_state.questions = []
@@ -2465,6 +3273,10 @@ def main():
                     if st.button("Remove", key=f"remove_{idx}_{file_name}"):
                         st.session_state.uploaded_files.remove(file_name)
                         del st.session_state.file_contents[file_name]
+                        st.session_state.page_ranges.pop(file_name, None)
+                        st.session_state.upload_jobs.pop(file_name, None)
+                        st.session_state.page_selections.pop(file_name, None)
+                        st.session_state.pdf_sources.pop(file_name, None)
                         if st.session_state.active_file == file_name:
                             st.session_state.active_file = None
                             st.session_state.summary = ""
@@ -2474,7 +3286,7 @@ def main():
             if len(st.session_state.uploaded_files) > 1:
                 if st.button("Combine All Files for Processing"):
                     combined_content = "\n\n--- NEW DOCUMENT ---\n\n".join([
-                        f"Document: {file_name}\n\n{st.session_state.file_contents[file_name]}" 
+                        f"Document: {file_name}\n\n{get_study_text(file_name)}" 
                         for file_name in st.session_state.uploaded_files
                     ])
                     st.session_state.summary = combined_content
@@ -2497,11 +3309,27 @@ def main():
                 if st.session_state.uploaded_files and not st.session_state.summary:
                     first_file = st.session_state.uploaded_files[0]
                     st.session_state.active_file = first_file
-                    st.session_state.summary = st.session_state.file_contents[first_file]
+                    st.session_state.summary = get_study_text(first_file)
                     st.info(f"Active document: {first_file}")
+            
+            # Let the student narrow the active document to the pages they are studying
+            active_document = st.session_state.file_contents.get(st.session_state.active_file)
+            if active_document and active_document.page_count > 1:
+                first_page, last_page = st.slider(
+                    "Pages to study:",
+                    min_value=active_document.first_page,
+                    max_value=active_document.last_page,
+                    value=st.session_state.page_ranges.get(
+                        st.session_state.active_file,
+                        (active_document.first_page, active_document.last_page)
+                    ),
+                    key=f"page_range_{st.session_state.active_file}",
+                    help="Only the selected pages are sent to the study tools"
+                )
+                st.session_state.page_ranges[st.session_state.active_file] = (first_page, last_page)
     
         # Combine content from all files
-        combined_content = "\n\n".join([st.session_state.file_contents[file_name] 
+        combined_content = "\n\n".join([get_study_text(file_name) 
                                     for file_name in st.session_state.uploaded_files])
         st.session_state.summary = combined_content
             
@@ -2566,13 +3394,22 @@ def main():
                 # Add generate notes button
                 if st.button("Generate Notes", key="generate_notes_btn"):
                     with st.spinner("Generating notes..."):
-                        notes = generate_notes(st.session_state.summary, note_type=note_type_map[note_type])
-                        if notes:
-                            st.session_state.notes = notes
-                            st.success("Notes generated successfully!")
-                            st.markdown(notes)
+                        # Rendered as the Markdown arrives; a failed stream's partial notes are cleared
+                        notes_placeholder = st.empty()
+                        try:
+                            with notes_placeholder.container():
+                                notes = st.write_stream(
+                                    generate_notes(get_active_study_document(), note_type=note_type_map[note_type], stream=True)
+                                )
+                        except GenerationError as e:
+                            notes_placeholder.empty()
+                            st.error(str(e))
                         else:
-                            st.error("Failed to generate notes.")
+                            if notes:
+                                st.session_state.notes = notes
+                                st.success("Notes generated successfully!")
+                            else:
+                                st.error("Failed to generate notes.")
                 
                 # Display existing notes if available
                 # if st.session_state.get("notes", ""):
@@ -2594,8 +3431,10 @@ def main():
                 # Load available question papers
                 question_papers = load_question_papers_from_directory()
                 
+                selected_paper_paths = []
                 if question_papers:
                     st.markdown("### Use Past Question Papers")
+                    show_corpus_status()
                     st.write("Select past papers to guide question generation:")
                     
                     # Create a multiselect for choosing papers
@@ -2605,6 +3444,17 @@ def main():
                         help="Choose papers to use as examples for question generation"
                     )
                     
+                    with st.expander("Search past questions"):
+                        show_paper_search()
+                    
+                    with st.expander("Exam trends"):
+                        show_exam_trends()
+                    
+                    if st.session_state.summary:
+                        with st.expander("Past exam coverage of the active document"):
+                            if st.checkbox("Show coverage heat map", key="show_coverage"):
+                                show_coverage_heat_map()
+                    
                     # Get the file paths for selected papers
                     selected_paper_paths = [question_papers[name] for name in selected_paper_names]
                     
@@ -2614,6 +3464,13 @@ def main():
                             model_questions_text = get_model_questions_from_papers(selected_paper_paths)
                             if model_questions_text:
                                 st.success(f"Successfully loaded questions from {len(selected_paper_names)} papers")
+                                manifest = get_paper_manifest()
+                                selected_entries = [manifest.get_by_path(path) for path in selected_paper_paths]
+                                question_count = get_question_store().count(
+                                    [entry["relative_path"] for entry in selected_entries if entry]
+                                )
+                                if question_count:
+                                    st.caption(f"{question_count} individual questions indexed from these papers")
                                 with st.expander("View extracted questions"):
                                     st.text_area("Questions from Selected Papers:", 
                                             value=model_questions_text, 
@@ -2628,16 +3485,16 @@ def main():
                                                     key="model_questions_uploader",
                                                     help="This will help the AI generate questions in your preferred style")
                 
-                # Combine questions from both sources
-                combined_model_questions = ""
+                # Combine questions from both sources; a budgeted selection of them goes into the prompt
+                exemplar_candidates = []
                 if selected_paper_paths:
-                    combined_model_questions += model_questions_text + "\n\n"
+                    exemplar_candidates.extend(get_exemplar_candidates_from_papers(selected_paper_paths))
                 
                 if model_questions_file is not None:
                     with st.spinner("Extracting model questions..."):
                         uploaded_questions = extract_model_questions(model_questions_file)
                         if uploaded_questions:
-                            combined_model_questions += uploaded_questions
+                            exemplar_candidates.extend(split_exemplar_text(uploaded_questions))
                             st.success("Successfully added questions from uploaded file")
                 
                 question_type = st.selectbox(
@@ -2663,16 +3520,68 @@ def main():
                     key="include_answers"
                 )
 
+                # Weight generation toward topics past exams keep returning to, worked out without the API
+                focus_topics = None
+                trend_subjects = get_question_store().distinct("subject")
+                if trend_subjects and st.checkbox(
+                        "Focus on High-Yield Exam Topics",
+                        value=False,
+                        key="focus_high_yield",
+                        help="Weight questions toward the topics in this material that past exams test most often"):
+                    default_subject = get_papers_subject(selected_paper_paths)
+                    focus_subject = st.selectbox(
+                        "Exam Subject:",
+                        options=trend_subjects,
+                        index=trend_subjects.index(default_subject) if default_subject in trend_subjects else 0,
+                        key="focus_subject"
+                    )
+                    focus_topics = get_exam_trends().high_yield_topics(
+                        focus_subject, st.session_state.summary, limit=FOCUS_TOPICS
+                    )
+                    if focus_topics:
+                        st.caption(f"Focusing on: {', '.join(focus_topics)}")
+                    else:
+                        st.caption("None of this subject's frequently examined topics appear in the active document.")
+                
+                exemplar_budget = EXEMPLAR_TOKEN_BUDGET
+                if exemplar_candidates:
+                    exemplar_budget = st.number_input(
+                        "Example Question Budget (tokens):",
+                        min_value=0,
+                        max_value=20000,
+                        value=EXEMPLAR_TOKEN_BUDGET,
+                        step=500,
+                        key="exemplar_budget",
+                        help="How much of the prompt the most relevant past questions may take"
+                    )
+
                 if st.button("Generate Exam Questions", key="generate_questions"):
                     with st.spinner("Generating questions..."):
-                        st.session_state.questions = generate_questions(
-                            st.session_state.summary,
-                            question_type,
-                            num_questions=num_questions,
-                            include_answers=include_answers,
-                            model_questions=combined_model_questions if combined_model_questions else None
-                        )
-                        st.session_state.exam_paper = format_exam_paper(st.session_state.questions)
+                        # Each question is shown as soon as it is complete
+                        paper_placeholder = st.empty()
+                        questions = []
+                        try:
+                            for question in generate_questions(
+                                get_active_study_document(),
+                                question_type,
+                                num_questions=num_questions,
+                                include_answers=include_answers,
+                                model_questions=exemplar_candidates if exemplar_candidates else None,
+                                exemplar_budget=exemplar_budget,
+                                focus_topics=focus_topics,
+                                stream=True
+                            ):
+                                questions.append(question)
+                                paper_placeholder.markdown(format_exam_paper(questions), unsafe_allow_html=True)
+                        except GenerationError as e:
+                            st.error(str(e))
+                        paper_placeholder.empty()
+                        # Questions from the prompts that succeeded are kept
+                        if questions:
+                            st.session_state.questions = questions
+                            st.session_state.exam_paper = format_exam_paper(questions)
+                        else:
+                            st.warning("No questions were generated. Please try again.")
 
                 if st.session_state.exam_paper:
                     col1, col2 = st.columns([0.9, 0.1])
@@ -2739,8 +3648,17 @@ def main():
                                 if not user_answer.strip():
                                     st.error("Please provide an answer before evaluation.")
                                 else:
-                                    evaluation = evaluate_answer(question, user_answer)
-                                    st.session_state[f"eval_{q_index}"] = evaluation
+                                    # Streamed while it is written, then shown with the saved evaluation below
+                                    evaluation_placeholder = st.empty()
+                                    try:
+                                        with evaluation_placeholder.container():
+                                            evaluation = st.write_stream(evaluate_answer(question, user_answer, stream=True))
+                                    except GenerationError as e:
+                                        evaluation = None
+                                        st.error(str(e))
+                                    evaluation_placeholder.empty()
+                                    if evaluation:
+                                        st.session_state[f"eval_{q_index}"] = evaluation
                         
                         with answer_tab2:
                             # File uploader for handwritten answers
@@ -2785,7 +3703,7 @@ def main():
                     if st.button("Generate Quiz", key="generate_quiz_button"):
                         with st.spinner("Creating interactive quiz..."):
                             quiz_data = generate_interactive_quiz(
-                                st.session_state.summary, 
+                                get_active_study_document(),
                                 num_questions=quiz_num_questions,
                                 difficulty=quiz_difficulty
                             )
@@ -3023,7 +3941,7 @@ def main():
                 st.markdown('<div class="section-header">Flashcards</div>', unsafe_allow_html=True)
                 if st.button("Generate Flashcards", key="generate_flashcards"):
                     with st.spinner("Generating flashcards..."):
-                        st.session_state.flashcards = generate_flashcards(st.session_state.summary)
+                        st.session_state.flashcards = generate_flashcards(get_active_study_document())
                 
                 if "flashcards" in st.session_state and st.session_state.flashcards:
                     # Display flashcards
@@ -3102,7 +4020,7 @@ def main():
                 st.markdown('<div class="section-header">Mind Map</div>', unsafe_allow_html=True)
                 if st.button("Generate Mind Map", key="generate_mindmap"):
                     with st.spinner("Generating mind map..."):
-                        mind_map_data = generate_mind_map_data(st.session_state.summary)
+                        mind_map_data = generate_mind_map_data(get_active_study_document())
                         if mind_map_data:
                             st.session_state.mind_map = mind_map_data
                 
@@ -3248,7 +4166,7 @@ def main():
                 
                 if st.button("Generate Mind Palace", key="generate_mindpalace"):
                     with st.spinner("Creating your Mind Palace..."):
-                        mind_palace_data = generate_mind_palace(st.session_state.summary)
+                        mind_palace_data = generate_mind_palace(get_active_study_document())
                         if mind_palace_data:
                             st.session_state.mind_palace = mind_palace_data
                             st.success("Mind Palace created successfully!")
@@ -3675,7 +4593,7 @@ def main():
                         with st.spinner("Analyzing your reflection..."):
                             try:
                                 # Initialize the Gemini model
-                                model = setup_google_api()
+                                model = get_gemini_model()
                                 if model:
                                     # Create prompt for Gemini
                                     prompt = f"""
@@ -3878,7 +4796,7 @@ def main():
                 with st.spinner("Analyzing your reflection..."):
                     try:
                         # Initialize the Gemini model
-                        model = setup_google_api()
+                        model = get_gemini_model()
                         if model:
                             # Create prompt for Gemini
                             prompt = f"""
@@ -0,0 +1,203 @@
+import os
+import math
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from document import Document, PAGE_SEPARATOR
+from near_duplicates import is_near_duplicate, minhash_signature
+
+# Study text sent with each generation prompt, the length generators used to truncate to
+CHUNK_CHARS = int(os.getenv("GENERATION_CHUNK_CHARS", "30000"))
+# Longer documents get larger chunks rather than more of them
+MAX_CHUNKS = int(os.getenv("GENERATION_MAX_CHUNKS", "8"))
+
+
+class GenerationError(Exception):
+    """Raised by streamed generators when the model gives no usable answer."""
+
+
+def _split_text(text, max_chars):
+    """Split text at paragraph breaks into pieces of at most max_chars; longer paragraphs are cut."""
+    pieces = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        while len(paragraph) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + 2 + len(paragraph) > max_chars:
+            pieces.append(current)
+            current = ""
+        current = current + "\n\n" + paragraph if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_chunks(source, max_chars=CHUNK_CHARS, max_chunks=MAX_CHUNKS):
+    """Split study material into chunks of whole pages for generating from each chunk separately.
+
+    Pages are kept together wherever they fit; text without pages, and
+    pages longer than a chunk, are split at paragraph breaks. Chunks grow
+    beyond max_chars when that keeps their number near max_chunks.
+
+    Args:
+        source: Document, or plain study text
+        max_chars: Preferred chunk size in characters
+        max_chunks: Number of chunks a long document is held to, approximately
+
+    Returns:
+        list: (label, text) pairs in reading order; one chunk when everything fits
+    """
+    document = source if isinstance(source, Document) else Document.from_text("Study material", source)
+    size = max(max_chars, math.ceil(len(document.text) / max(max_chunks, 1)))
+
+    # (first page, last page, text) units no longer than a chunk
+    units = []
+    for page in document.pages():
+        for piece in _split_text(page.text, size) if len(page.text) > size else [page.text]:
+            units.append((page.number, page.number, piece))
+
+    chunks = []
+    for first_page, last_page, text in units:
+        if chunks and len(chunks[-1][2]) + len(PAGE_SEPARATOR) + len(text) <= size:
+            chunks[-1] = (chunks[-1][0], last_page, chunks[-1][2] + PAGE_SEPARATOR + text)
+        else:
+            chunks.append((first_page, last_page, text))
+
+    if document.page_count <= 1:
+        return [(f"Part {i}", text) for i, (_, _, text) in enumerate(chunks, 1)]
+    return [
+        (f"Pages {first_page}-{last_page}" if first_page != last_page else f"Page {first_page}", text)
+        for first_page, last_page, text in chunks
+    ]
+
+
+def allocate(total, chunks):
+    """Share a number of items between chunks in proportion to their length.
+
+    Args:
+        total: Number of items to generate, e.g. questions
+        chunks: (label, text) pairs from split_chunks
+
+    Returns:
+        list: Items per chunk, summing to total; shorter chunks may get none
+    """
+    lengths = [len(text) for _, text in chunks]
+    whole = sum(lengths) or 1
+    counts = []
+    allocated = 0
+    cumulative = 0
+    # Rounding the running total spreads a few items evenly over many chunks
+    for length in lengths:
+        cumulative += length
+        target = math.floor(total * cumulative / whole + 0.5)
+        counts.append(target - allocated)
+        allocated = target
+    return counts
+
+
+def _worker_count(model, prompts):
+    """Return how many prompts to run at once: no more than the gateway lets reach the API."""
+    return max(1, min(len(prompts), getattr(model, "max_concurrency", len(prompts))))
+
+
+def generate_all(model, prompts):
+    """Send prompts at the same time and collect the response texts in prompt order.
+
+    No more threads are started than the gateway behind the model lets
+    reach the API at once.
+
+    Args:
+        model: Model returned by get_gemini_model
+        prompts: Prompt strings
+
+    Returns:
+        tuple: (response texts, None where a prompt failed; error messages)
+    """
+    def generate(prompt):
+        return model.generate_content(prompt).text
+
+    with ThreadPoolExecutor(max_workers=_worker_count(model, prompts), thread_name_prefix="chunked-generation") as executor:
+        futures = [executor.submit(generate, prompt) for prompt in prompts]
+    texts, errors = [], []
+    for future in futures:
+        try:
+            texts.append(future.result())
+        except Exception as e:
+            texts.append(None)
+            errors.append(str(e))
+    return texts, errors
+
+
+def stream_all(model, prompts):
+    """Start streaming every prompt at once.
+
+    Each response is buffered as it arrives, so the returned iterators can
+    be read one after another: the first is live, and the later ones catch
+    up with what has already arrived. Prompts beyond the gateway's
+    concurrency start as earlier ones finish.
+
+    Args:
+        model: Model returned by get_gemini_model
+        prompts: Prompt strings
+
+    Returns:
+        list: One iterator of text chunks per prompt, in prompt order; an
+        iterator raises its prompt's error when it reaches it
+    """
+    buffers = [queue.Queue() for _ in prompts]
+
+    def produce(prompt, buffer):
+        try:
+            for text in model.stream_content(prompt):
+                buffer.put(text)
+        except Exception as e:
+            buffer.put(e)
+        finally:
+            buffer.put(None)
+
+    def consume(buffer):
+        item = buffer.get()
+        while item is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            item = buffer.get()
+
+    executor = ThreadPoolExecutor(max_workers=_worker_count(model, prompts), thread_name_prefix="chunked-stream")
+    for prompt, buffer in zip(prompts, buffers):
+        executor.submit(produce, prompt, buffer)
+    # The workers finish on their own; nothing waits for them here
+    executor.shutdown(wait=False)
+    return [consume(buffer) for buffer in buffers]
+
+
+class NearDuplicateFilter:
+    """Remembers the texts seen so far and tells whether a new one repeats any of them."""
+
+    def __init__(self):
+        self._signatures = []
+
+    def is_new(self, text):
+        """Return True, and remember the text, unless it is a near-duplicate of an earlier one."""
+        signature = minhash_signature(text)
+        if signature is None:
+            return True
+        if any(is_near_duplicate(signature, seen) for seen in self._signatures):
+            return False
+        self._signatures.append(signature)
+        return True
+
+
+def remove_near_duplicates(items, key=None):
+    """Keep the first of each group of near-duplicate items, in their original order.
+
+    Args:
+        items: Items to filter
+        key: Function returning the text to compare for an item; the item itself by default
+    """
+    seen = NearDuplicateFilter()
+    return [item for item in items if seen.is_new(key(item) if key else item)]
@@ -0,0 +1,142 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import time
+
+# Root directory for all on-disk caches
+CACHE_ROOT = os.getenv("CACHE_DIR", ".cache")
+
+
+class DiskCache:
+    """A size-bounded LRU cache of JSON values stored as files on disk.
+
+    Each entry lives in its own file named after the SHA-256 of its key, so the
+    cache is shared by every session and every process pointing at the same
+    directory. File modification times record recency: a hit touches the file,
+    and eviction removes the least recently used files first. Entries of a
+    cache with a TTL also record when they were written and count as misses
+    once they are older than the TTL.
+    """
+
+    def __init__(self, name, max_bytes, ttl_seconds=None):
+        """
+        Args:
+            name: Subdirectory of CACHE_ROOT that holds this cache's entries
+            max_bytes: Total size the cache may grow to before evicting entries
+            ttl_seconds: Optional age after which entries expire
+        """
+        self.directory = os.path.join(CACHE_ROOT, name)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".json")
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.ttl_seconds is not None:
+            # Recency lives in the file's modification time, so the write time is kept in the entry
+            if not isinstance(value, dict) or time.time() - value.get("stored_at", 0) > self.ttl_seconds:
+                self.delete(key)
+                return None
+            value = value.get("value")
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def contains(self, key):
+        """Return True if an entry for key exists, without reading it or refreshing its recency.
+
+        Entries of a cache with a TTL may have expired; only get() checks that.
+        """
+        return os.path.exists(self._path(key))
+
+    def set(self, key, value):
+        """Store a JSON-serialisable value under key, evicting old entries if needed."""
+        path = self._path(key)
+        if self.ttl_seconds is not None:
+            value = {"stored_at": time.time(), "value": value}
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return False
+
+        # Write to a temporary file first so readers never see a partial entry
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing cache entry: {str(e)}")
+            return False
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += len(data) - previous_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+        return True
+
+    def delete(self, key):
+        """Remove the entry for key if it exists."""
+        try:
+            os.remove(self._path(key))
+            with self._lock:
+                self._total_bytes = None
+        except OSError:
+            pass
+
+    def clear(self):
+        """Remove every entry in this cache."""
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            self._total_bytes = 0
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                except OSError:
+                    continue
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._total_bytes = total
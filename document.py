@@ -0,0 +1,136 @@
+from array import array
+from bisect import bisect_right
+
+# Separator placed between pages when a document is read as one string
+PAGE_SEPARATOR = "\n\n"
+
+
+class Page:
+    """A single page of extracted text."""
+
+    __slots__ = ("number", "text")
+
+    def __init__(self, number, text):
+        self.number = number
+        self.text = text
+
+    def __repr__(self):
+        return f"Page({self.number}, {len(self.text)} chars)"
+
+
+class Document:
+    """Extracted text of a document, kept page by page.
+
+    Page texts are stored once and shared between a document and every slice
+    taken from it. The character offset at which each page starts in the
+    concatenated text is kept in a compact array, so page lookups are a binary
+    search and the full string is only built the first time it is asked for.
+    """
+
+    __slots__ = ("name", "image_pages", "unextracted_pages", "_numbers", "_texts", "_offsets", "_text")
+
+    def __init__(self, name, pages, image_pages=(), unextracted_pages=()):
+        """
+        Args:
+            name: Display name of the document, usually the uploaded file name
+            pages: Iterable of (page_number, text) pairs in reading order
+            image_pages: Page numbers that hold only images and have no text layer
+            unextracted_pages: Page numbers of the source that have not been extracted yet
+        """
+        self.name = name
+        self.image_pages = tuple(image_pages)
+        self.unextracted_pages = tuple(unextracted_pages)
+        self._numbers = array("l")
+        self._texts = []
+        self._offsets = array("q")
+        self._text = None
+
+        offset = 0
+        for number, text in pages:
+            self._numbers.append(number)
+            self._texts.append(text)
+            self._offsets.append(offset)
+            offset += len(text) + len(PAGE_SEPARATOR)
+
+    @classmethod
+    def from_text(cls, name, text):
+        """Wrap text without page information as a single-page document."""
+        return cls(name, [(1, text)] if text else [])
+
+    @property
+    def text(self):
+        """The whole document as one string, built lazily and then reused."""
+        if self._text is None:
+            self._text = PAGE_SEPARATOR.join(self._texts)
+        return self._text
+
+    @property
+    def page_count(self):
+        return len(self._texts)
+
+    @property
+    def page_numbers(self):
+        return list(self._numbers)
+
+    @property
+    def first_page(self):
+        return self._numbers[0] if self._numbers else None
+
+    @property
+    def last_page(self):
+        return self._numbers[-1] if self._numbers else None
+
+    def pages(self):
+        """Iterate over the pages of the document in reading order."""
+        for number, text in zip(self._numbers, self._texts):
+            yield Page(number, text)
+
+    def page(self, number):
+        """Return the page with the given page number, or None if it has no text."""
+        index = bisect_right(self._numbers, number) - 1
+        if index >= 0 and self._numbers[index] == number:
+            return Page(number, self._texts[index])
+        return None
+
+    def page_at_offset(self, offset):
+        """Return the page containing a character offset of the concatenated text."""
+        index = bisect_right(self._offsets, offset) - 1
+        if index < 0:
+            return None
+        return Page(self._numbers[index], self._texts[index])
+
+    def slice_pages(self, first, last):
+        """Return a document holding only pages first..last (inclusive page numbers).
+
+        The page strings are shared with this document rather than copied.
+        """
+        start = bisect_right(self._numbers, first - 1)
+        stop = bisect_right(self._numbers, last)
+        image_pages = [n for n in self.image_pages if first <= n <= last]
+        unextracted_pages = [n for n in self.unextracted_pages if first <= n <= last]
+        return Document(
+            self.name, zip(self._numbers[start:stop], self._texts[start:stop]), image_pages, unextracted_pages
+        )
+
+    def merge(self, other):
+        """Return a document holding the pages of both documents in page order.
+
+        Used when more pages of a partly extracted source arrive; where both
+        documents have a page, the text from other wins.
+        """
+        pages = dict(zip(self._numbers, self._texts))
+        pages.update(zip(other._numbers, other._texts))
+        image_pages = sorted(set(self.image_pages) | set(other.image_pages))
+        unextracted_pages = sorted(set(self.unextracted_pages) & set(other.unextracted_pages))
+        return Document(self.name, sorted(pages.items()), image_pages, unextracted_pages)
+
+    def __len__(self):
+        if not self._texts:
+            return 0
+        return self._offsets[-1] + len(self._texts[-1])
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"Document({self.name!r}, {self.page_count} pages)"
@@ -0,0 +1,197 @@
+import math
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from paper_search import tokenize
+
+# Pages per section when the study material has no chapters, and the most sections shown
+SECTION_PAGES = 5
+MAX_SECTIONS = 20
+# Single-page text, e.g. combined documents, is split into sections of about this size
+SECTION_CHARS = 6000
+# A question counts towards its best-matching section only at this cosine similarity or above
+MIN_COVERAGE_SIMILARITY = 0.15
+UNKNOWN_TERM = "Unknown"
+
+
+def split_sections(document, chapters=None):
+    """Split study material into labelled sections for the coverage matrix.
+
+    Args:
+        document: Document holding the study material
+        chapters: Optional (title, first_page, last_page) outline entries
+
+    Returns:
+        list: (label, text) pairs, without empty sections
+    """
+    sections = []
+    if chapters:
+        for title, first_page, last_page in chapters:
+            sections.append((title, document.slice_pages(first_page, last_page).text))
+    elif document.page_count > 1:
+        numbers = document.page_numbers
+        size = max(SECTION_PAGES, math.ceil(len(numbers) / MAX_SECTIONS))
+        for i in range(0, len(numbers), size):
+            first_page, last_page = numbers[i], numbers[min(i + size, len(numbers)) - 1]
+            label = f"Pages {first_page}-{last_page}" if first_page != last_page else f"Page {first_page}"
+            sections.append((label, document.slice_pages(first_page, last_page).text))
+    else:
+        current = ""
+        for paragraph in document.text.split("\n\n"):
+            if current and len(current) + len(paragraph) > SECTION_CHARS:
+                sections.append((f"Part {len(sections) + 1}", current))
+                current = ""
+            current += paragraph + "\n\n"
+        sections.append((f"Part {len(sections) + 1}", current))
+        if len(sections) > MAX_SECTIONS:
+            # Merge neighbouring parts so the heat map stays readable
+            size = math.ceil(len(sections) / MAX_SECTIONS)
+            sections = [
+                (f"Part {i // size + 1}", "".join(text for _, text in sections[i:i + size]))
+                for i in range(0, len(sections), size)
+            ]
+    return [(label, text) for label, text in sections if text.strip()]
+
+
+def term_sort_key(term):
+    """Sort exam terms such as "Nov 2023" chronologically, unknown terms last."""
+    for date_format in ("%b %Y", "%B %Y"):
+        try:
+            return (0, datetime.strptime(term, date_format))
+        except (TypeError, ValueError):
+            continue
+    return (1, datetime.max)
+
+
+class CoverageMatrix:
+    """Sparse TF-IDF matrix of the stored past-paper questions.
+
+    The question-term matrix is kept in coordinate form (row, column and
+    weight arrays) and rebuilt only when the question store changes. Study
+    sections are scored against every question at once with array
+    operations, and only the first question of each near-duplicate cluster
+    is counted.
+    """
+
+    def __init__(self, store):
+        """
+        Args:
+            store: QuestionStore providing the segmented questions
+        """
+        self.store = store
+        self._vocabulary = {}
+        self._rows = np.empty(0, dtype=np.int32)
+        self._columns = np.empty(0, dtype=np.int32)
+        self._weights = np.empty(0, dtype=np.float32)
+        self._idf = np.empty(0, dtype=np.float32)
+        self._subjects = np.empty(0, dtype=object)
+        self._terms = np.empty(0, dtype=object)
+        self._question_count = 0
+        self._built_version = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Rebuild the question matrix if the store changed since the last build."""
+        with self._lock:
+            version = self.store.version
+            if self._built_version == version:
+                return
+            rows, columns, counts = [], [], []
+            subjects, terms = [], []
+            vocabulary = {}
+            for question in self.store.query():
+                if question["cluster_id"] not in (None, question["id"]):
+                    continue
+                frequencies = {}
+                for token in tokenize(question["text"]):
+                    column = vocabulary.setdefault(token, len(vocabulary))
+                    frequencies[column] = frequencies.get(column, 0) + 1
+                if not frequencies:
+                    continue
+                row = len(subjects)
+                rows.extend([row] * len(frequencies))
+                columns.extend(frequencies)
+                counts.extend(frequencies.values())
+                subjects.append(question["subject"])
+                terms.append(question["term"] or UNKNOWN_TERM)
+
+            self._vocabulary = vocabulary
+            self._rows = np.array(rows, dtype=np.int32)
+            self._columns = np.array(columns, dtype=np.int32)
+            self._question_count = len(subjects)
+            document_frequency = np.bincount(self._columns, minlength=len(vocabulary))
+            self._idf = (np.log((self._question_count + 1) / (document_frequency + 1)) + 1).astype(np.float32)
+            weights = (1 + np.log(np.array(counts, dtype=np.float32))) * self._idf[self._columns]
+            norms = np.sqrt(np.bincount(self._rows, weights=weights * weights, minlength=self._question_count))
+            self._weights = (weights / norms[self._rows]).astype(np.float32)
+            self._subjects = np.array(subjects, dtype=object)
+            self._terms = np.array(terms, dtype=object)
+            self._built_version = version
+
+    def _section_matrix(self, sections):
+        """Return the unit-length TF-IDF vectors of the sections as a dense array."""
+        matrix = np.zeros((len(sections), len(self._vocabulary)), dtype=np.float32)
+        for i, (_, text) in enumerate(sections):
+            columns = [self._vocabulary[token] for token in tokenize(text) if token in self._vocabulary]
+            if columns:
+                counts = np.bincount(columns, minlength=len(self._vocabulary)).astype(np.float32)
+                present = counts > 0
+                matrix[i, present] = (1 + np.log(counts[present])) * self._idf[present]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    def similarities(self, sections):
+        """Return the cosine similarity of every question to every section.
+
+        Args:
+            sections: (label, text) pairs from split_sections
+
+        Returns:
+            numpy.ndarray: Questions x sections array of similarities
+        """
+        self.refresh()
+        with self._lock:
+            section_matrix = self._section_matrix(sections)
+            scores = np.zeros((self._question_count, len(sections)), dtype=np.float32)
+            # Only question terms that occur in some section contribute
+            mask = section_matrix.any(axis=0)[self._columns]
+            rows, columns, weights = self._rows[mask], self._columns[mask], self._weights[mask]
+            for i in range(len(sections)):
+                scores[:, i] = np.bincount(
+                    rows, weights=weights * section_matrix[i, columns], minlength=self._question_count
+                )
+            return scores
+
+    def coverage(self, sections, subject=None):
+        """Count, per section and exam term, the past questions that tested each section.
+
+        Each question counts once, towards the section it matches best, and
+        only if that match reaches MIN_COVERAGE_SIMILARITY.
+
+        Args:
+            sections: (label, text) pairs from split_sections
+            subject: Only count questions from this subject folder
+
+        Returns:
+            tuple: (section labels, exam terms in date order, sections x terms
+            array of question counts)
+        """
+        if not sections:
+            return [], [], np.zeros((0, 0), dtype=np.int32)
+        scores = self.similarities(sections)
+        with self._lock:
+            subjects, terms = self._subjects, self._terms
+        keep = np.ones(len(terms), dtype=bool) if subject is None else subjects == subject
+        best_section = scores.argmax(axis=1)
+        keep &= scores[np.arange(len(scores)), best_section] >= MIN_COVERAGE_SIMILARITY
+
+        term_labels = sorted(set(terms[keep]), key=term_sort_key)
+        term_index = {term: i for i, term in enumerate(term_labels)}
+        counts = np.zeros((len(sections), len(term_labels)), dtype=np.int32)
+        if term_labels:
+            term_columns = np.array([term_index[term] for term in terms[keep]], dtype=np.int32)
+            np.add.at(counts, (best_section[keep], term_columns), 1)
+        return [label for label, _ in sections], term_labels, counts
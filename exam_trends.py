@@ -0,0 +1,197 @@
+import re
+import threading
+
+import pandas as pd
+
+# Statutory references make the most precise topics: "Ind AS 116", "SA 230", "Section 17(5)", "Rule 42"
+REFERENCE_PATTERN = re.compile(
+    r"\b(Ind\s?AS\s?\d{1,3}|AS\s?\d{1,2}|SA\s?\d{3}|SQC\s?\d|Section\s+\d+[A-Z]*(?:\(\d+\))?|Rule\s+\d+[A-Z]*|CARO)\b"
+)
+WORD_PATTERN = re.compile(r"[a-z]{3,}")
+# Words too common in exam questions to say anything about the topic
+TOPIC_STOP_WORDS = frozenset("""
+    about above additional advise after against all also amount amounts and answer answers any appropriate april
+    are assume assuming attempt august balance based been being below between both brief briefly but can case
+    cases certain comment companies company compute consider considering correct could crore date dated days
+    december decide details determine discuss does done due during each either ended ending examination examine
+    explain facts february final following for from further given has have having her here his how ill india
+    information institute into its january july june lakh lakhs limited ltd made make march marks may month
+    months not note notes november october one only other out paid paper per possible prepare provided
+    provisions question questions reasons regard relevant required respect rupees september shall should show
+    state statement statements such suitable than that the their them then there these they this those three two
+    under unit units used using various was were what when where whether which while who will with working would
+    year years you your
+""".split())
+# A phrase only becomes a topic once it appears in this many papers of a subject
+MIN_TOPIC_PAPERS = 2
+# Phrases found in more than this share of a subject's questions are too general to be topics
+MAX_TOPIC_SHARE = 0.2
+# Lines repeated in this many questions of one paper are running headers, not question text
+HEADER_MIN_REPEATS = 3
+UNKNOWN_TERM = "Unknown"
+PHRASE_COLUMNS = ["question_id", "cluster_id", "relative_path", "subject", "term", "marks", "topic"]
+
+
+def extract_topic_phrases(text):
+    """Return the candidate topic phrases of a question: statutory references and word pairs."""
+    phrases = {re.sub(r"\s+", " ", reference) for reference in REFERENCE_PATTERN.findall(text)}
+    words = [word for word in WORD_PATTERN.findall(text.lower()) if word not in TOPIC_STOP_WORDS]
+    phrases.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+    return phrases
+
+
+class ExamTrends:
+    """Topic statistics of the past-paper questions, held in pandas frames.
+
+    Candidate phrases are extracted once per paper and kept until the paper
+    changes; when the question store changes, only new or changed papers are
+    read again and the aggregate tables are recomputed from the cached
+    phrases. Questions repeated in the same term, such as the English and
+    Hindi versions of a paper, are counted once.
+    """
+
+    def __init__(self, store):
+        """
+        Args:
+            store: QuestionStore providing the segmented questions
+        """
+        self.store = store
+        # relative path -> (paper key, frame of question phrases)
+        self._papers = {}
+        self._topics = pd.DataFrame()
+        self._table = pd.DataFrame()
+        self._built_version = None
+        self._lock = threading.Lock()
+
+    def _paper_phrases(self, relative_path):
+        questions = self.store.query(relative_paths=[relative_path])
+        # Page headers such as the paper title land inside every question that crosses a page break
+        line_counts = {}
+        for question in questions:
+            for line in {line.strip() for line in question["text"].split("\n") if line.strip()}:
+                line_counts[line] = line_counts.get(line, 0) + 1
+        headers = {line for line, count in line_counts.items() if count >= HEADER_MIN_REPEATS}
+
+        rows = []
+        for question in questions:
+            text = "\n".join(line for line in question["text"].split("\n") if line.strip() not in headers)
+            for phrase in extract_topic_phrases(text):
+                rows.append({
+                    "question_id": question["id"],
+                    "cluster_id": question["cluster_id"] or question["id"],
+                    "relative_path": relative_path,
+                    "subject": question["subject"],
+                    "term": question["term"] or UNKNOWN_TERM,
+                    "marks": question["marks"] or 0,
+                    "topic": phrase,
+                })
+        return pd.DataFrame(rows, columns=PHRASE_COLUMNS)
+
+    def refresh(self):
+        """Bring the tables up to date with the question store."""
+        with self._lock:
+            version = self.store.version
+            if self._built_version == version:
+                return
+            stored = {
+                relative_path: (paper["paper_hash"], paper["segmenter_version"], paper["question_count"])
+                for relative_path, paper in self.store.papers().items()
+            }
+            for relative_path in list(self._papers):
+                if relative_path not in stored:
+                    del self._papers[relative_path]
+            for relative_path, key in stored.items():
+                if self._papers.get(relative_path, (None,))[0] != key:
+                    self._papers[relative_path] = (key, self._paper_phrases(relative_path))
+            # Cluster ids move when any paper changes, so they are read fresh
+            clusters = self.store.clusters()
+            frames = [frame for _, frame in self._papers.values() if not frame.empty]
+            phrases = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=PHRASE_COLUMNS)
+            phrases["cluster_id"] = phrases["question_id"].map(clusters).fillna(phrases["cluster_id"])
+            self._topics = self._select_topics(phrases)
+            self._table = self._summarise(self._topics)
+            self._built_version = version
+
+    def _select_topics(self, phrases):
+        """Keep the phrases that recur across papers of a subject without being generic."""
+        phrases = phrases.drop_duplicates(["cluster_id", "term", "topic"])
+        questions_per_subject = phrases.groupby("subject", dropna=False)["question_id"].nunique()
+        stats = phrases.groupby(["subject", "topic"], dropna=False).agg(
+            papers=("relative_path", "nunique"), questions=("question_id", "nunique")
+        ).reset_index()
+        stats["share"] = stats["questions"] / stats["subject"].map(questions_per_subject).to_numpy()
+        keep = stats[(stats["papers"] >= MIN_TOPIC_PAPERS) & (stats["share"] <= MAX_TOPIC_SHARE)]
+        topics = phrases.merge(keep[["subject", "topic"]], on=["subject", "topic"])
+        # A question's marks are shared between its topics
+        topics["marks"] = topics["marks"] / topics.groupby("question_id")["topic"].transform("count")
+        topics["term_date"] = pd.to_datetime(topics["term"], format="%b %Y", errors="coerce")
+        return topics
+
+    @staticmethod
+    def _summarise(topics):
+        """Aggregate per subject and topic: frequency, marks weight and recurrence."""
+        columns = ["subject", "topic", "questions", "terms", "marks", "first_asked", "last_asked",
+                   "mean_interval_months", "yield_score"]
+        if topics.empty:
+            return pd.DataFrame(columns=columns)
+        table = topics.groupby(["subject", "topic"], dropna=False).agg(
+            questions=("cluster_id", "nunique"),
+            terms=("term", "nunique"),
+            marks=("marks", "sum"),
+            first_asked=("term_date", "min"),
+            last_asked=("term_date", "max"),
+        ).reset_index()
+
+        # Months between consecutive terms in which each topic was asked
+        asked = topics.dropna(subset=["term_date"]).drop_duplicates(["subject", "topic", "term_date"])
+        asked = asked.sort_values("term_date")
+        months = asked["term_date"].dt.year * 12 + asked["term_date"].dt.month
+        asked = asked.assign(interval=months.groupby([asked["subject"], asked["topic"]], dropna=False).diff())
+        intervals = asked.groupby(["subject", "topic"], dropna=False)["interval"].mean().rename("mean_interval_months")
+        table = table.merge(intervals.reset_index(), on=["subject", "topic"], how="left")
+
+        # Share of a subject's terms in which the topic was asked, plus its share of the subject's marks
+        subject_terms = topics.groupby("subject", dropna=False)["term"].nunique()
+        subject_marks = table.groupby("subject", dropna=False)["marks"].transform("sum").replace(0, 1)
+        table["yield_score"] = (
+            table["terms"] / table["subject"].map(subject_terms).to_numpy() + table["marks"] / subject_marks
+        )
+        return table.sort_values(["subject", "yield_score"], ascending=[True, False])[columns].reset_index(drop=True)
+
+    def topic_table(self, subject=None):
+        """Return the topic statistics, optionally for one subject, highest yield first."""
+        self.refresh()
+        table = self._table
+        if subject is not None:
+            table = table[table["subject"] == subject]
+        return table.reset_index(drop=True)
+
+    def topic_frequency(self, subject=None):
+        """Return the number of questions per topic and exam term as a topics x terms frame."""
+        self.refresh()
+        topics = self._topics
+        if subject is not None:
+            topics = topics[topics["subject"] == subject]
+        if topics.empty:
+            return pd.DataFrame()
+        frequency = topics.pivot_table(index="topic", columns="term", values="cluster_id", aggfunc="nunique", fill_value=0)
+        terms = topics.drop_duplicates("term").sort_values("term_date")["term"]
+        return frequency[list(terms)]
+
+    def high_yield_topics(self, subject, text=None, limit=10):
+        """Return the highest-yield topics of a subject, optionally only those that occur in a text.
+
+        Args:
+            subject: Subject folder, e.g. "5. IDT"
+            text: Study text the topics must appear in
+            limit: Maximum number of topics
+
+        Returns:
+            list: Topic phrases, highest yield first
+        """
+        table = self.topic_table(subject)
+        topics = table["topic"].tolist()
+        if text is not None:
+            present = extract_topic_phrases(text)
+            topics = [topic for topic in topics if topic in present]
+        return topics[:limit]
@@ -0,0 +1,175 @@
+import os
+import math
+
+from near_duplicates import cluster_texts
+from paper_search import tokenize
+from question_store import QUESTION_HEADING_PATTERN, classify_question
+
+# Prompt tokens spent on example questions per generation request
+EXEMPLAR_TOKEN_BUDGET = int(os.getenv("EXEMPLAR_TOKEN_BUDGET", "3000"))
+# Rough characters per token, used to size the prompt without a tokenizer
+CHARS_PER_TOKEN = 4
+# No single example may take more than this share of the budget; longer ones are cut
+MAX_EXEMPLAR_SHARE = 0.4
+# Weight given to novelty over relevance when picking the next example (maximal marginal relevance)
+DIVERSITY_WEIGHT = 0.3
+# Untitled text is split into chunks of about this size
+CHUNK_CHARS = 1500
+
+
+def estimate_tokens(text):
+    """Estimate how many prompt tokens a piece of text costs."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_exemplar_text(text):
+    """Split raw model-question text into candidate examples.
+
+    The text is split at question headings; text without headings is split
+    into paragraph-aligned chunks instead.
+
+    Args:
+        text: Extracted text of a question paper
+
+    Returns:
+        list: Candidate dicts with text and question_type
+    """
+    starts = [match.start() for match in QUESTION_HEADING_PATTERN.finditer(text)]
+    if len(starts) >= 2:
+        chunks = [text[start:end] for start, end in zip([0] + starts, starts + [len(text)])]
+    else:
+        chunks = []
+        current = ""
+        for paragraph in text.split("\n\n"):
+            if current and len(current) + len(paragraph) > CHUNK_CHARS:
+                chunks.append(current)
+                current = ""
+            current += paragraph + "\n\n"
+        chunks.append(current)
+    return [
+        {"text": chunk.strip(), "question_type": classify_question(chunk.strip())}
+        for chunk in chunks if chunk.strip()
+    ]
+
+
+def _tfidf_vectors(texts):
+    """Return unit-length TF-IDF vectors, as term-to-weight dicts, for a list of texts."""
+    term_counts = []
+    document_frequency = {}
+    for text in texts:
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        term_counts.append(counts)
+        for token in counts:
+            document_frequency[token] = document_frequency.get(token, 0) + 1
+
+    vectors = []
+    for counts in term_counts:
+        vector = {
+            token: (1 + math.log(count)) * (math.log((len(texts) + 1) / (document_frequency[token] + 1)) + 1)
+            for token, count in counts.items()
+        }
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vectors.append({token: weight / norm for token, weight in vector.items()})
+    return vectors
+
+
+def _cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(token, 0.0) for token, weight in a.items())
+
+
+def _shorten(text, max_chars):
+    """Cut text to at most max_chars, at a line break where possible."""
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + "\n…"
+
+
+def select_exemplars(candidates, document_text, question_type=None, budget_tokens=EXEMPLAR_TOKEN_BUDGET):
+    """Pick a small, relevant and varied set of example questions that fits a token budget.
+
+    Near-duplicate candidates are collapsed to the most relevant copy, and
+    the rest are ranked by TF-IDF similarity to the study text. Picks are
+    made round-robin across question types, with two per round for the
+    requested type, and each pick trades relevance against similarity to the
+    examples already chosen so near-identical questions are not repeated.
+
+    Args:
+        candidates: Candidate dicts with text, question_type and, for stored
+            questions, cluster_id
+        document_text: Text the questions will be generated from
+        question_type: Requested question type, or None/"Mixed" for no preference
+        budget_tokens: Maximum estimated tokens of the selected examples
+
+    Returns:
+        list: Selected candidate dicts, with text shortened where needed
+    """
+    max_chars = int(budget_tokens * MAX_EXEMPLAR_SHARE * CHARS_PER_TOKEN)
+    pool = []
+    seen = set()
+    for candidate in candidates:
+        text = _shorten(candidate["text"].strip(), max_chars)
+        if text and text not in seen:
+            seen.add(text)
+            pool.append(dict(candidate, text=text))
+    if not pool or budget_tokens <= 0:
+        return []
+
+    vectors = _tfidf_vectors([document_text] + [candidate["text"] for candidate in pool])
+    document_vector = vectors[0]
+    for candidate, vector in zip(pool, vectors[1:]):
+        candidate["_vector"] = vector
+        candidate["_relevance"] = _cosine(document_vector, vector)
+
+    # Near-duplicates collapse to their most relevant copy; stored questions carry a cluster id already
+    unclustered = [candidate for candidate in pool if candidate.get("cluster_id") is None]
+    for candidate, cluster_id in zip(unclustered, cluster_texts([candidate["text"] for candidate in unclustered])):
+        candidate["_cluster"] = ("text", cluster_id)
+    groups = {}
+    seen_clusters = set()
+    for candidate in sorted(pool, key=lambda candidate: candidate["_relevance"], reverse=True):
+        cluster = candidate.get("_cluster", ("store", candidate.get("cluster_id")))
+        if cluster in seen_clusters:
+            continue
+        seen_clusters.add(cluster)
+        groups.setdefault(candidate["question_type"], []).append(candidate)
+    type_order = sorted(groups, key=lambda qtype: (qtype != question_type, -groups[qtype][0]["_relevance"]))
+    if question_type in groups:
+        # The requested type gets two picks per round
+        type_order.insert(1, question_type)
+
+    selected = []
+    remaining = budget_tokens
+    while True:
+        picked_this_round = False
+        for qtype in type_order:
+            best = None
+            best_score = None
+            for candidate in groups[qtype]:
+                if estimate_tokens(candidate["text"]) > remaining:
+                    continue
+                redundancy = max((_cosine(candidate["_vector"], chosen["_vector"]) for chosen in selected), default=0.0)
+                score = (1 - DIVERSITY_WEIGHT) * candidate["_relevance"] - DIVERSITY_WEIGHT * redundancy
+                if best_score is None or score > best_score:
+                    best, best_score = candidate, score
+            if best is not None:
+                groups[qtype].remove(best)
+                selected.append(best)
+                remaining -= estimate_tokens(best["text"])
+                picked_this_round = True
+        if not picked_this_round:
+            break
+
+    return [
+        {key: value for key, value in candidate.items() if not key.startswith("_")}
+        for candidate in selected
+    ]
+
+
+def format_exemplars(exemplars):
+    """Format selected examples for the prompt, each under its question type tag."""
+    return "\n\n".join(f"[{exemplar['question_type']}]\n{exemplar['text']}" for exemplar in exemplars)
@@ -0,0 +1,295 @@
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+from google.generativeai.client import configure
+from google.generativeai.generative_models import GenerativeModel
+
+# Calls in flight at once across every session of the server process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# Request quota, enforced with a token bucket that allows bursts of up to LLM_MAX_CONCURRENCY calls
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+# Time a call may take in total, including waiting for a slot and retrying
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+# Retry delays grow from the base delay up to the maximum, each drawn at random below its cap
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 20.0
+# After this many failed calls in a row the gateway refuses calls for the cooldown period
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN_SECONDS = 30.0
+
+
+class GatewayError(Exception):
+    """Raised when the gateway cannot get an answer from the model."""
+
+
+class GatewayUnavailableError(GatewayError):
+    """Raised without calling the model while the circuit breaker is open."""
+
+
+def is_retryable(error):
+    """Return True for rate-limit (429) and server (5xx) errors, which are worth retrying."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code == 429 or 500 <= code < 600
+    # Connection failures surface without an HTTP status
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at a fixed rate."""
+
+    def __init__(self, rate_per_second, capacity):
+        """
+        Args:
+            rate_per_second: Tokens added per second
+            capacity: Most tokens the bucket holds, i.e. the largest burst
+        """
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline):
+        """Take one token, waiting for a refill if needed.
+
+        Args:
+            deadline: time.monotonic() value by which the token must be taken
+
+        Returns:
+            bool: False if no token becomes available before the deadline
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Stops calls after repeated failures, then lets a single trial call through after a cooldown."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown_seconds=BREAKER_COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go ahead."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_running or time.monotonic() - self._opened_at < self.cooldown_seconds:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def release_trial(self):
+        """End a trial call that says nothing about the API, e.g. a bad request, leaving the failure count as it is."""
+        with self._lock:
+            self._trial_running = False
+
+    @property
+    def retry_after(self):
+        """Seconds until the breaker lets a trial call through; 0 when it is closed."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.cooldown_seconds - (time.monotonic() - self._opened_at))
+
+
+class LLMGateway:
+    """Single entry point for Gemini calls, shared by every session of the server process.
+
+    The API is configured and the model built once. Each call waits for a
+    free concurrency slot and a rate-limit token, is retried with jittered
+    exponential backoff on 429 and 5xx errors, and must finish within its
+    deadline. A circuit breaker fails calls fast while the API keeps failing.
+    """
+
+    def __init__(self, api_key, model_name, max_concurrency=LLM_MAX_CONCURRENCY,
+                 requests_per_minute=LLM_REQUESTS_PER_MINUTE, deadline_seconds=LLM_DEADLINE_SECONDS,
+                 max_retries=LLM_MAX_RETRIES):
+        """
+        Args:
+            api_key: Gemini API key
+            model_name: Name of the Gemini model to call
+            max_concurrency: Most calls in flight at once
+            requests_per_minute: Request quota of the API key
+            deadline_seconds: Default time limit of a call, including retries
+            max_retries: Most retries of a call after its first attempt
+        """
+        configure(api_key=api_key)
+        self.model = GenerativeModel(model_name)
+        self.model_name = self.model.model_name
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(requests_per_minute / 60, max(1, max_concurrency))
+        self.breaker = CircuitBreaker()
+
+    def generate_content(self, contents, timeout=None, **kwargs):
+        """Call generate_content on the shared model within the gateway's limits.
+
+        Args:
+            contents: Prompt text, or a list of prompt parts
+            timeout: Deadline of this call in seconds, including retries;
+                defaults to the gateway's deadline
+            **kwargs: Further generate_content arguments such as generation_config
+
+        Returns:
+            The model's response
+
+        Raises:
+            GatewayUnavailableError: If the circuit breaker is open
+            GatewayError: If the call cannot finish before its deadline
+            Exception: The model's error, once retries are exhausted or if it is not retryable
+        """
+        deadline = self._start(timeout)
+        attempt = 0
+        reported = False
+        try:
+            while True:
+                try:
+                    with self._slot(deadline):
+                        response = self.model.generate_content(contents, **self._request_kwargs(deadline, kwargs))
+                    self.breaker.record_success()
+                    reported = True
+                    return response
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        self._record_error(e)
+                        reported = True
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+        finally:
+            if not reported:
+                self.breaker.release_trial()
+
+    def stream_content(self, contents, timeout=None, **kwargs):
+        """Stream a generate_content call within the gateway's limits, yielding text as it arrives.
+
+        The concurrency slot is held until the stream ends. A failed call is
+        retried only while nothing has been yielded, since the caller may
+        already have shown the earlier chunks.
+
+        Args:
+            contents: Prompt text, or a list of prompt parts
+            timeout: Deadline of the whole stream in seconds, including retries
+            **kwargs: Further generate_content arguments such as generation_config
+
+        Yields:
+            str: Text chunks of the response
+
+        Raises:
+            The same errors as generate_content
+        """
+        deadline = self._start(timeout)
+        attempt = 0
+        started = False
+        reported = False
+        try:
+            while True:
+                try:
+                    with self._slot(deadline):
+                        response = self.model.generate_content(
+                            contents, stream=True, **self._request_kwargs(deadline, kwargs)
+                        )
+                        for chunk in response:
+                            try:
+                                text = chunk.text
+                            except ValueError:
+                                # Chunks such as the final safety verdict carry no text
+                                continue
+                            if text:
+                                started = True
+                                yield text
+                    self.breaker.record_success()
+                    reported = True
+                    return
+                except Exception as e:
+                    delay = None if started else self._retry_delay(e, attempt, deadline)
+                    if delay is None:
+                        self._record_error(e)
+                        reported = True
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+        finally:
+            # A caller that stops reading early, e.g. on a rerun, ends the call without a verdict
+            if not reported:
+                self.breaker.release_trial()
+
+    def _start(self, timeout):
+        """Return the deadline of a new call, or raise if the circuit breaker is open."""
+        if not self.breaker.allow():
+            raise GatewayUnavailableError(
+                f"Gemini API is failing repeatedly; try again in {self.breaker.retry_after:.0f} seconds."
+            )
+        return time.monotonic() + (timeout or self.deadline_seconds)
+
+    def _retry_delay(self, error, attempt, deadline):
+        """Return how long to wait before retrying a failed attempt, or None if it should not be retried."""
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+        if (isinstance(error, GatewayError) or not is_retryable(error) or attempt >= self.max_retries
+                or time.monotonic() + delay >= deadline):
+            return None
+        return delay
+
+    def _record_error(self, error):
+        """Report a call's final error to the circuit breaker."""
+        # Only failures of the API count towards the breaker; a bad request only ends a trial
+        if isinstance(error, GatewayError) or is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release_trial()
+
+    @contextmanager
+    def _slot(self, deadline):
+        """Hold a concurrency slot, once one and a rate-limit token are free."""
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise GatewayError("Timed out waiting for a free Gemini API slot.")
+        try:
+            if not self._bucket.acquire(deadline):
+                raise GatewayError("Timed out waiting for the Gemini API rate limit.")
+            yield
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _request_kwargs(deadline, kwargs):
+        """Return generate_content arguments with the time left before the deadline as the request timeout."""
+        kwargs = dict(kwargs)
+        request_options = dict(kwargs.pop("request_options", None) or {})
+        request_options["timeout"] = max(1.0, deadline - time.monotonic())
+        return dict(kwargs, request_options=request_options)
@@ -0,0 +1,133 @@
+import re
+import zlib
+
+import numpy as np
+
+from paper_search import tokenize
+
+# Questions are compared as sets of overlapping five-word shingles, and separately as
+# runs of three consecutive figures, which also match an English question to its Hindi version
+SHINGLE_SIZE = 5
+NUMBER_SHINGLE_SIZE = 3
+# Questions with fewer figures than this get no figure signature
+MIN_NUMBERS = 8
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+# MinHash signature length per shingle kind, split into LSH bands of ROWS_PER_BAND values
+NUM_PERMUTATIONS = 128
+ROWS_PER_BAND = 4
+# Estimated Jaccard similarity at which two questions count as the same question
+NEAR_DUPLICATE_THRESHOLD = 0.6
+
+# Universal hash functions (a * x + b) mod p; the fixed seed keeps stored signatures comparable
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_random = np.random.default_rng(20240501)
+_HASH_A = _random.integers(1, (1 << 31) - 1, NUM_PERMUTATIONS, dtype=np.uint64)
+_HASH_B = _random.integers(0, (1 << 31) - 1, NUM_PERMUTATIONS, dtype=np.uint64)
+# Fills the half of a signature whose shingles are missing; never produced by a hash
+_EMPTY = np.uint32(0xFFFFFFFF)
+
+
+def _shingles(items, size):
+    return {" ".join(items[i:i + size]) for i in range(max(len(items) - size + 1, 1))}
+
+
+def _minhash(shingles):
+    """Return the NUM_PERMUTATIONS minimum hash values of a set of shingles."""
+    if not shingles:
+        return np.full(NUM_PERMUTATIONS, _EMPTY, dtype=np.uint32)
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64)
+    hashes %= _MERSENNE_PRIME
+    # One row per hash function, one column per shingle; products stay below 2**62
+    permuted = (np.outer(_HASH_A, hashes) + _HASH_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def minhash_signature(text):
+    """Return the MinHash signature of a text, or None if it has neither words nor figures.
+
+    Returns:
+        numpy.ndarray: 2 * NUM_PERMUTATIONS uint32 values, the word shingle
+        signature followed by the figure shingle signature
+    """
+    tokens = tokenize(text)
+    numbers = [number.replace(",", "") for number in NUMBER_PATTERN.findall(text)]
+    if len(numbers) < MIN_NUMBERS:
+        numbers = []
+    if not tokens and not numbers:
+        return None
+    return np.concatenate([
+        _minhash(_shingles(tokens, SHINGLE_SIZE) if tokens else set()),
+        _minhash(_shingles(numbers, NUMBER_SHINGLE_SIZE) if numbers else set()),
+    ])
+
+
+def signature_from_bytes(data):
+    """Rebuild a signature stored with ndarray.tobytes()."""
+    return np.frombuffer(data, dtype=np.uint32)
+
+
+def is_near_duplicate(signature, other):
+    """Return True if two signatures agree on at least NEAR_DUPLICATE_THRESHOLD of either half's values."""
+    for half in (slice(0, NUM_PERMUTATIONS), slice(NUM_PERMUTATIONS, 2 * NUM_PERMUTATIONS)):
+        if signature[half][0] != _EMPTY and other[half][0] != _EMPTY:
+            if np.mean(signature[half] == other[half]) >= NEAR_DUPLICATE_THRESHOLD:
+                return True
+    return False
+
+
+def cluster_signatures(signatures):
+    """Group near-duplicate texts using locality-sensitive hashing over their signatures.
+
+    Signatures that agree on every value of at least one band are compared,
+    and joined when their estimated Jaccard similarity over that half of the
+    signature reaches NEAR_DUPLICATE_THRESHOLD.
+
+    Args:
+        signatures: Dict of item id to MinHash signature
+
+    Returns:
+        dict: Item id to cluster id, the smallest item id in its cluster
+    """
+    ids = sorted(signatures)
+    if not ids:
+        return {}
+    matrix = np.vstack([signatures[item_id] for item_id in ids])
+    parent = list(range(len(ids)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    compared = set()
+    for half in (slice(0, NUM_PERMUTATIONS), slice(NUM_PERMUTATIONS, 2 * NUM_PERMUTATIONS)):
+        half_matrix = matrix[:, half]
+        for start in range(0, NUM_PERMUTATIONS, ROWS_PER_BAND):
+            buckets = {}
+            for i, band in enumerate(half_matrix[:, start:start + ROWS_PER_BAND]):
+                if band[0] != _EMPTY:
+                    buckets.setdefault(band.tobytes(), []).append(i)
+            for members in buckets.values():
+                i = members[0]
+                for j in members[1:]:
+                    if (half.start, i, j) in compared:
+                        continue
+                    compared.add((half.start, i, j))
+                    if np.mean(half_matrix[i] == half_matrix[j]) >= NEAR_DUPLICATE_THRESHOLD:
+                        root_i, root_j = find(i), find(j)
+                        if root_i != root_j:
+                            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    return {item_id: ids[find(i)] for i, item_id in enumerate(ids)}
+
+
+def cluster_texts(texts):
+    """Return a cluster id for each text; near-duplicates share the index of their first copy."""
+    signatures = {}
+    for i, text in enumerate(texts):
+        signature = minhash_signature(text)
+        if signature is not None:
+            signatures[i] = signature
+    clusters = cluster_signatures(signatures)
+    return [clusters.get(i, i) for i in range(len(texts))]
@@ -0,0 +1,152 @@
+import os
+import io
+import hashlib
+import threading
+from concurrent.futures import as_completed
+
+from disk_cache import DiskCache
+
+# OCR is optional: without pytesseract (and the tesseract binary) scanned pages stay empty
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:
+    pytesseract = None
+
+# Tesseract language code(s) used for OCR, e.g. "eng" or "eng+hin"
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+# Pages handed to a worker process at a time
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "4"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_MB", "128")) * 1024 * 1024
+# Bump this whenever OCR output changes so stale cache entries are ignored
+OCR_ENGINE_VERSION = "tesseract-1"
+
+_ocr_available = None
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+
+def is_ocr_available():
+    """Return True if pytesseract is installed and the tesseract binary can be run."""
+    global _ocr_available
+    if _ocr_available is None:
+        if pytesseract is None:
+            _ocr_available = False
+        else:
+            try:
+                pytesseract.get_tesseract_version()
+                _ocr_available = True
+            except Exception as e:
+                print(f"Tesseract is not available: {str(e)}")
+                _ocr_available = False
+    return _ocr_available
+
+
+def get_ocr_cache():
+    """Return the on-disk cache of OCR results, keyed by page image hash."""
+    global _ocr_cache
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = DiskCache("ocr", OCR_CACHE_MAX_BYTES)
+        return _ocr_cache
+
+
+def get_page_images(page):
+    """Return the encoded bytes of every image drawn on a scanned page.
+
+    A scanned page is already a raster image embedded in the PDF, so the
+    images are decoded straight from the page's XObjects instead of rendering
+    the page.
+
+    Args:
+        page: PyPDF2 page object
+
+    Returns:
+        list: Image file bytes in the order they appear in the page resources
+    """
+    try:
+        return [image.data for image in page.images]
+    except Exception as e:
+        print(f"Error reading page images: {str(e)}")
+        return []
+
+
+def get_page_image_key(images):
+    """Build the cache key for a page from the hash of its images."""
+    digest = hashlib.sha256()
+    for image_data in images:
+        digest.update(hashlib.sha256(image_data).digest())
+    return f"{digest.hexdigest()}:{OCR_ENGINE_VERSION}:{OCR_LANGUAGE}"
+
+
+def _ocr_page_batch(batch, language):
+    """Worker: OCR a batch of pages.
+
+    Args:
+        batch: List of (page_number, images) pairs
+        language: Tesseract language code
+
+    Returns:
+        list: (page_number, text) pairs
+    """
+    results = []
+    for page_number, images in batch:
+        texts = []
+        for image_data in images:
+            try:
+                with Image.open(io.BytesIO(image_data)) as image:
+                    texts.append(pytesseract.image_to_string(image, lang=language).strip())
+            except Exception as e:
+                print(f"Error running OCR on page {page_number}: {str(e)}")
+        results.append((page_number, "\n".join(text for text in texts if text)))
+    return results
+
+
+def ocr_pages(page_images, pool=None, progress_callback=None):
+    """OCR scanned pages in batches, serving pages seen before from the cache.
+
+    Args:
+        page_images: Dict of page number to the list of image bytes on that page
+        pool: Optional executor the batches are spread across; OCR runs in
+            this thread when it is None
+        progress_callback: Optional function called with (current, total) as pages finish
+
+    Returns:
+        dict: Page number to recognised text, for every page that has a result
+    """
+    cache = get_ocr_cache()
+    results = {}
+    pending = []
+    for page_number, images in page_images.items():
+        if not images:
+            continue
+        key = get_page_image_key(images)
+        cached_text = cache.get(key)
+        if cached_text is not None:
+            results[page_number] = cached_text
+        else:
+            pending.append((page_number, key, images))
+
+    if not pending or not is_ocr_available():
+        return results
+
+    keys = {page_number: key for page_number, key, _ in pending}
+    batches = [
+        [(page_number, images) for page_number, _, images in pending[i:i + OCR_BATCH_SIZE]]
+        for i in range(0, len(pending), OCR_BATCH_SIZE)
+    ]
+    if pool is None:
+        batch_results = (_ocr_page_batch(batch, OCR_LANGUAGE) for batch in batches)
+    else:
+        futures = [pool.submit(_ocr_page_batch, batch, OCR_LANGUAGE) for batch in batches]
+        batch_results = (future.result() for future in as_completed(futures))
+
+    pages_done = 0
+    for batch_result in batch_results:
+        for page_number, text in batch_result:
+            results[page_number] = text
+            cache.set(keys[page_number], text)
+            pages_done += 1
+            if progress_callback:
+                progress_callback(pages_done, len(pending))
+    return results
@@ -0,0 +1,205 @@
+import re
+import math
+import threading
+
+from question_papers import get_paper_name
+
+# Words in Latin or Devanagari script; Devanagari vowel signs are not \w so they are listed explicitly
+WORD_CHARACTER = "[0-9a-z\u0900-\u0963\u0966-\u097f]"
+TOKEN_PATTERN = re.compile(WORD_CHARACTER + "+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or the to was were which will with".split()
+)
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+SNIPPET_CHARS = 240
+
+
+def tokenize(text):
+    """Split text into lowercase search terms, dropping common English stop words."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def make_snippet(text, terms, length=SNIPPET_CHARS):
+    """Return the part of a question around its first matching term, with matches in bold.
+
+    Args:
+        text: Question text
+        terms: Search terms to look for
+        length: Approximate snippet length in characters
+
+    Returns:
+        str: Markdown snippet
+    """
+    if not terms:
+        return text[:length]
+    alternatives = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    # Whole terms only, so "gst" does not light up inside "cgst"
+    pattern = re.compile(f"(?<!{WORD_CHARACTER})(?:{alternatives})(?!{WORD_CHARACTER})", re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(first.start() - length // 4, 0) if first else 0
+    end = min(start + length, len(text))
+    snippet = pattern.sub(lambda match: f"**{match.group(0)}**", " ".join(text[start:end].split()))
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+class PaperSearchIndex:
+    """In-memory BM25 inverted index over the questions in a QuestionStore.
+
+    Every stored question is one search document. The index is kept in step
+    with the store paper by paper: when the store changes, only papers whose
+    content hash, segmenter version or question count differ are removed and
+    indexed again, so adding a paper never rebuilds the whole index. Results
+    are collapsed to the best-scoring question of each near-duplicate cluster.
+    """
+
+    def __init__(self, store):
+        """
+        Args:
+            store: QuestionStore providing the segmented questions
+        """
+        self.store = store
+        # term -> {question id: term frequency}
+        self._postings = {}
+        # question id -> question row plus its length in terms and its distinct terms
+        self._documents = {}
+        # relative path -> (paper key, question ids)
+        self._papers = {}
+        # question id -> near-duplicate cluster id, and cluster id -> question ids
+        self._clusters = {}
+        self._cluster_members = {}
+        self._total_length = 0
+        self._indexed_version = None
+        self._lock = threading.Lock()
+
+    def _add_question(self, row):
+        tokens = tokenize(row["text"])
+        frequencies = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+        for token, frequency in frequencies.items():
+            self._postings.setdefault(token, {})[row["id"]] = frequency
+        self._documents[row["id"]] = dict(row, length=len(tokens), terms=tuple(frequencies))
+        self._total_length += len(tokens)
+
+    def _remove_paper(self, relative_path):
+        _, question_ids = self._papers.pop(relative_path, (None, []))
+        for question_id in question_ids:
+            document = self._documents.pop(question_id)
+            self._total_length -= document["length"]
+            for token in document["terms"]:
+                postings = self._postings[token]
+                del postings[question_id]
+                if not postings:
+                    del self._postings[token]
+
+    def refresh(self):
+        """Bring the index up to date with the store.
+
+        Returns:
+            int: Number of papers indexed or removed
+        """
+        with self._lock:
+            version = self.store.version
+            if self._indexed_version == version:
+                return 0
+            stored = {
+                relative_path: (paper["paper_hash"], paper["segmenter_version"], paper["question_count"])
+                for relative_path, paper in self.store.papers().items()
+            }
+            removed = [path for path in self._papers if path not in stored]
+            changed = [path for path, key in stored.items() if self._papers.get(path, (None,))[0] != key]
+            for relative_path in removed + changed:
+                self._remove_paper(relative_path)
+            if changed:
+                rows = self.store.query(relative_paths=changed)
+                question_ids = {relative_path: [] for relative_path in changed}
+                for row in rows:
+                    self._add_question(row)
+                    question_ids[row["relative_path"]].append(row["id"])
+                for relative_path in changed:
+                    self._papers[relative_path] = (stored[relative_path], question_ids[relative_path])
+            # Clusters can change when any paper changes, so they are always reloaded
+            self._clusters = self.store.clusters()
+            self._cluster_members = {}
+            for question_id, cluster_id in self._clusters.items():
+                self._cluster_members.setdefault(cluster_id, []).append(question_id)
+            self._indexed_version = version
+            return len(removed) + len(changed)
+
+    @property
+    def size(self):
+        return len(self._documents)
+
+    def search(self, query, subject=None, term=None, limit=10):
+        """Rank stored questions against a free-text query with BM25.
+
+        Args:
+            query: Free-text query, e.g. "GST input tax credit"
+            subject: Only questions from this subject folder
+            term: Only questions from this exam term
+            limit: Maximum number of results
+
+        Returns:
+            list: Result dicts with score, paper name, subject, term, question
+                number, part, page, a Markdown snippet and the names of other
+                papers holding a near-duplicate, best match first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            document_count = len(self._documents)
+            if not document_count:
+                return []
+            average_length = self._total_length / document_count
+            scores = {}
+            for token in terms:
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for question_id, frequency in postings.items():
+                    document = self._documents[question_id]
+                    if subject is not None and document["subject"] != subject:
+                        continue
+                    if term is not None and document["term"] != term:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * document["length"] / average_length)
+                    scores[question_id] = scores.get(question_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+            matches = []
+            seen_clusters = set()
+            for question_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+                cluster_id = self._clusters.get(question_id, question_id)
+                if cluster_id in seen_clusters:
+                    continue
+                seen_clusters.add(cluster_id)
+                duplicates = sorted({
+                    get_paper_name(self._documents[member]["relative_path"])
+                    for member in self._cluster_members.get(cluster_id, [])
+                    if member in self._documents
+                    and self._documents[member]["relative_path"] != self._documents[question_id]["relative_path"]
+                })
+                matches.append((self._documents[question_id], score, duplicates))
+                if len(matches) == limit:
+                    break
+
+        return [
+            {
+                "score": score,
+                "id": document["id"],
+                "relative_path": document["relative_path"],
+                "paper": get_paper_name(document["relative_path"]),
+                "subject": document["subject"],
+                "term": document["term"],
+                "question_number": document["question_number"],
+                "part": document["part"],
+                "question_type": document["question_type"],
+                "page": document["page"],
+                "snippet": make_snippet(document["text"], terms),
+                "duplicates": duplicates,
+            }
+            for document, score, duplicates in matches
+        ]
@@ -0,0 +1,689 @@
+import os
+import io
+import re
+import mmap
+import multiprocessing
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import PyPDF2
+from PyPDF2.generic import ContentStream
+
+from ocr import get_page_images, ocr_pages
+
+# Bump this whenever extraction output changes so stale cache entries are ignored
+EXTRACTOR_VERSION = "pypdf2-4"
+
+# Number of worker processes used for parallel page extraction (0 disables it)
+PARALLEL_WORKERS = int(os.getenv("PDF_PARALLEL_WORKERS", str(os.cpu_count() or 1)))
+# Documents shorter than this are extracted serially; pool overhead outweighs the gain
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+
+# Error messages shared by every extraction entry point
+ENCRYPTED_MESSAGE = "The PDF file is encrypted and requires a password. Please upload an unencrypted version."
+WRONG_PASSWORD_MESSAGE = "The provided password could not decrypt the PDF. Please try with the correct password."
+NO_TEXT_MESSAGE = "Could not extract text from the PDF. The document might be scanned or contain only images."
+
+# Operators that show text, and operators that move to a new line
+TEXT_SHOW_OPERATORS = {b"Tj", b"TJ", b"'", b'"'}
+NEW_LINE_OPERATORS = {b"T*", b"'", b'"'}
+TEXT_MOVE_OPERATORS = {b"Td", b"TD"}
+
+# Page kinds reported by scan_page
+TEXT_PAGE = "text"
+IMAGE_PAGE = "image"
+BLANK_PAGE = "blank"
+# Text objects start with BT; inline images with BI. Neither may touch another letter.
+TEXT_OBJECT_PATTERN = re.compile(rb"(?<![A-Za-z])BT(?![A-Za-z])")
+INLINE_IMAGE_PATTERN = re.compile(rb"(?<![A-Za-z])BI(?![A-Za-z])")
+# How deeply nested form XObjects are searched for text
+MAX_FORM_DEPTH = 3
+
+# Roman numerals used by page label styles, largest first
+ROMAN_NUMERALS = [
+    (1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+    (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")
+]
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def extract_page_text(page):
+    """Extract text from a single PDF page with error handling.
+
+    Args:
+        page: PyPDF2 page object
+
+    Returns:
+        str: Extracted text or empty string if extraction fails
+    """
+    try:
+        return page.extract_text() or ""
+    except Exception:
+        return ""
+
+
+def extract_page_text_raw(page):
+    """Read the string operands of text-showing operators straight from a page.
+
+    This skips PyPDF2's font decoding and layout logic, so it recovers text from
+    pages whose fonts make extract_text fail, at the cost of ignoring encodings.
+
+    Args:
+        page: PyPDF2 page object
+
+    Returns:
+        str: Raw text of the page or empty string if it has none
+    """
+    try:
+        content = page.get_contents()
+        if content is None:
+            return ""
+        if not isinstance(content, ContentStream):
+            content = ContentStream(content, page.pdf)
+
+        text_parts = []
+        for operands, operator in content.operations:
+            if operator in TEXT_SHOW_OPERATORS:
+                for operand in operands:
+                    items = operand if isinstance(operand, list) else [operand]
+                    for item in items:
+                        if isinstance(item, str):
+                            text_parts.append(item)
+                        elif isinstance(item, bytes):
+                            text_parts.append(item.decode("latin-1"))
+                        elif isinstance(item, (int, float)) and item < -200:
+                            # Large negative kerning in a TJ array separates words
+                            text_parts.append(" ")
+            if operator in NEW_LINE_OPERATORS:
+                text_parts.append("\n")
+            elif operator in TEXT_MOVE_OPERATORS and len(operands) == 2 and operands[1] != 0:
+                # A vertical move starts a new line; a horizontal one just separates runs
+                text_parts.append("\n")
+            elif operator == b"ET":
+                text_parts.append(" ")
+        return "".join(text_parts).strip()
+    except Exception:
+        return ""
+
+
+def _content_data(content):
+    """Return the decoded bytes of a content stream or an array of content streams."""
+    if content is None:
+        return b""
+    content = content.get_object()
+    if isinstance(content, list):
+        return b"\n".join(_content_data(part) for part in content)
+    return content.get_data()
+
+
+def _scan_content(content, resources, depth=0):
+    """Look for text objects and images in a content stream and its XObjects.
+
+    Returns:
+        tuple: (has_text, has_image)
+    """
+    data = _content_data(content)
+    has_text = bool(TEXT_OBJECT_PATTERN.search(data))
+    has_image = bool(INLINE_IMAGE_PATTERN.search(data))
+
+    resources = resources.get_object() if resources is not None else {}
+    xobjects = resources.get("/XObject")
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+    for xobject in xobjects.values():
+        xobject = xobject.get_object()
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            has_image = True
+        elif subtype == "/Form" and not has_text and depth < MAX_FORM_DEPTH:
+            form_text, form_image = _scan_content(xobject, xobject.get("/Resources"), depth + 1)
+            has_text = has_text or form_text
+            has_image = has_image or form_image
+    return has_text, has_image
+
+
+def scan_page(page):
+    """Classify a page from its content stream and resources, without extracting text.
+
+    Decompressing a content stream and searching it for text objects is far
+    cheaper than extract_text, so pages that only draw images can be skipped.
+
+    Args:
+        page: PyPDF2 page object
+
+    Returns:
+        str: TEXT_PAGE, IMAGE_PAGE (images but no text) or BLANK_PAGE
+    """
+    try:
+        has_text, has_image = _scan_content(page.get_contents(), page.get("/Resources"))
+    except Exception:
+        # When in doubt, let the extractor have a go at the page
+        return TEXT_PAGE
+    if has_text:
+        return TEXT_PAGE
+    return IMAGE_PAGE if has_image else BLANK_PAGE
+
+
+def scan_pages(reader):
+    """Classify every page of a document.
+
+    Returns:
+        list: Page kind of each page in page order
+    """
+    return [scan_page(page) for page in reader.pages]
+
+
+def get_process_pool():
+    """Return the process-wide pool used for parallel page extraction."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # Spawn rather than fork: the Streamlit server process is multithreaded
+            _process_pool = ProcessPoolExecutor(
+                max_workers=PARALLEL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+
+def reset_process_pool(pool):
+    """Drop a broken pool, e.g. after a worker crashed, so the next get_process_pool() builds a new one."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _start_worker():
+    """Worker: does nothing; submitted only to start a worker process."""
+
+
+def prestart_process_pool():
+    """Start the pool's worker processes ahead of the first parallel extraction.
+
+    Spawned workers take seconds to import their modules, which would
+    otherwise be paid by the first large document.
+    """
+    if PARALLEL_WORKERS > 1:
+        pool = get_process_pool()
+        for _ in range(PARALLEL_WORKERS):
+            pool.submit(_start_worker)
+
+
+def should_extract_in_parallel(total_pages):
+    """Check whether a document is large enough to be worth a parallel extraction."""
+    return PARALLEL_WORKERS > 1 and total_pages >= PARALLEL_MIN_PAGES
+
+
+def _extract_page_range(pdf_path, start, stop, password=None, skip_pages=frozenset()):
+    """Worker: open the PDF and extract pages [start, stop) in order, leaving skipped pages empty."""
+    with open(pdf_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        if reader.is_encrypted:
+            reader.decrypt(password or "")
+        return start, [
+            "" if i + 1 in skip_pages else extract_page_text(reader.pages[i])
+            for i in range(start, stop)
+        ]
+
+
+def split_page_ranges(total_pages, num_workers):
+    """Split pages into contiguous ranges, several per worker for load balancing.
+
+    Args:
+        total_pages: Number of pages in the document
+        num_workers: Number of worker processes
+
+    Returns:
+        list: (start, stop) tuples covering every page exactly once
+    """
+    chunk_size = max(1, -(-total_pages // (num_workers * 4)))
+    return [(start, min(start + chunk_size, total_pages)) for start in range(0, total_pages, chunk_size)]
+
+
+def iter_pages_parallel(pdf_path, total_pages, password=None, skip_pages=frozenset()):
+    """Extract every page of a PDF across the process pool, yielding pages as they finish.
+
+    Each worker re-opens the file from disk, so only page numbers and text
+    cross process boundaries. Ranges are yielded in completion order, pages
+    within a range in page order. Pages that fail to extract come back as
+    empty strings, exactly like extract_page_text.
+
+    Args:
+        pdf_path: Path to the PDF file on disk
+        total_pages: Number of pages in the document
+        password: Optional password used to decrypt the PDF
+        skip_pages: Page numbers to yield as empty without extracting them
+
+    Yields:
+        tuple: (page_number, text) with 1-based page numbers
+    """
+    pool = get_process_pool()
+    futures = []
+    try:
+        futures = [
+            pool.submit(
+                _extract_page_range, pdf_path, start, stop, password,
+                frozenset(n for n in skip_pages if start < n <= stop)
+            )
+            for start, stop in split_page_ranges(total_pages, PARALLEL_WORKERS)
+        ]
+        for future in as_completed(futures):
+            start, texts = future.result()
+            for offset, text in enumerate(texts):
+                yield start + offset + 1, text
+    except BrokenProcessPool:
+        # A crashed worker breaks the pool for good; the next extraction gets a new one
+        reset_process_pool(pool)
+        raise
+    finally:
+        # Stop queued ranges if the consumer abandons the stream early
+        for future in futures:
+            future.cancel()
+
+
+def iter_page_texts(reader, pdf_file, password=None, parallel=True, pdf_path=None, skip_pages=None):
+    """Stream the text of every page as soon as it has been extracted.
+
+    Small documents are extracted serially in page order. Large ones are handed
+    to the process pool, and any pages it fails to deliver are extracted
+    serially afterwards, so every page is yielded exactly once.
+
+    Args:
+        reader: PyPDF2 PdfReader object for the file
+        pdf_file: The file object the reader was built from
+        password: Optional password used to decrypt the PDF
+        parallel: Whether large documents may be handed to the process pool
+        pdf_path: Optional path of the file on disk, so workers need no extra copy
+        skip_pages: Page numbers known to hold no text; by default pages are
+            pre-scanned and image-only or blank ones are skipped
+
+    Yields:
+        tuple: (page_number, text) with 1-based page numbers
+    """
+    total_pages = len(reader.pages)
+    if skip_pages is None:
+        skip_pages = {
+            page_number for page_number, kind in enumerate(scan_pages(reader), 1)
+            if kind != TEXT_PAGE
+        }
+    done_pages = set()
+    if parallel and should_extract_in_parallel(total_pages):
+        temp_file_path = None
+        try:
+            # Workers re-open the PDF from disk instead of receiving its bytes
+            pdf_path = pdf_path or get_file_path(pdf_file)
+            if pdf_path is None:
+                pdf_file.seek(0)
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+                    shutil.copyfileobj(pdf_file, temp_file)
+                    temp_file_path = temp_file.name
+                pdf_path = temp_file_path
+            for page_number, text in iter_pages_parallel(pdf_path, total_pages, password, skip_pages):
+                done_pages.add(page_number)
+                yield page_number, text
+        except Exception as e:
+            print(f"Parallel extraction failed, falling back to serial: {str(e)}")
+        finally:
+            if temp_file_path:
+                try:
+                    os.unlink(temp_file_path)
+                except OSError:
+                    pass
+
+    for page_number, page in enumerate(reader.pages, 1):
+        if page_number in skip_pages:
+            if page_number not in done_pages:
+                yield page_number, ""
+        elif page_number not in done_pages:
+            yield page_number, extract_page_text(page)
+
+
+def extract_all_pages(reader, pdf_file, progress_callback=None, password=None, parallel=True, pdf_path=None):
+    """Extract text from every page, spreading large documents across CPU cores.
+
+    Args:
+        reader: PyPDF2 PdfReader object for the file
+        pdf_file: The file object the reader was built from
+        progress_callback: Optional function called with (current, total) as pages finish
+        password: Optional password used to decrypt the PDF
+        parallel: Whether large documents may be handed to the process pool
+        pdf_path: Optional path of the file on disk, so workers need no extra copy
+
+    Returns:
+        list: Extracted text of each page in order, empty strings for failed pages
+    """
+    total_pages = len(reader.pages)
+    page_texts = [""] * total_pages
+    page_stream = iter_page_texts(reader, pdf_file, password, parallel, pdf_path)
+    for pages_done, (page_number, text) in enumerate(page_stream, 1):
+        page_texts[page_number - 1] = text
+        if progress_callback:
+            progress_callback(pages_done, total_pages)
+    return page_texts
+
+
+def get_file_path(pdf_file):
+    """Return the on-disk path behind a file object, or None for in-memory uploads."""
+    name = getattr(pdf_file, "name", None)
+    if isinstance(name, str) and not isinstance(pdf_file, io.BytesIO) and os.path.isfile(name):
+        return name
+    return None
+
+
+@contextmanager
+def open_spooled_pdf(pdf_file):
+    """Expose a PDF as a read-only memory-mapped stream backed by a file on disk.
+
+    Files that already live on disk are mapped in place. In-memory uploads are
+    written to a temporary file once, straight from their buffer without an
+    intermediate copy, and that file is mapped instead. Pages are then paged in
+    by the OS on demand, so parsing adds little to the process's resident memory.
+
+    Args:
+        pdf_file: The uploaded PDF file object or an open binary file
+
+    Yields:
+        tuple: (stream, path) where stream is the mmap and path the file it maps
+    """
+    pdf_path = get_file_path(pdf_file)
+    temp_file_path = None
+    try:
+        if pdf_path is None:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+                temp_file_path = temp_file.name
+                if isinstance(pdf_file, io.BytesIO):
+                    with pdf_file.getbuffer() as buffer:
+                        temp_file.write(buffer)
+                else:
+                    pdf_file.seek(0)
+                    shutil.copyfileobj(pdf_file, temp_file)
+            pdf_path = temp_file_path
+
+        if os.path.getsize(pdf_path) == 0:
+            raise ValueError("The PDF file is empty.")
+
+        with open(pdf_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as stream:
+                yield stream, pdf_path
+    finally:
+        if temp_file_path:
+            try:
+                os.unlink(temp_file_path)
+            except OSError:
+                pass
+
+
+def open_pdf_reader(pdf_file, password=None):
+    """Parse a PDF once and decrypt it if needed.
+
+    Args:
+        pdf_file: File object positioned anywhere; it is rewound before parsing
+        password: Optional password; encrypted files are also tried with an empty one
+
+    Returns:
+        tuple: (PdfReader, None) on success or (None, error message) on failure
+    """
+    pdf_file.seek(0)
+    reader = PyPDF2.PdfReader(pdf_file)
+    if reader.is_encrypted:
+        try:
+            decrypted = reader.decrypt(password or "")
+        except Exception:
+            decrypted = 0
+        if not decrypted:
+            return None, WRONG_PASSWORD_MESSAGE if password else ENCRYPTED_MESSAGE
+    return reader, None
+
+
+def _roman(number):
+    numeral = ""
+    for value, symbol in ROMAN_NUMERALS:
+        count, number = divmod(number, value)
+        numeral += symbol * count
+    return numeral
+
+
+def _letters(number):
+    # 1 -> A, 26 -> Z, 27 -> AA, as defined for page labels
+    return chr(ord("A") + (number - 1) % 26) * ((number - 1) // 26 + 1)
+
+
+PAGE_LABEL_STYLES = {
+    "/D": str,
+    "/R": _roman,
+    "/r": lambda number: _roman(number).lower(),
+    "/A": _letters,
+    "/a": lambda number: _letters(number).lower(),
+}
+
+
+def _number_tree_entries(node):
+    """Yield the (key, value) pairs of a PDF number tree."""
+    node = node.get_object()
+    nums = node.get("/Nums")
+    if nums is not None:
+        for i in range(0, len(nums) - 1, 2):
+            yield int(nums[i]), nums[i + 1].get_object()
+    for kid in node.get("/Kids", []):
+        yield from _number_tree_entries(kid)
+
+
+def read_page_labels(reader):
+    """Return the printed label of every page, e.g. "iv" or "A-3".
+
+    Returns:
+        list: One label per page, or None if the PDF defines no page labels
+    """
+    try:
+        root = reader.trailer["/Root"].get_object()
+        if "/PageLabels" not in root:
+            return None
+        label_ranges = sorted(_number_tree_entries(root["/PageLabels"]), key=lambda entry: entry[0])
+    except Exception as e:
+        print(f"Error reading page labels: {str(e)}")
+        return None
+
+    total_pages = len(reader.pages)
+    labels = [str(page_number) for page_number in range(1, total_pages + 1)]
+    for i, (start, label) in enumerate(label_ranges):
+        stop = label_ranges[i + 1][0] if i + 1 < len(label_ranges) else total_pages
+        style = PAGE_LABEL_STYLES.get(label.get("/S"))
+        prefix = label.get("/P", "")
+        first = int(label.get("/St", 1))
+        for index in range(max(start, 0), min(stop, total_pages)):
+            value = style(first + index - start) if style else ""
+            labels[index] = f"{prefix}{value}" or str(index + 1)
+    return labels
+
+
+def read_outline(reader):
+    """Return the chapters listed in a PDF's outline (bookmarks).
+
+    Top-level bookmarks are used as chapters. When there is only one, it is
+    usually the document title, so its children are used instead.
+
+    Returns:
+        list: (title, first_page, last_page) tuples in page order
+    """
+    try:
+        outline = reader.outline
+    except Exception as e:
+        print(f"Error reading outline: {str(e)}")
+        return []
+
+    entries = [item for item in outline if not isinstance(item, list)]
+    if len(entries) < 2:
+        children = next((item for item in outline if isinstance(item, list)), None)
+        if children:
+            entries = [item for item in children if not isinstance(item, list)]
+
+    starts = []
+    for entry in entries:
+        try:
+            starts.append((reader.get_destination_page_number(entry) + 1, str(entry.title)))
+        except Exception:
+            continue
+    starts.sort(key=lambda start: start[0])
+
+    total_pages = len(reader.pages)
+    chapters = []
+    for i, (first_page, title) in enumerate(starts):
+        next_page = starts[i + 1][0] if i + 1 < len(starts) else total_pages + 1
+        chapters.append((title, first_page, max(first_page, next_page - 1)))
+    return chapters
+
+
+def read_pdf_structure(pdf_file, password=None):
+    """Read a PDF's page count, outline and page labels without extracting any text.
+
+    Args:
+        pdf_file: The uploaded PDF file object
+        password: Optional password used to decrypt the PDF
+
+    Returns:
+        dict: "page_count", "chapters" from read_outline, "page_labels" from
+        read_page_labels, and "error" (None on success)
+    """
+    structure = {"page_count": 0, "chapters": [], "page_labels": None, "error": None}
+    try:
+        with open_spooled_pdf(pdf_file) as (stream, _):
+            reader, error = open_pdf_reader(stream, password)
+            if error:
+                structure["error"] = error
+                return structure
+            structure["page_count"] = len(reader.pages)
+            structure["chapters"] = read_outline(reader)
+            structure["page_labels"] = read_page_labels(reader)
+            return structure
+    except Exception as e:
+        structure["error"] = f"Error processing PDF: {str(e)}. Please try a different file."
+        return structure
+
+
+def extract_pdf(pdf_file, password=None, progress_callback=None, parallel=True, page_callback=None,
+                ocr=True, ocr_progress_callback=None, page_numbers=None):
+    """Extract text from a PDF with a single parse, falling back between strategies.
+
+    The document is parsed and decrypted once. A pre-scan of the content
+    streams finds pages with no text objects, which are reported and never
+    handed to an extractor. Every other page is extracted with PyPDF2's
+    standard extract_text; pages that come back empty are then retried on the
+    same page objects by reading raw text operators. Finally the images of
+    scanned pages are run through OCR, when it is enabled and available.
+
+    Args:
+        pdf_file: The uploaded PDF file object
+        password: Optional password used to decrypt the PDF
+        progress_callback: Optional function called with (current, total) as pages finish
+        parallel: Whether large documents may be extracted in worker processes
+        page_callback: Optional function called with (page_number, text) as each page streams in
+        ocr: Whether to OCR scanned pages
+        ocr_progress_callback: Optional function called with (current, total) as scanned pages are OCRed
+        page_numbers: Optional page numbers to extract; every other page is left
+            untouched and reported in "unextracted_pages"
+
+    Returns:
+        dict: "text", "pages" as (page_number, text) pairs for pages with text,
+        "strategy" that produced it, "page_count", the "ocr_pages" read by OCR,
+        the "image_pages" still without text, the "blank_pages" that were
+        skipped, the "unextracted_pages" outside page_numbers, and "error"
+        (None on success)
+    """
+    result = {
+        "text": "", "pages": [], "strategy": None, "page_count": 0, "ocr_pages": [],
+        "image_pages": [], "blank_pages": [], "unextracted_pages": [], "error": None
+    }
+    try:
+        with open_spooled_pdf(pdf_file) as (stream, pdf_path):
+            reader, error = open_pdf_reader(stream, password)
+            if error:
+                result["error"] = error
+                return result
+            result["page_count"] = len(reader.pages)
+            if page_numbers is None:
+                selected_pages = range(1, result["page_count"] + 1)
+            else:
+                selected_pages = sorted(n for n in set(page_numbers) if 1 <= n <= result["page_count"])
+                result["unextracted_pages"] = sorted(set(range(1, result["page_count"] + 1)) - set(selected_pages))
+                # Worker processes only pay off when enough pages were picked
+                parallel = parallel and should_extract_in_parallel(len(selected_pages))
+
+            # Pre-scan: pages without text objects are not worth extracting
+            page_kinds = {n: scan_page(reader.pages[n - 1]) for n in selected_pages}
+            result["image_pages"] = [n for n, kind in page_kinds.items() if kind == IMAGE_PAGE]
+            result["blank_pages"] = [n for n, kind in page_kinds.items() if kind == BLANK_PAGE]
+            skip_pages = set(result["image_pages"]) | set(result["blank_pages"]) | set(result["unextracted_pages"])
+
+            # Strategy 1: standard extraction of every page, consumed as a stream
+            total_pages = len(reader.pages)
+            page_texts = [""] * total_pages
+            page_stream = iter_page_texts(reader, stream, password, parallel, pdf_path, skip_pages)
+            for pages_done, (page_number, page_text) in enumerate(page_stream, 1):
+                page_texts[page_number - 1] = page_text
+                if page_callback:
+                    page_callback(page_number, page_text)
+                if progress_callback:
+                    progress_callback(pages_done, total_pages)
+            standard_pages = sum(1 for page_text in page_texts if page_text.strip())
+
+            # Strategy 2: raw text operators, reusing the already parsed pages
+            recovered_pages = 0
+            for i, page_text in enumerate(page_texts):
+                if not page_text.strip() and i + 1 not in skip_pages:
+                    raw_text = extract_page_text_raw(reader.pages[i])
+                    if raw_text:
+                        page_texts[i] = raw_text
+                        recovered_pages += 1
+
+            # Strategy 3: OCR the images of scanned pages, batched across the worker pool
+            if ocr and result["image_pages"]:
+                try:
+                    page_images = {n: get_page_images(reader.pages[n - 1]) for n in result["image_pages"]}
+                    pool = get_process_pool() if parallel and PARALLEL_WORKERS > 1 else None
+                    try:
+                        ocr_results = ocr_pages(page_images, pool, ocr_progress_callback)
+                    except BrokenProcessPool:
+                        reset_process_pool(pool)
+                        ocr_results = ocr_pages(page_images, None, ocr_progress_callback)
+                    for page_number, page_text in ocr_results.items():
+                        if page_text.strip():
+                            page_texts[page_number - 1] = page_text
+                            result["ocr_pages"].append(page_number)
+                except Exception as e:
+                    print(f"Error running OCR: {str(e)}")
+                result["ocr_pages"].sort()
+                result["image_pages"] = [n for n in result["image_pages"] if n not in result["ocr_pages"]]
+
+            strategies = []
+            if standard_pages:
+                strategies.append("standard")
+            if recovered_pages:
+                strategies.append("raw text operators")
+            if result["ocr_pages"]:
+                strategies.append("OCR")
+            result["strategy"] = " + ".join(strategies) or "standard"
+
+            result["pages"] = [
+                (page_number, page_text)
+                for page_number, page_text in enumerate(page_texts, 1)
+                if page_text.strip()
+            ]
+            if result["pages"]:
+                result["text"] = "\n\n".join(page_text for _, page_text in result["pages"])
+            else:
+                result["error"] = NO_TEXT_MESSAGE
+            return result
+    except Exception as e:
+        error_msg = str(e).lower()
+        if "not decrypt" in error_msg or "password" in error_msg or "encrypt" in error_msg:
+            result["error"] = "The PDF file is encrypted and cannot be processed. Please upload an unencrypted PDF."
+        else:
+            result["error"] = f"Error processing PDF: {str(e)}. Please try a different file."
+        return result
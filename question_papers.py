@@ -0,0 +1,509 @@
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+from disk_cache import CACHE_ROOT
+from document import Document
+from pdf_extraction import EXTRACTOR_VERSION, NO_TEXT_MESSAGE, extract_pdf
+
+# Directory holding the past question papers, one folder per subject or exam term
+QUESTION_PAPERS_DIR = os.getenv("QUESTION_PAPERS_DIR", "Question Papers")
+MANIFEST_PATH = os.path.join(CACHE_ROOT, "question_papers_manifest.json")
+# How long a listing is trusted before directory modification times are checked again
+MANIFEST_CHECK_SECONDS = float(os.getenv("QUESTION_PAPERS_CHECK_SECONDS", "5"))
+# Bump this whenever the manifest layout changes so old manifests are rebuilt
+MANIFEST_VERSION = 1
+# A paper whose extraction failed is not tried again for this long
+EXTRACTION_RETRY_SECONDS = 60
+
+# Folder naming used by the corpus: "4. DT" for subjects, "Nov 2024" for exam terms
+SUBJECT_FOLDER_PATTERN = re.compile(r"^\d+\.\s*\S")
+TERM_FOLDER_PATTERN = re.compile(
+    r"^(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{4}$", re.IGNORECASE
+)
+
+
+def hash_file(path):
+    """Return the SHA-256 of a file's contents, read in 1 MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_paper_name(relative_path):
+    """Build the display name of a paper from its path relative to the papers directory."""
+    return os.path.splitext(relative_path)[0].replace("\\", "/").replace("_", " ")
+
+
+def get_renamed_file_name(file_name, rename_pattern):
+    """Return the new name of a paper under a rename pattern, or the same name if it does not apply.
+
+    Args:
+        file_name: File name of the paper, e.g. "DT_Nov_2024.pdf"
+        rename_pattern: "subject_term_year", "term_year_subject" or "clean_spaces"
+    """
+    parts = file_name.replace('.pdf', '').split('_')
+    if rename_pattern == "subject_term_year":
+        # Expected format: Subject_May/Nov_YYYY.pdf
+        if len(parts) >= 3:
+            return f"{parts[0]}_{parts[1]}_{parts[2]}.pdf"
+    elif rename_pattern == "term_year_subject":
+        # Expected format: May/Nov_YYYY_Subject.pdf
+        if len(parts) >= 3:
+            return f"{parts[0]}_{parts[1]}_{parts[2]}.pdf"
+    elif rename_pattern == "clean_spaces":
+        return file_name.replace(' ', '_')
+    return file_name
+
+
+def plan_renames(manifest, rename_pattern):
+    """Work out every rename a pattern implies without touching any file.
+
+    Args:
+        manifest: PaperManifest listing the papers
+        rename_pattern: Pattern passed to get_renamed_file_name
+
+    Returns:
+        tuple: (list of (old relative path, new relative path) pairs, list of
+        collision messages); the plan must not be applied if there are collisions
+    """
+    manifest.refresh()
+    entries = manifest.papers().values()
+    renames = []
+    for entry in entries:
+        directory, file_name = os.path.split(entry["relative_path"])
+        new_name = get_renamed_file_name(file_name, rename_pattern)
+        if new_name != file_name:
+            renames.append((entry["relative_path"], f"{directory}/{new_name}" if directory else new_name))
+
+    # Compare case-insensitively, since two names that differ only in case collide on Windows and macOS
+    moving = {old.lower() for old, _ in renames}
+    targets = {}
+    errors = []
+    for old, new in renames:
+        key = new.lower()
+        if key in targets:
+            errors.append(f"{old} and {targets[key]} would both be renamed to {new}")
+        elif key not in moving and os.path.exists(os.path.join(manifest.root, new)):
+            errors.append(f"Cannot rename {old}: {new} already exists")
+        targets[key] = old
+    return renames, errors
+
+
+def apply_renames(root, renames):
+    """Rename papers as one batch, undoing every completed rename if any of them fails.
+
+    Files are first moved to temporary names and then to their targets, so
+    swaps and chains of renames cannot overwrite each other.
+
+    Args:
+        root: Directory holding the question papers
+        renames: (old relative path, new relative path) pairs from plan_renames
+
+    Returns:
+        list: Error messages; empty if every file was renamed
+    """
+    done = []
+    try:
+        for i, (old, new) in enumerate(renames):
+            old_path = os.path.join(root, old)
+            temp_path = os.path.join(os.path.dirname(old_path), f".renaming-{os.getpid()}-{i}.pdf")
+            os.rename(old_path, temp_path)
+            done.append((old_path, temp_path))
+        for i, (old, new) in enumerate(renames):
+            old_path, temp_path = done[i]
+            new_path = os.path.join(root, new)
+            # os.rename silently replaces an existing file on POSIX
+            if os.path.exists(new_path):
+                raise FileExistsError(f"{new} already exists")
+            os.rename(temp_path, new_path)
+            done[i] = (old_path, new_path)
+        return []
+    except OSError as e:
+        errors = [f"Error renaming question papers, no files were renamed: {str(e)}"]
+        for old_path, current_path in reversed(done):
+            try:
+                os.rename(current_path, old_path)
+            except OSError as rollback_error:
+                errors.append(f"Error restoring {old_path}: {str(rollback_error)}")
+        return errors
+
+
+def classify_folders(relative_path):
+    """Return the (subject, term) folders a paper sits in; either may be None."""
+    subject = term = None
+    for folder in os.path.dirname(relative_path).replace("\\", "/").split("/"):
+        if SUBJECT_FOLDER_PATTERN.match(folder):
+            subject = folder
+        elif TERM_FOLDER_PATTERN.match(folder):
+            term = folder
+    return subject, term
+
+
+class PaperManifest:
+    """Persistent index of the PDFs under the question papers directory.
+
+    Each entry records a paper's path, size, modification time, content hash
+    and the subject and term folders it sits in. The manifest is saved to disk
+    and kept current incrementally: only directories whose modification time
+    changed are listed again, and only files whose size or modification time
+    changed are hashed again. Between checks, listings are plain lookups.
+
+    A refresh scans copies of the entries and swaps them in when it is done,
+    so lookups are served from the current snapshot while it runs.
+    """
+
+    def __init__(self, root=QUESTION_PAPERS_DIR, path=MANIFEST_PATH):
+        """
+        Args:
+            root: Directory holding the question papers
+            path: File the manifest is persisted to
+        """
+        self.root = root
+        self.path = path
+        # Incremented whenever an entry is added, changed or removed
+        self.version = 0
+        self._papers = {}
+        self._directories = {}
+        self._by_name = {}
+        self._by_hash = {}
+        self._checked_at = 0.0
+        # Held for a whole refresh; _lock only guards reading and swapping the snapshot
+        self._refresh_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != MANIFEST_VERSION or data.get("root") != os.path.abspath(self.root):
+            return
+        self._papers = data.get("papers", {})
+        self._directories = data.get("directories", {})
+        self._reindex()
+
+    def _save(self):
+        data = {
+            "version": MANIFEST_VERSION,
+            "root": os.path.abspath(self.root),
+            "papers": self._papers,
+            "directories": self._directories,
+        }
+        # Write to a temporary file first so a crash never leaves a partial manifest
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error saving question paper manifest: {str(e)}")
+
+    def _reindex(self):
+        self._by_name = {entry["name"]: entry for entry in self._papers.values()}
+        self._by_hash = {}
+        for entry in self._papers.values():
+            self._by_hash.setdefault(entry["hash"], []).append(entry)
+
+    def _scan_directory(self, relative_dir, papers, changed):
+        """List one directory, updating its papers in papers and queueing new subdirectories."""
+        directory = os.path.join(self.root, relative_dir) if relative_dir else self.root
+        prefix = relative_dir + "/" if relative_dir else ""
+        seen = set()
+        subdirectories = []
+        with os.scandir(directory) as entries:
+            for dir_entry in entries:
+                relative_path = prefix + dir_entry.name
+                if dir_entry.is_dir():
+                    subdirectories.append(relative_path)
+                elif dir_entry.name.lower().endswith(".pdf") and dir_entry.is_file():
+                    seen.add(relative_path)
+                    stat = dir_entry.stat()
+                    entry = papers.get(relative_path)
+                    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                        continue
+                    subject, term = classify_folders(relative_path)
+                    papers[relative_path] = {
+                        "path": os.path.join(self.root, relative_path),
+                        "relative_path": relative_path,
+                        "name": get_paper_name(relative_path),
+                        "size": stat.st_size,
+                        "mtime_ns": stat.st_mtime_ns,
+                        "hash": hash_file(dir_entry.path),
+                        "subject": subject,
+                        "term": term,
+                    }
+                    changed.append(relative_path)
+
+        # Papers that disappeared from this directory
+        for relative_path in list(papers):
+            if os.path.dirname(relative_path) == relative_dir and relative_path not in seen:
+                del papers[relative_path]
+                changed.append(relative_path)
+        return subdirectories
+
+    def refresh(self, force=False):
+        """Bring the manifest up to date with the papers directory.
+
+        Args:
+            force: Rescan every directory even if its modification time is unchanged
+
+        Returns:
+            list: Relative paths of the papers that were added, changed or removed
+        """
+        with self._refresh_lock:
+            with self._lock:
+                papers = dict(self._papers)
+                directories = dict(self._directories)
+            changed = []
+            known = set(directories)
+            pending = [""]
+            visited = set()
+            while pending:
+                relative_dir = pending.pop()
+                directory = os.path.join(self.root, relative_dir) if relative_dir else self.root
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError:
+                    continue
+                visited.add(relative_dir)
+                if force or directories.get(relative_dir) != mtime_ns:
+                    try:
+                        subdirectories = self._scan_directory(relative_dir, papers, changed)
+                    except OSError as e:
+                        print(f"Error listing {directory}: {str(e)}")
+                        continue
+                    directories[relative_dir] = mtime_ns
+                else:
+                    subdirectories = [d for d in known if os.path.dirname(d) == relative_dir]
+                pending.extend(d for d in subdirectories if d not in visited)
+
+            # Directories that no longer exist take their papers with them
+            for relative_dir in known - visited:
+                del directories[relative_dir]
+            for relative_path in list(papers):
+                if os.path.dirname(relative_path) not in directories:
+                    del papers[relative_path]
+                    changed.append(relative_path)
+
+            with self._lock:
+                if changed or known != set(directories):
+                    self._papers = papers
+                    self._directories = directories
+                    self._reindex()
+                    self._save()
+                if changed:
+                    self.version += 1
+                self._checked_at = time.monotonic()
+            return changed
+
+    def rename_papers(self, renames):
+        """Move entries to their new paths after the files were renamed, keeping their hashes.
+
+        Args:
+            renames: (old relative path, new relative path) pairs that were applied
+        """
+        with self._refresh_lock, self._lock:
+            moved = []
+            for old, new in renames:
+                entry = self._papers.pop(old, None)
+                if entry is not None:
+                    moved.append((new, entry))
+            for new, entry in moved:
+                entry.update(path=os.path.join(self.root, new), relative_path=new, name=get_paper_name(new))
+                self._papers[new] = entry
+            # The renames changed the directories' modification times, not their papers
+            for relative_dir in {os.path.dirname(new) for _, new in renames}:
+                directory = os.path.join(self.root, relative_dir) if relative_dir else self.root
+                try:
+                    self._directories[relative_dir] = os.stat(directory).st_mtime_ns
+                except OSError:
+                    pass
+            self._reindex()
+            self._save()
+            self.version += 1
+
+    def refresh_if_stale(self, max_age=MANIFEST_CHECK_SECONDS):
+        """Refresh the manifest only if it was last checked more than max_age seconds ago.
+
+        Nothing is done before the first full refresh(), which may hash every
+        paper and belongs to a background warm-up, or while another refresh is
+        running; callers get the current snapshot instead of waiting.
+        """
+        if not self._checked_at or self._refresh_lock.locked():
+            return []
+        if time.monotonic() - self._checked_at > max_age:
+            return self.refresh()
+        return []
+
+    def papers(self):
+        """Return the manifest entries of every paper, keyed by display name."""
+        with self._lock:
+            return dict(self._by_name)
+
+    def paper_paths(self):
+        """Return the path of every paper keyed by display name, sorted by name."""
+        with self._lock:
+            return {name: self._by_name[name]["path"] for name in sorted(self._by_name)}
+
+    def get_by_name(self, name):
+        with self._lock:
+            return self._by_name.get(name)
+
+    def get_by_path(self, path):
+        """Return the entry for a paper's path, or None if it is not in the manifest."""
+        relative_path = os.path.relpath(path, self.root).replace("\\", "/")
+        with self._lock:
+            return self._papers.get(relative_path)
+
+    def get_by_hash(self, content_hash):
+        """Return the entries of every paper with the given content hash."""
+        with self._lock:
+            return list(self._by_hash.get(content_hash, []))
+
+
+class PaperCorpus:
+    """Extracted text of the question papers, memoised by path and content hash.
+
+    Documents are held in memory for every session of the process and also
+    cached on disk by content hash, so a restart or a renamed paper does not
+    extract it again. The whole corpus can be warmed up on a background thread.
+    """
+
+    def __init__(self, manifest, cache):
+        """
+        Args:
+            manifest: PaperManifest listing the papers
+            cache: DiskCache holding extracted pages by content hash
+        """
+        self.manifest = manifest
+        self.cache = cache
+        self.warm_done = 0
+        self.warm_total = 0
+        self._documents = {}
+        # Monotonic times of failed extractions, which are retried rather than memoised
+        self._failed = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._warm_thread = None
+        self._warmed_version = None
+
+    def _cache_key(self, entry):
+        return f"{entry['hash']}:{EXTRACTOR_VERSION}"
+
+    def get_document(self, entry):
+        """Return the extracted Document of a paper, extracting it only the first time.
+
+        Args:
+            entry: Manifest entry of the paper
+
+        Papers that fail to extract are not memoised; they are tried again
+        once EXTRACTION_RETRY_SECONDS have passed.
+
+        Returns:
+            Document: The paper's pages, or None if no text could be extracted
+        """
+        key = (entry["relative_path"], entry["hash"])
+        if key in self._documents:
+            return self._documents[key]
+        if time.monotonic() - self._failed.get(key, float("-inf")) < EXTRACTION_RETRY_SECONDS:
+            return None
+
+        # One lock per paper, so a request and the warm-up never extract the same file twice
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key in self._documents:
+                return self._documents[key]
+
+            document = None
+            cached = self.cache.get(self._cache_key(entry))
+            if cached is not None:
+                document = Document(entry["name"], cached["pages"], cached.get("image_pages", [])) if cached["pages"] else None
+            else:
+                with open(entry["path"], "rb") as f:
+                    result = extract_pdf(f)
+                if result["error"] and result["error"] != NO_TEXT_MESSAGE:
+                    print(f"Error extracting {entry['path']}: {result['error']}")
+                    self._failed[key] = time.monotonic()
+                    return None
+                self.cache.set(self._cache_key(entry), {
+                    "pages": [[page_number, page_text] for page_number, page_text in result["pages"]],
+                    "image_pages": result["image_pages"]
+                })
+                if result["pages"]:
+                    document = Document(entry["name"], result["pages"], result["image_pages"])
+            self._documents[key] = document
+            self._failed.pop(key, None)
+            return document
+
+    def rename_papers(self, renames):
+        """Keep memoised documents of renamed papers under their new paths."""
+        new_paths = dict(renames)
+        with self._lock:
+            for relative_path, content_hash in list(self._documents):
+                new = new_paths.get(relative_path)
+                if new is not None:
+                    document = self._documents.pop((relative_path, content_hash))
+                    if document is not None:
+                        document.name = get_paper_name(new)
+                    self._documents[(new, content_hash)] = document
+
+    def is_ready(self, entry):
+        """Return True if a paper's text can be served without extracting the PDF."""
+        key = (entry["relative_path"], entry["hash"])
+        return key in self._documents or self.cache.contains(self._cache_key(entry))
+
+    def get_text(self, entry):
+        """Return the extracted text of a paper, or "" if it has none."""
+        document = self.get_document(entry)
+        return document.text if document else ""
+
+    def warm_in_background(self):
+        """Start extracting every paper in the manifest on a background thread.
+
+        Does nothing if a warm-up is already running or the manifest has not
+        changed since the last one finished.
+
+        Returns:
+            bool: True if a warm-up was started
+        """
+        with self._lock:
+            if self._warm_thread is not None and self._warm_thread.is_alive():
+                return False
+            if self._warmed_version == self.manifest.version:
+                return False
+            self._warm_thread = threading.Thread(target=self._warm, name="paper-warmup", daemon=True)
+            self._warm_thread.start()
+            return True
+
+    @property
+    def warming(self):
+        return self._warm_thread is not None and self._warm_thread.is_alive()
+
+    def _warm(self):
+        version = self.manifest.version
+        entries = list(self.manifest.papers().values())
+        self.warm_done = 0
+        self.warm_total = len(entries)
+        failed = False
+        for entry in entries:
+            try:
+                self.get_document(entry)
+            except Exception as e:
+                print(f"Error warming up {entry['path']}: {str(e)}")
+                failed = True
+            failed = failed or (entry["relative_path"], entry["hash"]) in self._failed
+            self.warm_done += 1
+        # Papers that failed are retried by the next warm-up
+        if not failed:
+            self._warmed_version = version
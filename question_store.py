@@ -0,0 +1,504 @@
+import os
+import re
+import sqlite3
+import threading
+
+from disk_cache import CACHE_ROOT
+from near_duplicates import cluster_signatures, minhash_signature, signature_from_bytes
+
+QUESTION_STORE_PATH = os.path.join(CACHE_ROOT, "questions.sqlite3")
+# Bump this whenever segmentation output changes so papers are segmented again
+SEGMENTER_VERSION = 2
+
+# Question types, matching the types offered by the question generator
+MCQ = "MCQ"
+SHORT_ANSWER = "Short Answer"
+CASE_BASED = "Case Based Application"
+NUMERICAL = "Numerical Calculation"
+
+# "Question 3", "Question No. 3", "प्रश्न 3" or "CASE STUDY - 3" on a line of its own
+QUESTION_HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?:question|प्रश्न|case[ \t]*study)[ \t]*(?:no\.?)?[ \t]*[-–:.]?[ \t]*(\d{1,2})[ \t]*$",
+    re.IGNORECASE | re.MULTILINE
+)
+# "Answer", "Answers to Case Study 2" or "उत्तर" on a short line of its own starts the suggested answer
+ANSWER_HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?:alternat(?:e|ive)[ \t]+)?(?:answer[ \t]?s?|solution)"
+    r"(?:[ \t]+(?:to|of)[ \t]+(?:case[ \t]*study|question|mcqs?)[^\n]{0,20})?[ \t]*:?[ \t]*$"
+    r"|^[^\n]{0,30}उत्तर[ \t]*:?[ \t]*$",
+    re.IGNORECASE
+)
+# "(a)" or "(क)" at the start of a line
+SUB_PART_PATTERN = re.compile(r"^[ \t]*\(([a-h]|[कखगघङचछज])\)")
+SUB_PART_SEQUENCES = ("abcdefgh", "कखगघङचछज")
+MARKS_PATTERN = re.compile(r"\(\s*(\d{1,2})\s*(?:marks?|अंक|अांक)\s*\)", re.IGNORECASE)
+MCQ_OPTION_PATTERN = re.compile(r"^[ \t]*\(?([a-dA-D])\)[ \t]", re.MULTILINE)
+# Numbered MCQ items inside a case study: "1.2 Which of the following ..."
+MCQ_ITEM_PATTERN = re.compile(r"^[ \t]*(\d{1,2}\.\d{1,2})\.?[ \t]")
+MCQ_CUE_PATTERN = re.compile(r"which of the following|correct (?:option|answer|statement)|choose|MCQ", re.IGNORECASE)
+# Questions with options but no MCQ wording are only MCQs when this short
+MCQ_MAX_CHARS = 1200
+NUMBER_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?")
+CALCULATION_PATTERN = re.compile(
+    r"\b(?:compute|calculate|determine|prepare|pass|ascertain|find|work out|evaluate)\b", re.IGNORECASE
+)
+# "EXAMINATION: DECEMBER, 2021" in a page header, matched with all whitespace removed
+EXAM_TERM_PATTERN = re.compile(
+    r"EXAMINATION:?(JANUARY|FEBRUARY|MARCH|APRIL|MAY|JUNE|JULY|AUGUST|SEPTEMBER|OCTOBER|NOVEMBER|DECEMBER),?(\d{4})"
+)
+# Questions longer than this are treated as case studies
+CASE_MIN_CHARS = 1500
+# Columns returned by queries; the stored MinHash signature is left out
+QUESTION_COLUMNS = (
+    "id, relative_path, paper_hash, subject, term, question_number, part, marks, "
+    "question_type, page, text, answer, cluster_id"
+)
+
+
+def classify_question(text, subject=None):
+    """Guess the type of a past-paper question from its text.
+
+    Returns:
+        str: MCQ, CASE_BASED, NUMERICAL or SHORT_ANSWER
+    """
+    # Options (a) to (d) on lines of their own, not counting the part's own label
+    body = text.split("\n", 1)[1] if "\n" in text else ""
+    options = set(MCQ_OPTION_PATTERN.findall(body))
+    if (options >= set("abcd") or options >= set("ABCD")) and (
+            len(text) < MCQ_MAX_CHARS or MCQ_CUE_PATTERN.search(text)):
+        return MCQ
+    if (subject and "IBS" in subject) or len(text) >= CASE_MIN_CHARS:
+        return CASE_BASED
+    if len(NUMBER_PATTERN.findall(text)) >= 6 and CALCULATION_PATTERN.search(text):
+        return NUMERICAL
+    return SHORT_ANSWER
+
+
+def detect_exam_term(document):
+    """Read the exam term, e.g. "Dec 2021", from the page headers of a paper."""
+    for page in document.pages():
+        match = EXAM_TERM_PATTERN.search(re.sub(r"\s+", "", page.text).upper())
+        if match:
+            return f"{match.group(1)[:3].title()} {match.group(2)}"
+        if page.number >= 3:
+            break
+    return None
+
+
+def _split_parts(lines):
+    """Split the lines of one question into sub-parts.
+
+    A new sub-part starts at the next expected label, "(b)" after "(a)", when
+    the previous part's answer has begun or its question text already ends in
+    marks, and "(a)" only starts the first part straight after the heading;
+    options of an MCQ therefore stay inside their question.
+
+    Returns:
+        list: [label, question_lines, answer_lines] for each part; the first
+        part's label is None when the question does not start with "(a)"
+    """
+    parts = [[None, [], []]]
+    sequence = None
+    expected = 0
+    in_answer = False
+    for offset, line in lines:
+        match = SUB_PART_PATTERN.match(line)
+        if match:
+            label = match.group(1)
+            if sequence is None:
+                sequence = next((s for s in SUB_PART_SEQUENCES if s[0] == label), None)
+            current = parts[-1]
+            starts_part = (
+                sequence is not None and expected < len(sequence) and label == sequence[expected]
+                and (in_answer or MARKS_PATTERN.search(" ".join(l for _, l in current[1]))
+                     or (current[0] is None and not any(l.strip() for _, l in current[1])))
+            )
+            if starts_part:
+                if current[0] is None and not any(l.strip() for _, l in current[1] + current[2]):
+                    parts.pop()
+                parts.append([label, [], []])
+                expected += 1
+                in_answer = False
+        if ANSWER_HEADING_PATTERN.match(line):
+            in_answer = True
+            continue
+        parts[-1][2 if in_answer else 1].append((offset, line))
+    return parts
+
+
+def _split_mcq_items(lines):
+    """Split numbered MCQ items ("1.1", "1.2", ...) out of a case study's lines.
+
+    Returns:
+        list: [item_label, lines] pairs; a single [None, lines] pair when the
+        lines hold no MCQ items
+    """
+    items = [[None, []]]
+    for offset, line in lines:
+        match = MCQ_ITEM_PATTERN.match(line)
+        if match:
+            items.append([match.group(1), []])
+        items[-1][1].append((offset, line))
+    has_mcq = any(
+        label is not None and classify_question("\n".join(line for _, line in item_lines)) == MCQ
+        for label, item_lines in items
+    )
+    if not has_mcq:
+        return [[None, lines]]
+    return [item for item in items if item[0] is not None or any(line.strip() for _, line in item[1])]
+
+
+def segment_paper(document, subject=None, term=None):
+    """Split a past paper into individual question records.
+
+    Args:
+        document: Document holding the paper's pages
+        subject: Subject folder of the paper, e.g. "4. DT"
+        term: Exam term of the paper; read from the page headers when None
+
+    Returns:
+        list: One dict per question or sub-part with "question_number",
+        "part", "marks", "question_type", "page", "text" and "answer"
+    """
+    text = document.text
+    term = term or detect_exam_term(document)
+    headings = []
+    for match in QUESTION_HEADING_PATTERN.finditer(text):
+        number = int(match.group(1))
+        # Running headers and cross-references repeat earlier numbers; keep the sequence increasing
+        if not headings or number > headings[-1][0]:
+            headings.append((number, match.start(), match.end()))
+
+    records = []
+    for i, (number, _, start) in enumerate(headings):
+        end = headings[i + 1][1] if i + 1 < len(headings) else len(text)
+        lines = []
+        offset = start
+        for line in text[start:end].split("\n"):
+            lines.append((offset, line))
+            offset += len(line) + 1
+
+        for label, question_lines, answer_lines in _split_parts(lines):
+            for item_label, item_lines in _split_mcq_items(question_lines):
+                question_text = "\n".join(line for _, line in item_lines).strip()
+                if not question_text:
+                    continue
+                if item_label is not None:
+                    part = f"{label} {item_label}" if label else item_label
+                    question_type = classify_question(question_text)
+                    answer = ""
+                else:
+                    part = label
+                    question_type = classify_question(question_text, subject)
+                    answer = "\n".join(line for _, line in answer_lines).strip()
+                marks = [int(m) for m in MARKS_PATTERN.findall(question_text)]
+                page = document.page_at_offset(item_lines[0][0])
+                records.append({
+                    "question_number": number,
+                    "part": part,
+                    "marks": sum(marks) if marks else None,
+                    "question_type": question_type,
+                    "page": page.number if page else None,
+                    "text": question_text,
+                    "answer": answer,
+                    "subject": subject,
+                    "term": term,
+                })
+    return records
+
+
+class QuestionStore:
+    """Local SQLite store of individual past-paper questions.
+
+    Papers are segmented once per content hash and segmenter version; the
+    questions table is indexed by subject, term and question type so callers
+    can query questions directly instead of re-parsing PDFs. Questions that
+    repeat across papers, or appear in both the English and Hindi version of
+    a paper, share a near-duplicate cluster id.
+    """
+
+    def __init__(self, path=QUESTION_STORE_PATH):
+        """
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        # Incremented whenever papers are added, changed or removed
+        self.version = 0
+        self.sync_done = 0
+        self.sync_total = 0
+        self._lock = threading.Lock()
+        self._sync_thread = None
+        self._synced_version = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS papers (
+                    relative_path TEXT PRIMARY KEY,
+                    paper_hash TEXT NOT NULL,
+                    subject TEXT,
+                    term TEXT,
+                    segmenter_version INTEGER NOT NULL,
+                    question_count INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY,
+                    relative_path TEXT NOT NULL REFERENCES papers(relative_path) ON DELETE CASCADE,
+                    paper_hash TEXT NOT NULL,
+                    subject TEXT,
+                    term TEXT,
+                    question_number INTEGER NOT NULL,
+                    part TEXT,
+                    marks INTEGER,
+                    question_type TEXT NOT NULL,
+                    page INTEGER,
+                    text TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    signature BLOB,
+                    cluster_id INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_questions_subject ON questions(subject);
+                CREATE INDEX IF NOT EXISTS idx_questions_term ON questions(term);
+                CREATE INDEX IF NOT EXISTS idx_questions_type ON questions(question_type);
+                CREATE INDEX IF NOT EXISTS idx_questions_paper ON questions(relative_path);
+            """)
+            # Stores created before near-duplicate detection lack these columns
+            columns = {row["name"] for row in self._connection.execute("PRAGMA table_info(questions)")}
+            for column, column_type in (("signature", "BLOB"), ("cluster_id", "INTEGER")):
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE questions ADD COLUMN {column} {column_type}")
+
+    def replace_paper(self, entry, records, term=None):
+        """Store the questions of one paper, replacing any it had before.
+
+        Args:
+            entry: Manifest entry of the paper
+            records: Question records from segment_paper
+            term: Exam term of the paper if it differs from the manifest's
+        """
+        signatures = [minhash_signature(record["text"]) for record in records]
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM questions WHERE relative_path = ?", (entry["relative_path"],))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?, ?, ?)",
+                (entry["relative_path"], entry["hash"], entry["subject"], term or entry["term"],
+                 SEGMENTER_VERSION, len(records))
+            )
+            self._connection.executemany(
+                """INSERT INTO questions (relative_path, paper_hash, subject, term, question_number, part,
+                                          marks, question_type, page, text, answer, signature)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [
+                    (entry["relative_path"], entry["hash"], record["subject"], record["term"],
+                     record["question_number"], record["part"], record["marks"], record["question_type"],
+                     record["page"], record["text"], record["answer"],
+                     signature.tobytes() if signature is not None else None)
+                    for record, signature in zip(records, signatures)
+                ]
+            )
+            self.version += 1
+
+    def remove_papers(self, relative_paths):
+        """Remove papers and their questions from the store."""
+        with self._lock, self._connection:
+            for relative_path in relative_paths:
+                self._connection.execute("DELETE FROM questions WHERE relative_path = ?", (relative_path,))
+                self._connection.execute("DELETE FROM papers WHERE relative_path = ?", (relative_path,))
+            if relative_paths:
+                self.version += 1
+
+    def rename_papers(self, renames):
+        """Move stored papers and their questions to new paths without segmenting them again.
+
+        Args:
+            renames: (old relative path, new relative path) pairs
+        """
+        with self._lock, self._connection:
+            # Through temporary paths first, so swapped names never clash
+            steps = [(old, "\0" + old) for old, _ in renames] + [("\0" + old, new) for old, new in renames]
+            for source, target in steps:
+                self._connection.execute("UPDATE papers SET relative_path = ? WHERE relative_path = ?", (target, source))
+                self._connection.execute("UPDATE questions SET relative_path = ? WHERE relative_path = ?", (target, source))
+            if renames:
+                self.version += 1
+
+    def sync(self, manifest, corpus, progress_callback=None):
+        """Segment every paper in the manifest that is new or changed, and drop removed ones.
+
+        Args:
+            manifest: PaperManifest listing the papers
+            corpus: PaperCorpus providing each paper's extracted Document
+            progress_callback: Optional function called with (current, total) as papers finish
+
+        Returns:
+            int: Number of papers segmented
+        """
+        entries = list(manifest.papers().values())
+        with self._lock:
+            stored = {
+                row["relative_path"]: (row["paper_hash"], row["segmenter_version"])
+                for row in self._connection.execute("SELECT relative_path, paper_hash, segmenter_version FROM papers")
+            }
+
+        segmented = 0
+        for i, entry in enumerate(entries, 1):
+            if stored.get(entry["relative_path"]) != (entry["hash"], SEGMENTER_VERSION):
+                document = corpus.get_document(entry)
+                records = []
+                term = entry["term"]
+                if document:
+                    term = term or detect_exam_term(document)
+                    records = segment_paper(document, entry["subject"], term)
+                self.replace_paper(entry, records, term)
+                segmented += 1
+            if progress_callback:
+                progress_callback(i, len(entries))
+
+        current_paths = {entry["relative_path"] for entry in entries}
+        removed = [path for path in stored if path not in current_paths]
+        self.remove_papers(removed)
+        if segmented or removed:
+            self.update_clusters()
+        return segmented
+
+    def update_clusters(self):
+        """Group near-duplicate questions across all papers and store each one's cluster id.
+
+        Every question in a cluster gets the id of the cluster's first
+        question; a question without duplicates is its own cluster.
+
+        Returns:
+            int: Number of clusters holding more than one question
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, signature FROM questions WHERE signature IS NOT NULL"
+            ).fetchall()
+        clusters = cluster_signatures({row["id"]: signature_from_bytes(row["signature"]) for row in rows})
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE questions SET cluster_id = id")
+            self._connection.executemany(
+                "UPDATE questions SET cluster_id = ? WHERE id = ?",
+                [(cluster_id, question_id) for question_id, cluster_id in clusters.items() if cluster_id != question_id]
+            )
+            self.version += 1
+        return len({cluster_id for question_id, cluster_id in clusters.items() if cluster_id != question_id})
+
+    def sync_in_background(self, manifest, corpus):
+        """Run sync on a background thread unless one is running or the manifest is unchanged.
+
+        Returns:
+            bool: True if a sync was started
+        """
+        with self._lock:
+            if self._sync_thread is not None and self._sync_thread.is_alive():
+                return False
+            if self._synced_version == manifest.version:
+                return False
+            self._sync_thread = threading.Thread(
+                target=self._sync, args=(manifest, corpus), name="question-segmentation", daemon=True
+            )
+            self._sync_thread.start()
+            return True
+
+    @property
+    def syncing(self):
+        return self._sync_thread is not None and self._sync_thread.is_alive()
+
+    def _sync(self, manifest, corpus):
+        version = manifest.version
+
+        def update_progress(current, total):
+            self.sync_done = current
+            self.sync_total = total
+
+        try:
+            self.sync(manifest, corpus, update_progress)
+            self._synced_version = version
+        except Exception as e:
+            print(f"Error segmenting question papers: {str(e)}")
+
+    def query(self, subject=None, term=None, question_type=None, relative_paths=None, limit=None):
+        """Return stored questions matching every filter that is given.
+
+        Args:
+            subject: Subject folder, e.g. "4. DT"
+            term: Exam term, e.g. "Nov 2024"
+            question_type: One of MCQ, SHORT_ANSWER, CASE_BASED, NUMERICAL
+            relative_paths: Only questions from these papers
+            limit: Maximum number of questions to return
+
+        Returns:
+            list: Question dicts in paper and question order
+        """
+        conditions = []
+        params = []
+        for column, value in (("subject", subject), ("term", term), ("question_type", question_type)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if relative_paths is not None:
+            relative_paths = list(relative_paths)
+            if not relative_paths:
+                return []
+            conditions.append(f"relative_path IN ({', '.join('?' * len(relative_paths))})")
+            params.extend(relative_paths)
+
+        sql = f"SELECT {QUESTION_COLUMNS} FROM questions"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY relative_path, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            return [dict(row) for row in self._connection.execute(sql, params)]
+
+    def papers(self):
+        """Return the stored papers keyed by relative path, with their hash and segmenter version."""
+        with self._lock:
+            return {
+                row["relative_path"]: dict(row)
+                for row in self._connection.execute("SELECT * FROM papers")
+            }
+
+    def clusters(self):
+        """Return the near-duplicate cluster id of every stored question, keyed by question id."""
+        with self._lock:
+            return {row[0]: row[1] for row in self._connection.execute("SELECT id, cluster_id FROM questions")}
+
+    def count(self, relative_paths=None):
+        """Return how many questions are stored, optionally only for some papers."""
+        sql = "SELECT COUNT(*) FROM questions"
+        params = []
+        if relative_paths is not None:
+            params = list(relative_paths)
+            sql += f" WHERE relative_path IN ({', '.join('?' * len(params))})"
+        with self._lock:
+            return self._connection.execute(sql, params).fetchone()[0]
+
+    def distinct(self, column):
+        """Return the distinct non-empty values of subject, term or question_type."""
+        if column not in ("subject", "term", "question_type"):
+            raise ValueError(f"Unknown question column: {column}")
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT DISTINCT {column} FROM questions WHERE {column} IS NOT NULL ORDER BY {column}"
+            )
+            return [row[0] for row in rows]
+
+
+if __name__ == "__main__":
+    # Offline build: python question_store.py
+    from disk_cache import DiskCache
+    from question_papers import PaperCorpus, PaperManifest
+
+    manifest = PaperManifest()
+    manifest.refresh()
+    store = QuestionStore()
+    corpus = PaperCorpus(manifest, DiskCache("paper_text", int(os.getenv("PDF_TEXT_CACHE_MAX_MB", "512")) * 1024 * 1024))
+    segmented = store.sync(manifest, corpus, lambda current, total: print(f"Segmented {current}/{total} papers", end="\r"))
+    print(f"\nSegmented {segmented} papers; {store.count()} questions stored in {store.path}")
@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import hashlib
+
+from disk_cache import DiskCache
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_MB", "64")) * 1024 * 1024
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_HOURS", "168")) * 3600
+# Request options that change how a call is made, not what it returns
+TRANSPORT_SETTINGS = ("timeout", "request_options")
+
+
+def normalize_prompt(text):
+    """Normalise line endings and trailing whitespace, which do not change the model's answer."""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(line.rstrip() for line in lines)).strip()
+
+
+def _normalize_contents(contents):
+    """Return a JSON-serialisable form of generate_content contents, with inline data replaced by its hash."""
+    if isinstance(contents, str):
+        return normalize_prompt(contents)
+    if isinstance(contents, (list, tuple)):
+        return [_normalize_contents(part) for part in contents]
+    if isinstance(contents, dict):
+        normalized = {}
+        for key, value in contents.items():
+            if key == "data":
+                data = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+                normalized[key] = hashlib.sha256(data).hexdigest()
+            else:
+                normalized[key] = _normalize_contents(value)
+        return normalized
+    if isinstance(contents, (int, float, bool)) or contents is None:
+        return contents
+    return repr(contents)
+
+
+class CachedResponse:
+    """Stands in for a generate_content response served from the cache."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class ResponseCache(DiskCache):
+    """Disk cache of model responses with a TTL, keyed by model, prompt and generation settings.
+
+    Like every DiskCache it is size-bounded with least-recently-used
+    eviction and shared by all sessions using the same cache directory.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS):
+        super().__init__("responses", max_bytes, ttl_seconds)
+
+    @staticmethod
+    def make_key(model_name, contents, settings):
+        """Build the cache key of a generate_content call.
+
+        Args:
+            model_name: Name of the model answering the call
+            contents: Prompt text, or a list of prompt parts
+            settings: Keyword arguments of the call, such as generation_config
+
+        Returns:
+            str: Key combining the model name, the prompt hash and the settings
+        """
+        prompt = json.dumps(_normalize_contents(contents), ensure_ascii=False, sort_keys=True)
+        settings = {key: value for key, value in settings.items() if key not in TRANSPORT_SETTINGS}
+        settings = json.dumps(_normalize_contents(settings), sort_keys=True)
+        return f"{model_name}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}:{settings}"
+
+
+class CachedModel:
+    """Wraps a model so repeated generate_content calls are answered from a ResponseCache.
+
+    With bypass set, every call goes to the model, and its response replaces
+    the cached one, so regenerating also refreshes the cache. Streamed calls
+    share the cache with unstreamed ones; raw stream=True calls are never
+    cached.
+    """
+
+    def __init__(self, model, cache, bypass=False):
+        """
+        Args:
+            model: LLMGateway that answers cache misses
+            cache: ResponseCache shared by all sessions
+            bypass: Skip cache lookups, e.g. when the user asked to regenerate
+        """
+        self.model = model
+        self.cache = cache
+        self.bypass = bypass
+
+    @property
+    def model_name(self):
+        return self.model.model_name
+
+    def generate_content(self, contents, **kwargs):
+        """Return the cached response for this call, or call the model and cache its text."""
+        if kwargs.get("stream"):
+            return self.model.generate_content(contents, **kwargs)
+        key = self.cache.make_key(self.model_name, contents, kwargs)
+        if not self.bypass:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return CachedResponse(cached["text"])
+
+        response = self.model.generate_content(contents, **kwargs)
+        try:
+            text = response.text
+        except ValueError:
+            # Blocked or empty responses have no text; the caller handles them as before
+            return response
+        if text:
+            self.cache.set(key, {"text": text})
+        return response
+
+    def stream_content(self, contents, **kwargs):
+        """Yield the response text as it arrives, or all at once from the cache.
+
+        The full text is cached once the stream finishes without an error.
+        """
+        key = self.cache.make_key(self.model_name, contents, kwargs)
+        if not self.bypass:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached["text"]
+                return
+
+        chunks = []
+        for text in self.model.stream_content(contents, **kwargs):
+            chunks.append(text)
+            yield text
+        if chunks:
+            self.cache.set(key, {"text": "".join(chunks)})
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
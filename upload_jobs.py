@@ -0,0 +1,95 @@
+import threading
+
+from document import Document
+from pdf_extraction import extract_pdf
+
+
+class UploadJob:
+    """Extraction of one uploaded PDF running on a background thread.
+
+    The job holds a reference to the upload rather than a copy of its bytes,
+    so it keeps running after the script run that submitted it has finished. Progress and the pages
+    extracted so far are updated from the worker thread and can be read at any
+    time to render progress or study a partial document.
+    """
+
+    def __init__(self, name, pdf_file, cache_key, password=None, parallel=True, ocr=True, page_numbers=None):
+        """
+        Args:
+            name: Name of the uploaded file
+            pdf_file: The uploaded PDF file object; it is only read through its buffer
+            cache_key: Key the finished pages are cached under, or None to skip caching
+            password: Optional password used to decrypt the PDF
+            parallel: Whether large documents may be extracted in worker processes
+            ocr: Whether to OCR scanned pages
+            page_numbers: Optional page numbers to extract instead of the whole document
+        """
+        self.name = name
+        self.cache_key = cache_key
+        self.page_numbers = page_numbers
+        self.progress = 0.0
+        self.status = "Waiting to start"
+        self.result = None
+        self.future = None
+        self._pdf_file = pdf_file
+        self._password = password
+        self._parallel = parallel
+        self._ocr = ocr
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def start(self, executor):
+        """Submit the job to an executor and return it."""
+        self.future = executor.submit(self.run)
+        return self
+
+    def run(self):
+        """Extract the PDF; runs on a worker thread."""
+        self.status = "Extracting"
+        try:
+            self.result = extract_pdf(
+                self._pdf_file,
+                password=self._password,
+                progress_callback=self._update_progress,
+                parallel=self._parallel,
+                page_callback=self._add_page,
+                ocr=self._ocr,
+                ocr_progress_callback=self._update_ocr_progress,
+                page_numbers=self.page_numbers
+            )
+        except Exception as e:
+            self.result = {"error": f"Error processing PDF: {str(e)}. Please try a different file."}
+        finally:
+            # The upload is no longer needed once the pages are extracted
+            self._pdf_file = None
+        self.progress = 1.0
+        self.status = "Failed" if self.result.get("error") else "Done"
+        return self.result
+
+    @property
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    @property
+    def pages_extracted(self):
+        with self._lock:
+            return len(self._pages)
+
+    def partial_document(self):
+        """Return the pages extracted so far as a Document."""
+        with self._lock:
+            pages = sorted(self._pages.items())
+        return Document(self.name, pages)
+
+    def _add_page(self, page_number, page_text):
+        if page_text.strip():
+            with self._lock:
+                self._pages[page_number] = page_text
+
+    def _update_progress(self, current, total):
+        self.progress = current / total
+        self.status = f"Extracting page {current}/{total}"
+
+    def _update_ocr_progress(self, current, total):
+        self.progress = current / total
+        self.status = f"Running OCR on scanned page {current}/{total}"